@@ -0,0 +1,143 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Tuple
+from urllib.parse import parse_qsl
+from fastapi import Header, HTTPException
+from app.core.config import settings
+
+# Mini App authentication. The client proves who it is once with Telegram's
+# signed initData ("Authorization: tma <initData>"), gets a short-lived session
+# token from POST /api/auth/session, and sends "Authorization: Bearer <token>"
+# after that. Both are HMACs keyed off BOT_TOKEN, so every worker and replica
+# can check them without shared state.
+
+@dataclass(frozen=True)
+class WebAppUser:
+    id: int
+    first_name: str = ""
+    username: Optional[str] = None
+
+class AuthError(Exception):
+    pass
+
+@lru_cache(maxsize=4)
+def _keys(bot_token: str) -> Tuple[bytes, bytes]:
+    """(initData key, session key), derived once per bot token."""
+    # Telegram's spec: secret_key = HMAC_SHA256(key="WebAppData", msg=bot_token)
+    init_data_key = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    session_key = hmac.new(b"SessionToken", bot_token.encode(), hashlib.sha256).digest()
+    return init_data_key, session_key
+
+def _bot_keys() -> Tuple[bytes, bytes]:
+    if not settings.BOT_TOKEN:
+        raise AuthError("Telegram authorization is not configured")
+    return _keys(settings.BOT_TOKEN)
+
+def verify_init_data(init_data: str, now: Optional[float] = None) -> Tuple[WebAppUser, float]:
+    """Check a Mini App initData string; returns the user and when the data stops being accepted."""
+    now = time.time() if now is None else now
+    try:
+        fields = dict(parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+    except ValueError:
+        raise AuthError("Malformed initData")
+    received = fields.pop("hash", "")
+    data_check_string = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    expected = hmac.new(_bot_keys()[0], data_check_string.encode(), hashlib.sha256).hexdigest()
+    # Bytes, since compare_digest rejects non-ASCII str and the hash comes from the client
+    if not hmac.compare_digest(expected.encode(), received.encode()):
+        raise AuthError("Invalid initData signature")
+
+    try:
+        expires = int(fields["auth_date"]) + settings.INIT_DATA_MAX_AGE_SECONDS
+        user = json.loads(fields["user"])
+        verified = WebAppUser(id=int(user["id"]), first_name=user.get("first_name") or "", username=user.get("username"))
+    except (KeyError, ValueError, TypeError):
+        raise AuthError("initData has no user")
+    if expires <= now:
+        raise AuthError("initData has expired")
+    return verified, expires
+
+class VerifiedInitData:
+    """LRU of initData -> verified user, so a client resending the same initData isn't re-hashed.
+
+    Entries live for `ttl` seconds, and never past the initData's own expiry.
+    """
+
+    def __init__(self, max_entries: int = 4096, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[WebAppUser, float]]" = OrderedDict()
+
+    def verify(self, init_data: str) -> WebAppUser:
+        now = time.time()
+        entry = self._entries.get(init_data)
+        if entry is not None and entry[1] > now:
+            self._entries.move_to_end(init_data)
+            return entry[0]
+
+        user, expires = verify_init_data(init_data, now)
+        self._entries[init_data] = (user, min(expires, now + self.ttl))
+        self._entries.move_to_end(init_data)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return user
+
+verified_init_data = VerifiedInitData()
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _unb64(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def issue_session(user: WebAppUser, now: Optional[float] = None) -> Tuple[str, int]:
+    """Signed "<payload>.<signature>" token for `user`; returns it with its lifetime in seconds."""
+    now = time.time() if now is None else now
+    ttl = settings.SESSION_TTL_SECONDS
+    claims = {"id": user.id, "fn": user.first_name, "un": user.username, "exp": int(now) + ttl}
+    payload = _b64(json.dumps(claims, separators=(",", ":"), ensure_ascii=False).encode())
+    signature = _b64(hmac.new(_bot_keys()[1], payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{signature}", ttl
+
+def verify_session(token: str, now: Optional[float] = None) -> WebAppUser:
+    now = time.time() if now is None else now
+    payload, _, signature = token.partition(".")
+    expected = _b64(hmac.new(_bot_keys()[1], payload.encode(), hashlib.sha256).digest())
+    if not hmac.compare_digest(expected.encode(), signature.encode()):
+        raise AuthError("Invalid session token")
+    claims = json.loads(_unb64(payload))
+    if claims["exp"] <= now:
+        raise AuthError("Session token has expired")
+    return WebAppUser(id=claims["id"], first_name=claims["fn"], username=claims["un"])
+
+def _unauthorized(detail: str) -> HTTPException:
+    return HTTPException(status_code=401, detail=detail, headers={"WWW-Authenticate": "Bearer"})
+
+# async so FastAPI runs them inline instead of in its threadpool; neither does I/O
+
+async def current_user(authorization: Optional[str] = Header(default=None)) -> WebAppUser:
+    """The Mini App user behind a request, from a session token or raw initData."""
+    scheme, _, credentials = (authorization or "").partition(" ")
+    try:
+        if scheme.lower() == "bearer":
+            return verify_session(credentials)
+        if scheme.lower() == "tma":
+            return verified_init_data.verify(credentials)
+    except AuthError as e:
+        raise _unauthorized(str(e))
+    raise _unauthorized("Telegram authorization required")
+
+async def optional_user(authorization: Optional[str] = Header(default=None)) -> Optional[WebAppUser]:
+    if not authorization:
+        return None
+    return await current_user(authorization)
+
+def require_self(user: WebAppUser, telegram_id: int):
+    if user.id != telegram_id:
+        raise HTTPException(status_code=403, detail="Forbidden")
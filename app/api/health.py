@@ -0,0 +1,62 @@
+import logging
+import time
+from typing import Awaitable, Dict, Set
+from fastapi import APIRouter, Request
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger("app.startup")
+
+class Readiness:
+    """Startup steps still running in the background; /ready answers 503 until they finish.
+
+    Non-gating steps are reported the same way but never hold readiness back.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.pending: Set[str] = set()
+        self.failed: Dict[str, str] = {}
+        self.timings: Dict[str, float] = {}
+        self.non_gating: Set[str] = set()
+
+    @property
+    def ready(self) -> bool:
+        return not (self.pending - self.non_gating) and not (self.failed.keys() - self.non_gating)
+
+    def expect(self, *steps: str, gating: bool = True):
+        self.pending.update(steps)
+        if not gating:
+            self.non_gating.update(steps)
+
+    async def track(self, step: str, awaitable: Awaitable, gating: bool = True):
+        """Run one startup step, recording when it finished or why it failed."""
+        self.expect(step, gating=gating)
+        try:
+            await awaitable
+        except Exception as e:
+            self.failed[step] = f"{type(e).__name__}: {e}"
+            logger.exception("Startup step %s failed", step)
+        else:
+            self.timings[step] = time.perf_counter() - self.started
+            logger.info("Startup step %s ready after %.0fms", step, self.timings[step] * 1000)
+        finally:
+            self.pending.discard(step)
+
+router = APIRouter(include_in_schema=False)
+
+@router.get("/health")
+async def health():
+    # Liveness: the process is up and serving; says nothing about dependencies
+    return {"status": "ok"}
+
+@router.get("/ready")
+async def ready(request: Request):
+    readiness: Readiness = request.app.state.readiness
+    body = {
+        "ready": readiness.ready,
+        "pending": sorted(readiness.pending),
+        "failed": readiness.failed,
+        "non_gating": sorted(readiness.non_gating),
+        "timings": {step: round(seconds, 3) for step, seconds in readiness.timings.items()},
+    }
+    return JSONResponse(body, status_code=200 if readiness.ready else 503)
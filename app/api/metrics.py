@@ -0,0 +1,65 @@
+import hmac
+import time
+from typing import Optional
+from fastapi import APIRouter, Header, HTTPException, Response
+from starlette.routing import Match, Mount
+from app.core.config import settings
+from app.core.metrics import (
+    http_request_db_seconds,
+    http_request_db_statements,
+    http_request_duration,
+    registry,
+    report_slow,
+    track_queries,
+)
+
+def route_label(scope) -> str:
+    """Route template for `scope` (e.g. /api/orders/{telegram_id}), so labels stay low-cardinality."""
+    router = getattr(scope.get("app"), "router", None)
+    for route in getattr(router, "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            if isinstance(route, Mount):
+                return route.path + "/*"
+            return route.path
+    return "unmatched"
+
+class MetricsMiddleware:
+    """Times every HTTP request and counts the SQL it issues."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Resolve before routing: the router rewrites scope paths for mounts
+        route = route_label(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        with track_queries() as stats:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                elapsed = time.perf_counter() - start
+                http_request_duration.observe(elapsed, method=scope["method"], route=route, status=status)
+                http_request_db_statements.observe(stats.count, route=route)
+                http_request_db_seconds.observe(stats.seconds, route=route)
+                report_slow("http", f"{scope['method']} {route}", elapsed, stats)
+
+router = APIRouter(include_in_schema=False)
+
+@router.get("/metrics")
+async def metrics(authorization: Optional[str] = Header(default=None)):
+    if settings.METRICS_TOKEN and not hmac.compare_digest(authorization or "", f"Bearer {settings.METRICS_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,97 +1,208 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from typing import List, Optional
+from typing import List, Literal, Optional
+import datetime
+import hmac
+from app.api.auth import AuthError, WebAppUser, current_user, issue_session, optional_user, require_self, verified_init_data
 from app.db.database import get_db
 from app.services.product_service import product_service
 from app.services.order_service import OrderService
-from app.schemas.product import Product
+from app.services.cart_service import CartService, cart_buffer
+from app.services.export_service import FORMATS, ExportService
+from app.services.promo_service import PromoError, promo_service
+from app.services.pricing_service import PricingError
+from app.schemas.product import Product, ProductSearchResult
 from app.schemas.order import OrderCreate, OrderItemSchema
-from app.bot.loader import bot
+from app.schemas.cart import CartState, CartSync
+from app.services.notification_service import NotificationService, escape_markdown, notification_dispatcher, order_items_text
 from app.core.config import settings
-from app.bot.keyboards import get_admin_order_keyboard
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/api")
 
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
 @router.get("/products", response_model=List[Product])
-async def get_products(refresh: Optional[str] = None):
-    if refresh == "true":
-        return product_service.refresh()
-    return product_service.get_products()
+async def get_products(request: Request, refresh: Optional[str] = None):
+    # `refresh` is kept for older clients: the catalog cache already reloads
+    # whenever the catalog version changes, so there is nothing extra to do.
+    catalog = await product_service.ensure_fresh()
+    headers = {"ETag": catalog.etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), catalog.etag):
+        return Response(status_code=304, headers=headers)
+    # Pre-serialized bytes skip response_model validation and re-encoding
+    return Response(content=catalog.body, media_type="application/json", headers=headers)
+
+@router.get("/products/search", response_model=ProductSearchResult)
+async def search_products(
+    q: Optional[str] = None,
+    brand: List[str] = Query(default=[]),
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: Literal["price", "date", "name"] = "price",
+    direction: Literal["asc", "desc"] = "asc",
+    cursor: Optional[str] = None,
+    limit: int = Query(default=20, ge=1, le=100),
+):
+    try:
+        cursor_rank = int(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    await product_service.ensure_fresh()
+    return product_service.search(
+        q=q,
+        brands=brand,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        direction=direction,
+        cursor=cursor_rank,
+        limit=limit,
+    )
+
+@router.post("/auth/session")
+async def create_session_endpoint(authorization: Optional[str] = Header(default=None)):
+    # Exchange signed initData for a session token, so later calls skip the initData check
+    scheme, _, init_data = (authorization or "").partition(" ")
+    if scheme.lower() != "tma":
+        raise HTTPException(status_code=401, detail="Send Authorization: tma <initData>")
+    try:
+        user = verified_init_data.verify(init_data)
+        token, expires_in = issue_session(user)
+    except AuthError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    return {"token": token, "expiresIn": expires_in, "user": {"id": user.id, "firstName": user.first_name}}
 
 @router.get("/orders/{telegram_id}")
-async def get_user_orders_endpoint(telegram_id: int, db: AsyncSession = Depends(get_db)):
-    orders = await OrderService.get_user_orders(db, telegram_id)
-    return {"orders": orders}
+async def get_user_orders_endpoint(
+    telegram_id: int,
+    before: Optional[int] = None,
+    limit: int = Query(default=50, ge=1, le=100),
+    db: AsyncSession = Depends(get_db),
+    user: WebAppUser = Depends(current_user),
+):
+    require_self(user, telegram_id)
+    orders = await OrderService.get_user_orders(db, telegram_id, limit=limit, before=before)
+    # Pass nextCursor back as `before` to load older orders
+    next_cursor = orders[-1].id if len(orders) == limit else None
+    return {"orders": orders, "nextCursor": next_cursor}
+
+@router.get("/cart/{telegram_id}", response_model=CartState, response_model_exclude_none=True)
+async def get_cart_endpoint(telegram_id: int, db: AsyncSession = Depends(get_db), user: WebAppUser = Depends(current_user)):
+    require_self(user, telegram_id)
+    return await CartService.get_cart(db, telegram_id)
+
+@router.post("/cart/{telegram_id}", response_model=CartState, response_model_exclude_none=True)
+async def sync_cart_endpoint(telegram_id: int, data: CartSync, user: WebAppUser = Depends(current_user)):
+    require_self(user, telegram_id)
+    # Ops are buffered briefly and committed together with other users' syncs
+    return await cart_buffer.submit(telegram_id, data.version, data.ops)
+
+def require_admin_token(authorization: Optional[str] = Header(default=None)):
+    if not settings.ADMIN_API_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(authorization or "", f"Bearer {settings.ADMIN_API_TOKEN}"):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+@router.get("/admin/orders/export", dependencies=[Depends(require_admin_token)])
+async def export_orders_endpoint(
+    format: Literal["csv", "jsonl"] = "csv",
+    gzip: bool = False,
+    status: Optional[str] = None,
+    since: Optional[datetime.date] = None,
+    until: Optional[datetime.date] = None,
+):
+    # Rows go out as they are read from the cursor; nothing is collected in memory
+    body = ExportService.stream(format, compress=gzip, status=status, since=since, until=until)
+    filename = ExportService.filename(format, gzip)
+    return StreamingResponse(
+        body,
+        media_type="application/gzip" if gzip else FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
 
 class PromoValidateRequest(BaseModel):
     code: str
     orderAmount: float
+    userId: Optional[int] = None  # ignored; older clients still send it
 
 @router.post("/promo/validate")
-async def validate_promo(req: PromoValidateRequest):
-    return {"valid": False, "error": "Not implemented yet"}
+async def validate_promo(req: PromoValidateRequest, user: Optional[WebAppUser] = Depends(optional_user)):
+    # Answered from the in-memory index; no DB round-trip once loaded.
+    # Per-customer limits are only checked for a verified user (and again at checkout).
+    await promo_service.ensure_fresh()
+    try:
+        rule, discount = promo_service.validate(req.code, req.orderAmount, user.id if user else None)
+    except PromoError as e:
+        return {"valid": False, "error": str(e)}
+    return {
+        "valid": True,
+        "code": rule.code,
+        "discountType": rule.discount_type,
+        "discountValue": rule.discount_value,
+        "discountAmount": discount,
+    }
 
 @router.post("/data")
-async def create_order_endpoint(data: OrderCreate, db: AsyncSession = Depends(get_db)):
-    if not data.userId or data.userId == 'unknown':
-         # In production, handle better. For now assume we need a valid ID.
-         # Or create a guest user with negative ID?
-         pass 
-
+async def create_order_endpoint(
+    data: OrderCreate,
+    idempotency_key: Optional[str] = Header(default=None, alias="Idempotency-Key", max_length=100),
+    user: WebAppUser = Depends(current_user),
+):
+    # The order belongs to the verified user; userId/userName in the body are ignored
+    telegram_id = user.id
     try:
-        # Check if userId is int
-        try:
-            telegram_id = int(data.userId)
-        except:
-            # If guest or string ID, handle appropriately. 
-            # We'll skip for now and assume int as per typical Telegram flow.
-            raise HTTPException(status_code=400, detail="Invalid User ID")
-
-        user = await OrderService.create_or_update_user(
-            db, 
-            telegram_id=telegram_id, 
-            username=None, 
-            first_name=data.userName or "Customer"
-        )
-        
-        order = await OrderService.create_order(db, user.id, data)
-        
-        items_text = "\n".join(
-            [f"{i+1}. {item.name}\n   {item.quantity} × {item.price:,.0f}₽ = {item.price*item.quantity:,.0f}₽" 
-             for i, item in enumerate(data.items)]
-        )
-        
-        # Notify Admin
-        if settings.ADMIN_ID:
-            admin_text = (
-                f"🆕 *НОВЫЙ ЗАКАЗ (Web)*\n\n📦 `{order.order_number}`\n"
-                f"👤 {user.first_name}\n\n"
-                f"{items_text}\n\n💰 *{order.total_amount:,.0f}₽*"
-            )
-            try:
-                await bot.send_message(
-                    settings.ADMIN_ID, 
-                    admin_text, 
+        if idempotency_key and not data.requestId:
+            data.requestId = idempotency_key
+
+        def notify(session: AsyncSession, user, order, items):
+            # Deferred so serving the API doesn't import aiogram at startup
+            from app.bot.keyboards import get_admin_order_keyboard
+
+            # What was charged, not what the client sent
+            items_text = order_items_text(items)
+
+            # Notify Admin
+            if settings.ADMIN_ID:
+                admin_text = (
+                    f"🆕 *НОВЫЙ ЗАКАЗ (Web)*\n\n📦 `{order.order_number}`\n"
+                    f"👤 {escape_markdown(user.first_name)}\n\n"
+                    f"{items_text}\n\n💰 *{order.total_amount:,.0f}₽*"
+                )
+                NotificationService.enqueue(
+                    session,
+                    settings.ADMIN_ID,
+                    admin_text,
                     reply_markup=get_admin_order_keyboard(order.id, telegram_id),
-                    parse_mode="Markdown"
                 )
-            except Exception as e:
-                print(f"Failed to notify admin: {e}")
-
-        # Notify User
-        user_text = (
-            f"✅ *Заказ оформлен!*\n\n📦 `{order.order_number}`\n\n"
-            f"{items_text}\n\n💰 *Итого: {order.total_amount:,.0f}₽*\n\n"
-            f"⏳ Ожидайте подтверждения!"
+
+            # Notify User
+            user_text = (
+                f"✅ *Заказ оформлен!*\n\n📦 `{order.order_number}`\n\n"
+                f"{items_text}\n\n💰 *Итого: {order.total_amount:,.0f}₽*\n\n"
+                f"⏳ Ожидайте подтверждения!"
+            )
+            NotificationService.enqueue(session, telegram_id, user_text)
+
+        # Order and notifications commit together; the dispatcher sends them after the response
+        order, created = await OrderService.submit_order(
+            telegram_id, user.username, user.first_name or "Customer", data, notify
         )
-        try:
-            await bot.send_message(telegram_id, user_text, parse_mode="Markdown")
-        except Exception as e:
-            print(f"Failed to notify user: {e}")
+        if created:
+            notification_dispatcher.wake()
             
+    except HTTPException:
+        raise
+    except (PromoError, PricingError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"Error creating order: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
         
-    return {"success": True}
+    return {"success": True, "orderNumber": order.order_number, "duplicate": not created}
@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+from dataclasses import dataclass
+from typing import Dict, Optional
+from urllib.parse import quote, unquote, urlsplit
+from fastapi import APIRouter, HTTPException, Request, Response
+from fastapi.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+COMPRESSIBLE = {"text/html", "text/css", "text/javascript", "application/javascript", "application/json", "image/svg+xml"}
+
+class ImmutableStaticFiles(StaticFiles):
+    """Static files whose URLs are content-hashed, so they can be cached forever."""
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = IMMUTABLE
+        return response
+
+@dataclass(frozen=True)
+class Asset:
+    media_type: str
+    etag: str
+    body: bytes
+    gzip: Optional[bytes] = None
+    br: Optional[bytes] = None
+
+    @classmethod
+    def build(cls, body: bytes, media_type: str) -> "Asset":
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        if media_type not in COMPRESSIBLE:
+            return cls(media_type, etag, body)
+        return cls(
+            media_type,
+            etag,
+            body,
+            gzip=gzip.compress(body, compresslevel=9, mtime=0),
+            br=brotli.compress(body, quality=11) if brotli else None,
+        )
+
+def _accepts(accept_encoding: str, coding: str) -> bool:
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        if name.strip().lower() == coding:
+            q = params.strip()
+            try:
+                return not (q.startswith("q=") and float(q[2:]) == 0)
+            except ValueError:
+                return False
+    return False
+
+def asset_response(request: Request, asset: Asset, cache_control: str) -> Response:
+    headers = {"ETag": asset.etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if request.headers.get("if-none-match") == asset.etag:
+        return Response(status_code=304, headers=headers)
+
+    body = asset.body
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if asset.br is not None and _accepts(accept_encoding, "br"):
+        body = asset.br
+        headers["Content-Encoding"] = "br"
+    elif asset.gzip is not None and _accepts(accept_encoding, "gzip"):
+        body = asset.gzip
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type=asset.media_type, headers=headers)
+
+class ShellAssets:
+    """Precompressed, fingerprinted Mini App shell.
+
+    Every local file referenced from index.html (app.js, styles.css, icons)
+    is read once, compressed with gzip/brotli and published under
+    /assets/<name>.<hash><ext>. index.html is rewritten to point at those
+    URLs and is itself served precompressed with revalidation, so a returning
+    client only needs a 304 for the page and nothing for the assets.
+    """
+
+    _ref_re = re.compile(r'(\s(?:src|href)=")([^"]+)(")')
+
+    def __init__(self, public_dir: str = "public", prefix: str = "/assets"):
+        self.public_dir = public_dir
+        self.prefix = prefix
+        self.index: Optional[Asset] = None
+        self.assets: Dict[str, Asset] = {}
+
+    def _local_path(self, ref: str) -> Optional[str]:
+        parts = urlsplit(ref)
+        if parts.scheme or parts.netloc or not parts.path:
+            return None
+        path = os.path.normpath(os.path.join(self.public_dir, unquote(parts.path).lstrip("/")))
+        if not path.startswith(os.path.normpath(self.public_dir) + os.sep) or not os.path.isfile(path):
+            return None
+        return path
+
+    def build(self):
+        assets: Dict[str, Asset] = {}
+        fingerprinted: Dict[str, str] = {}
+
+        def rewrite(match: re.Match) -> str:
+            ref = match.group(2)
+            path = self._local_path(ref)
+            if path is None:
+                return match.group(0)
+            if path not in fingerprinted:
+                with open(path, "rb") as f:
+                    body = f.read()
+                stem, ext = os.path.splitext(os.path.basename(path))
+                name = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+                media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                assets[name] = Asset.build(body, media_type)
+                fingerprinted[path] = f"{self.prefix}/{quote(name)}"
+            return match.group(1) + fingerprinted[path] + match.group(3)
+
+        with open(os.path.join(self.public_dir, "index.html"), "r", encoding="utf-8") as f:
+            html = self._ref_re.sub(rewrite, f.read())
+
+        # No await in between, so requests never see an index pointing at missing assets
+        self.assets, self.index = assets, Asset.build(html.encode("utf-8"), "text/html")
+
+    def ensure_built(self):
+        if self.index is None:
+            self.build()
+
+shell_assets = ShellAssets()
+
+router = APIRouter(include_in_schema=False)
+
+@router.get("/")
+@router.get("/index.html")
+async def index(request: Request):
+    shell_assets.ensure_built()
+    # The page itself must be revalidated so a deploy picks up new asset URLs
+    return asset_response(request, shell_assets.index, "no-cache")
+
+@router.get("/assets/{name}")
+async def asset(name: str, request: Request):
+    shell_assets.ensure_built()
+    found = shell_assets.assets.get(name)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return asset_response(request, found, IMMUTABLE)
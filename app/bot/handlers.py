@@ -1,46 +1,101 @@
+import asyncio
+import datetime
 import json
+import math
+import os
+import tempfile
+from typing import List, Optional
 from aiogram import Router, F, Bot
-from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery
+from aiogram.filters import Command, CommandObject
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.fsm.context import FSMContext
 from app.core.config import settings
-from app.bot.keyboards import get_main_keyboard, get_admin_order_keyboard
+from app.bot.keyboards import get_main_keyboard, get_admin_order_keyboard, get_bulk_confirm_keyboard, get_orders_page_keyboard
+from app.bot.middlewares import HandlerMetricsMiddleware
 from app.services.order_service import OrderService
+from app.services.export_service import FORMATS, ExportService
+from app.services.order_pages import STATUS_FILTERS, order_pages
+from app.services.product_service import product_service
+from app.services.notification_service import NotificationService, escape_markdown, notification_dispatcher, order_items_text
+from app.services.pricing_service import PricingError
+from app.services.promo_service import PromoError
 from app.db.database import AsyncSessionLocal
+from app.db.writer import run_write
 from app.schemas.order import OrderCreate
 
 router = Router()
+router.message.middleware(HandlerMetricsMiddleware())
+router.callback_query.middleware(HandlerMetricsMiddleware())
 
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     is_admin = str(message.from_user.id) == settings.ADMIN_ID
     text = (
-        f"👋 Привет, {message.from_user.first_name}!\n\n👨‍💼 *Режим админа*\n\n/orders - Заказы\n/stats - Статистика"
+        f"👋 Привет, {message.from_user.first_name}!\n\n👨‍💼 *Режим админа*\n\n/orders - Заказы\n/accept, /reject - Обработать пачкой\n/stats - Статистика\n/export - Выгрузка заказов\n/reload - Обновить каталог"
         if is_admin
         else f"👋 Привет, {message.from_user.first_name}!\n\n🛍️ Добро пожаловать в *Shop*!"
     )
     await message.answer(text, reply_markup=get_main_keyboard(is_admin), parse_mode="Markdown")
 
+@router.message(Command("reload"))
+async def cmd_reload(message: Message):
+    if str(message.from_user.id) != settings.ADMIN_ID:
+        return
+
+    # Every worker and replica re-reads the catalog tables on its next request
+    await product_service.publish_change()
+    catalog = await product_service.ensure_fresh()
+    await message.answer(f"🔄 Каталог обновлён: {len(catalog.products)} товаров")
+
 @router.message(Command("orders"))
 async def cmd_orders(message: Message):
     if str(message.from_user.id) != settings.ADMIN_ID:
         return
 
-    async with AsyncSessionLocal() as session:
-        orders_data = await OrderService.get_all_orders(session, limit=20)
-        
-    if not orders_data:
-        await message.answer("📭 Заказов нет")
+    page = await order_pages.get()
+    await message.answer(page.text, reply_markup=get_orders_page_keyboard(page), parse_mode="Markdown")
+
+@router.callback_query(F.data.startswith("orders:"))
+async def orders_page_callback(callback: CallbackQuery):
+    if str(callback.from_user.id) != settings.ADMIN_ID:
+        await callback.answer("❌ Доступ запрещён")
         return
 
-    status_icons = {"new": "🆕", "processing": "⏳", "paid": "💳", "shipped": "🚚", "delivered": "✅", "cancelled": "❌"}
-    
-    text_lines = []
-    for order, user in orders_data:
-        icon = status_icons.get(order.status, "❓")
-        text_lines.append(f"{icon} `{order.order_number}`\n👤 {user.first_name} • {order.total_amount:,.0f}₽")
-        
-    await message.answer(f"📋 *ЗАКАЗЫ*\n\n" + "\n\n".join(text_lines), parse_mode="Markdown")
+    _, status, cursor = callback.data.split(":")
+    status = status if status in dict(STATUS_FILTERS) else None
+    before = int(cursor[1:]) if cursor.startswith("b") else None
+    after = int(cursor[1:]) if cursor.startswith("a") else None
+    page = await order_pages.get(status, before=before, after=after)
+    try:
+        await callback.message.edit_text(page.text, reply_markup=get_orders_page_keyboard(page), parse_mode="Markdown")
+    except TelegramBadRequest:
+        pass  # the same page is already shown
+    await callback.answer()
+
+@router.message(Command("export"))
+async def cmd_export(message: Message, command: CommandObject):
+    if str(message.from_user.id) != settings.ADMIN_ID:
+        return
+
+    # /export [csv|jsonl] [status]
+    args = (command.args or "").split()
+    fmt = args[0].lower() if args else "csv"
+    status = args[1] if len(args) > 1 else None
+    if fmt not in FORMATS:
+        await message.answer("Использование: /export [csv|jsonl] [статус]")
+        return
+
+    # Always gzipped: bots can upload at most 50 MB. The export is streamed to
+    # a temporary file and uploaded from disk, never held in memory.
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}.gz")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            size = await ExportService.write_to(file, fmt=fmt, compress=True, status=status)
+        document = FSInputFile(path, filename=ExportService.filename(fmt, True))
+        await message.answer_document(document, caption=f"📤 Заказы ({fmt}, {size / 1024:,.0f} КБ)")
+    finally:
+        os.unlink(path)
 
 @router.message(Command("stats"))
 async def cmd_stats(message: Message):
@@ -50,12 +105,28 @@ async def cmd_stats(message: Message):
     async with AsyncSessionLocal() as session:
         stats = await OrderService.get_stats(session)
         
-    text = (
-        f"📊 *СТАТИСТИКА*\n\n"
-        f"📦 Заказов: *{stats['total_orders']}*\n"
-        f"💰 Выручка: *{stats['total_revenue']:,.0f}₽*"
-    )
-    await message.answer(text, parse_mode="Markdown")
+    status_icons = {"new": "🆕", "processing": "⏳", "paid": "💳", "shipped": "🚚", "delivered": "✅", "cancelled": "❌"}
+    lines = [
+        f"📊 *СТАТИСТИКА*\n",
+        f"📦 Заказов: *{stats['total_orders']}*",
+        f"💰 Выручка: *{stats['total_revenue']:,.0f}₽*",
+        f"🏷 Скидки: *{stats['total_discount']:,.0f}₽*",
+    ]
+    if stats["by_status"]:
+        lines.append("")
+        lines += [f"{status_icons.get(status, '❓')} {status}: {count}" for status, count in stats["by_status"].items()]
+
+    lines.append("\n📅 *По дням*")
+    lines += [f"{d['day']:%d.%m}: {d['orders']} • {d['revenue']:,.0f}₽" for d in stats["daily"]]
+
+    lines.append("\n🗓 *По неделям*")
+    lines += [f"с {w['start']:%d.%m}: {w['orders']} • {w['revenue']:,.0f}₽" for w in stats["weekly"]]
+
+    if stats["top_products"]:
+        lines.append("\n🏆 *Топ товаров*")
+        lines += [f"{i+1}. {p['product_name']} — {p['units']} шт." for i, p in enumerate(stats["top_products"])]
+
+    await message.answer("\n".join(lines), parse_mode="Markdown")
 
 @router.message(F.content_type == "web_app_data")
 async def web_app_data_handler(message: Message, bot: Bot):
@@ -64,47 +135,50 @@ async def web_app_data_handler(message: Message, bot: Bot):
         # Validate with Pydantic
         order_data = OrderCreate(**data_dict)
         
-        async with AsyncSessionLocal() as session:
-            # Create User
-            user = await OrderService.create_or_update_user(
-                session, 
-                telegram_id=message.from_user.id,
-                username=message.from_user.username,
-                first_name=message.from_user.first_name
-            )
-            
-            # Create Order
-            order = await OrderService.create_order(session, user.id, order_data)
-            
-            items_text = "\n".join(
-                [f"{i+1}. {item.name}\n   {item.quantity} × {item.price:,.0f}₽ = {item.price*item.quantity:,.0f}₽" 
-                 for i, item in enumerate(order_data.items)]
-            )
+        def notify(session, user, order, items):
+            # What was charged, not what the client sent
+            items_text = order_items_text(items)
             
             # To User
-            await message.answer(
+            NotificationService.enqueue(
+                session,
+                message.chat.id,
                 f"✅ *Заказ оформлен!*\n\n📦 `{order.order_number}`\n\n{items_text}\n\n💰 *Итого: {order.total_amount:,.0f}₽*\n\n⏳ Ожидайте подтверждения!",
-                parse_mode="Markdown"
             )
             
             # To Admin
             if settings.ADMIN_ID:
                 admin_text = (
                     f"🆕 *НОВЫЙ ЗАКАЗ*\n\n📦 `{order.order_number}`\n"
-                    f"👤 {message.from_user.first_name} (@{message.from_user.username or '—'})\n\n"
+                    f"👤 {escape_markdown(message.from_user.first_name)} (@{escape_markdown(message.from_user.username or '—')})\n\n"
                     f"{items_text}\n\n💰 *{order.total_amount:,.0f}₽*"
                 )
-                await bot.send_message(
-                    settings.ADMIN_ID, 
-                    admin_text, 
+                NotificationService.enqueue(
+                    session,
+                    settings.ADMIN_ID,
+                    admin_text,
                     reply_markup=get_admin_order_keyboard(order.id, message.from_user.id),
-                    parse_mode="Markdown"
                 )
+
+        # Upsert user, create order and queue notifications in one transaction;
+        # the same requestId arriving via /api/data as well is a no-op
+        order, created = await OrderService.submit_order(
+            message.from_user.id, message.from_user.username, message.from_user.first_name, order_data, notify
+        )
+        if created:
+            notification_dispatcher.wake()
                 
+    except (PromoError, PricingError) as e:
+        await message.answer(f"❌ {e}")
     except Exception as e:
         print(f"Error processing web_app_data: {e}")
         await message.answer("❌ Ошибка обработки заказа")
 
+def _customer_text(order_number: str, is_accept: bool) -> str:
+    if is_accept:
+        return f"✅ *Заказ принят!*\n\n📦 `{order_number}`\n\nМы свяжемся для уточнения доставки!"
+    return f"😔 *Заказ отклонён*\n\n📦 `{order_number}`"
+
 @router.callback_query(F.data.startswith("accept_") | F.data.startswith("reject_"))
 async def order_callback(callback: CallbackQuery, bot: Bot):
     if str(callback.from_user.id) != settings.ADMIN_ID:
@@ -115,19 +189,23 @@ async def order_callback(callback: CallbackQuery, bot: Bot):
     order_id = int(order_id_str)
     is_accept = action == "accept"
     
-    async with AsyncSessionLocal() as session:
+    new_status = "processing" if is_accept else "cancelled"
+
+    async def write(session):
+        # Through the writer so the status change doesn't race checkouts for the SQLite lock
         order, items = await OrderService.get_order_with_items(session, order_id)
-        if not order:
-            await callback.answer("❌ Заказ не найден")
-            return
-            
-        new_status = "processing" if is_accept else "cancelled"
-        await OrderService.update_status(session, order_id, new_status)
-        
-        # Get user telegram id
-        # Use a simple query since we don't have a direct relation loaded in get_order_with_items easily without eager loading setup
-        result = await session.execute(select(User).where(User.id == order.user_id))
-        user = result.scalar_one_or_none()
+        if order:
+            await OrderService.update_status(session, order_id, new_status, commit=False)
+        return order
+
+    order = await run_write(write)
+    if not order:
+        await callback.answer("❌ Заказ не найден")
+        return
+    await OrderService.publish_change()
+
+    # Loaded together with the order
+    user = order.user
         
     # Update Admin Message
     try:
@@ -142,15 +220,154 @@ async def order_callback(callback: CallbackQuery, bot: Bot):
     
     # Notify User
     if user:
-        user_text = (
-            f"✅ *Заказ принят!*\n\n📦 `{order.order_number}`\n\nМы свяжемся для уточнения доставки!"
-            if is_accept
-            else f"😔 *Заказ отклонён*\n\n📦 `{order.order_number}`"
-        )
         try:
-            await bot.send_message(user.telegram_id, user_text, parse_mode="Markdown")
+            await bot.send_message(user.telegram_id, _customer_text(order.order_number, is_accept), parse_mode="Markdown")
         except Exception as e:
             print(f"Failed to notify user: {e}")
 
     await callback.answer("✅ Принят" if is_accept else "❌ Отклонён")
 
+
+
+BULK_USAGE = (
+    "Использование:\n"
+    "/accept ORD-… ORD-… — принять перечисленные заказы\n"
+    "/accept all — принять все новые\n"
+    "/accept all 2h — все новые старше 2 часов (m, h, d)\n"
+    "/reject — то же для отклонения"
+)
+AGE_UNITS = {"m": "minutes", "h": "hours", "d": "days"}
+MAX_AGE = datetime.timedelta(days=3650)  # older than any order; keeps the cutoff arithmetic in range
+PROGRESS_INTERVAL = 2.0  # seconds between progress edits
+
+def _parse_age(arg: str) -> datetime.timedelta:
+    """"30m", "2h", "1d"; a bare number is hours."""
+    unit = AGE_UNITS.get(arg[-1:].lower())
+    amount = float(arg[:-1] if unit else arg)
+    # "inf", "nan" and "1e400" parse as floats too; timedelta would overflow on them
+    if not math.isfinite(amount) or amount <= 0:
+        raise ValueError(arg)
+    try:
+        age = datetime.timedelta(**{unit or "hours": amount})
+    except OverflowError:
+        raise ValueError(arg)
+    if age > MAX_AGE:
+        raise ValueError(arg)
+    return age
+
+@router.message(Command("accept", "reject"))
+async def cmd_bulk(message: Message, command: CommandObject, bot: Bot):
+    if str(message.from_user.id) != settings.ADMIN_ID:
+        return
+
+    args = (command.args or "").replace(",", " ").replace("`", " ").split()
+    if not args:
+        await message.answer(BULK_USAGE)
+        return
+
+    if args[0].lower() == "all":
+        try:
+            age = _parse_age(args[1]) if len(args) > 1 else None
+        except ValueError:
+            await message.answer(BULK_USAGE)
+            return
+        await _confirm_bulk(message, command.command, age, args[1] if age else None)
+        return
+
+    # Listed orders are explicit enough to run without asking
+    await _run_bulk(message, bot, command.command, order_numbers=[arg.upper() for arg in args])
+
+async def _confirm_bulk(message: Message, action: str, age: Optional[datetime.timedelta], age_text: Optional[str] = None):
+    # Whole seconds, so the confirmed cutoff is exactly the one counted here
+    cutoff = int((datetime.datetime.now(datetime.timezone.utc) - age).timestamp()) if age else 0
+    created_before = datetime.datetime.fromtimestamp(cutoff, datetime.timezone.utc) if cutoff else None
+    async with AsyncSessionLocal() as session:
+        count, max_id = await OrderService.count_new_orders(session, created_before)
+    if not count:
+        await message.answer("📭 Подходящих новых заказов нет")
+        return
+
+    verb = "Принять" if action == "accept" else "Отклонить"
+    text = f"{verb} новые заказы ({count} шт.){f' старше {age_text}' if age_text else ''}?"
+    # Orders placed after this point stay out of the batch (max_id)
+    await message.answer(text, reply_markup=get_bulk_confirm_keyboard(action, cutoff, max_id))
+
+@router.callback_query(F.data.startswith("bulk:"))
+async def bulk_callback(callback: CallbackQuery, bot: Bot):
+    if str(callback.from_user.id) != settings.ADMIN_ID:
+        await callback.answer("❌ Доступ запрещён")
+        return
+
+    # bulk:<action> from the orders page; bulk:<action>:<cutoff>:<max_id> once confirmed
+    parts = callback.data.split(":")
+    action = parts[1]
+    if action == "cancel":
+        await callback.message.edit_text("Отменено")
+        await callback.answer()
+        return
+    if action not in ("accept", "reject"):
+        await callback.answer()
+        return
+    if len(parts) == 2:
+        await _confirm_bulk(callback.message, action, None)
+        await callback.answer()
+        return
+
+    cutoff, max_id = int(parts[2]), int(parts[3])
+    try:
+        await callback.message.edit_reply_markup(reply_markup=None)
+    except TelegramBadRequest:
+        pass
+    await callback.answer("⏳ Обрабатываю…")
+    await _run_bulk(
+        callback.message,
+        bot,
+        action,
+        created_before=datetime.datetime.fromtimestamp(cutoff, datetime.timezone.utc) if cutoff else None,
+        max_id=max_id,
+    )
+
+async def _run_bulk(message: Message, bot: Bot, action: str, order_numbers: Optional[List[str]] = None, **filters):
+    is_accept = action == "accept"
+    new_status = "processing" if is_accept else "cancelled"
+    # One UPDATE ... RETURNING for the whole batch; orders handled meanwhile are skipped
+    rows = await run_write(
+        lambda session: OrderService.bulk_update_status(session, new_status, order_numbers=order_numbers, **filters)
+    )
+    if rows:
+        await OrderService.publish_change()
+
+    lines = [f"{'✅ Принято' if is_accept else '❌ Отклонено'} заказов: {len(rows)}"]
+    if order_numbers:
+        skipped = sorted(set(order_numbers) - {row.order_number for row in rows})
+        if skipped:
+            lines.append(f"⏭ Не найдены или уже обработаны: {', '.join(skipped)}")
+    if not rows:
+        await message.answer("\n".join(lines))
+        return
+
+    messages = [(row.telegram_id, _customer_text(row.order_number, is_accept)) for row in rows if row.telegram_id]
+    progress = await message.answer("\n".join(lines + [f"📨 Уведомляю покупателей: 0/{len(messages)}"]))
+    loop = asyncio.get_running_loop()
+    last_edit = loop.time()
+
+    async def report(done: int):
+        nonlocal last_edit
+        if done == len(messages) or loop.time() - last_edit < PROGRESS_INTERVAL:
+            return
+        last_edit = loop.time()
+        try:
+            await progress.edit_text("\n".join(lines + [f"📨 Уведомляю покупателей: {done}/{len(messages)}"]))
+        except TelegramBadRequest:
+            pass
+
+    result = await notification_dispatcher.fan_out(bot, messages, settings.BULK_NOTIFY_CONCURRENCY, report)
+    lines.append(f"📨 Уведомлено: {result.sent}/{len(messages)}")
+    if result.queued:
+        lines.append(f"🔁 Повторим позже: {result.queued}")
+    if result.failed:
+        lines.append(f"⚠️ Не доставлено (бот заблокирован или чат недоступен): {result.failed}")
+    try:
+        await progress.edit_text("\n".join(lines))
+    except TelegramBadRequest:
+        await message.answer("\n".join(lines))
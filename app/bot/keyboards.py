@@ -1,5 +1,6 @@
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton, WebAppInfo
 from app.core.config import settings
+from app.services.order_pages import STATUS_FILTERS, OrderPage
 
 def get_main_keyboard(is_admin: bool = False) -> ReplyKeyboardMarkup:
     buttons = [
@@ -22,3 +23,33 @@ def get_admin_order_keyboard(order_id: int, user_telegram_id: int) -> InlineKeyb
         ]
     ])
 
+
+def get_bulk_confirm_keyboard(action: str, cutoff: int, max_id: int) -> InlineKeyboardMarkup:
+    # callback_data: bulk:<accept|reject>:<created before, unix time or 0>:<newest order id included>
+    return InlineKeyboardMarkup(inline_keyboard=[[
+        InlineKeyboardButton(text="✅ Подтвердить", callback_data=f"bulk:{action}:{cutoff}:{max_id}"),
+        InlineKeyboardButton(text="Отмена", callback_data="bulk:cancel"),
+    ]])
+
+def get_orders_page_keyboard(page: OrderPage) -> InlineKeyboardMarkup:
+    # callback_data: orders:<status|all>:<b<id> older than | a<id> newer than | empty for the first page>
+    current = page.status or "all"
+    filters = [
+        InlineKeyboardButton(text=f"• {label}" if status == page.status else label, callback_data=f"orders:{status or 'all'}:")
+        for status, label in STATUS_FILTERS
+    ]
+    navigation = []
+    if page.newer:
+        navigation.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=f"orders:{current}:a{page.newer}"))
+    if page.older:
+        navigation.append(InlineKeyboardButton(text="Старее ➡️", callback_data=f"orders:{current}:b{page.older}"))
+    rows = [filters[:2], filters[2:]]
+    if navigation:
+        rows.insert(0, navigation)
+    if page.status == "new" and page.size:
+        # Bulk actions over every new order; bulk:<action> asks for confirmation first
+        rows.append([
+            InlineKeyboardButton(text="✅ Принять все", callback_data="bulk:accept"),
+            InlineKeyboardButton(text="❌ Отклонить все", callback_data="bulk:reject"),
+        ])
+    return InlineKeyboardMarkup(inline_keyboard=rows)
@@ -1,7 +1,23 @@
+from functools import lru_cache
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
 from app.core.config import settings
+from app.bot.middlewares import TelegramMetricsMiddleware
+from app.bot.storage import SharedFSMStorage
+from app.services.shared_state import shared_state
 
-bot = Bot(token=settings.BOT_TOKEN)
-dp = Dispatcher(storage=MemoryStorage())
+# Built on first use: this module is only imported once the bot is started,
+# so the API can run (and be imported) without aiogram or a BOT_TOKEN.
 
+@lru_cache(maxsize=None)
+def get_bot() -> Bot:
+    bot = Bot(token=settings.BOT_TOKEN)
+    bot.session.middleware(TelegramMetricsMiddleware())
+    return bot
+
+@lru_cache(maxsize=None)
+def get_dispatcher() -> Dispatcher:
+    from app.bot.handlers import router
+
+    dp = Dispatcher(storage=SharedFSMStorage(shared_state))
+    dp.include_router(router)
+    return dp
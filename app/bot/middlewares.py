@@ -0,0 +1,50 @@
+import time
+from typing import Any, Awaitable, Callable, Dict
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+from app.core.metrics import (
+    bot_handler_duration,
+    bot_handler_errors,
+    report_slow,
+    telegram_api_duration,
+    telegram_api_errors,
+    track_queries,
+)
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Inner middleware: times each handler and counts the SQL it issues."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else type(event).__name__
+        start = time.perf_counter()
+        with track_queries() as stats:
+            try:
+                return await handler(event, data)
+            except Exception:
+                bot_handler_errors.inc(handler=name)
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                bot_handler_duration.observe(elapsed, handler=name)
+                report_slow("bot", name, elapsed, stats)
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Session middleware: times every Bot API call, including outbox sends."""
+
+    async def __call__(self, make_request, bot, method):
+        name = getattr(method, "__api_method__", type(method).__name__)
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            telegram_api_errors.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            telegram_api_duration.observe(time.perf_counter() - start, method=name)
@@ -0,0 +1,36 @@
+from typing import Any, Dict, Optional
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from app.services.shared_state import FSM_DATA, FSM_STATE, SharedState
+
+class SharedFSMStorage(BaseStorage):
+    """aiogram FSM storage on SharedState, so every worker sees the same conversation state."""
+
+    def __init__(self, state: SharedState):
+        self.state = state
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        if value is None:
+            await self.state.delete(FSM_STATE, self._key(key))
+        else:
+            await self.state.set(FSM_STATE, self._key(key), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self.state.get(FSM_STATE, self._key(key))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        if data:
+            await self.state.set(FSM_DATA, self._key(key), data)
+        else:
+            await self.state.delete(FSM_DATA, self._key(key))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return await self.state.get(FSM_DATA, self._key(key), default={})
+
+    async def close(self) -> None:
+        pass
@@ -0,0 +1,54 @@
+import asyncio
+import hmac
+from typing import Set
+from fastapi import APIRouter, HTTPException, Request, Response
+from app.core.config import settings
+
+router = APIRouter()
+
+# Strong references to in-flight handlers so they are not garbage collected mid-run
+_pending: Set[asyncio.Task] = set()
+
+async def setup_webhook():
+    from app.bot.loader import get_bot, get_dispatcher
+
+    bot, dp = get_bot(), get_dispatcher()
+    await bot.set_webhook(
+        settings.resolved_webhook_url,
+        secret_token=settings.resolved_webhook_secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+def _on_done(task: asyncio.Task):
+    _pending.discard(task)
+    if not task.cancelled() and task.exception():
+        print(f"Error processing update: {task.exception()}")
+
+async def drain_pending(timeout: float = 10):
+    if _pending:
+        await asyncio.wait(set(_pending), timeout=timeout)
+
+@router.post(settings.WEBHOOK_PATH, include_in_schema=False)
+async def telegram_webhook(request: Request):
+    # Fail closed: without a secret there is no way to tell Telegram from anyone else
+    secret = settings.resolved_webhook_secret
+    token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+    if not secret or not hmac.compare_digest(token.encode(), secret.encode()):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    # Loaded by the bot startup task; an early update just builds them here
+    from aiogram.types import Update
+    from app.bot.loader import get_bot, get_dispatcher
+
+    bot, dp = get_bot(), get_dispatcher()
+    try:
+        update = Update.model_validate(await request.json(), context={"bot": bot})
+    except ValueError:
+        # Invalid JSON or not an Update (pydantic's ValidationError is a ValueError too)
+        raise HTTPException(status_code=400, detail="Malformed update")
+
+    # Acknowledge right away; Telegram retries updates that are not answered quickly
+    task = asyncio.create_task(dp.feed_update(bot, update))
+    _pending.add(task)
+    task.add_done_callback(_on_done)
+    return Response(status_code=200)
@@ -1,20 +1,101 @@
+import hashlib
+import hmac
 from pydantic_settings import BaseSettings
 from typing import Optional
 
 class Settings(BaseSettings):
-    BOT_TOKEN: str
+    # Without a token the app serves the API and Mini App only
+    BOT_TOKEN: Optional[str] = None
     ADMIN_ID: Optional[str] = None
     DATABASE_URL: str = "sqlite+aiosqlite:///shop.db"
     WEB_APP_URL: Optional[str] = None
     RAILWAY_PUBLIC_DOMAIN: Optional[str] = None
     PORT: int = 8000
 
+    # Connection pool for server databases (PostgreSQL via asyncpg; ignored for SQLite)
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Prepared statements cached per connection; set 0 behind PgBouncer in transaction mode
+    DB_STATEMENT_CACHE_SIZE: int = 500
+    # Apply pending Alembic migrations on startup; turn off to run
+    # `alembic upgrade head` as a separate release step instead
+    DB_MIGRATE_ON_STARTUP: bool = True
+
+    # How often the in-memory promo index checks promo_codes for changes
+    PROMO_REFRESH_SECONDS: float = 30
+
+    # SQLite profile (ignored for other databases)
+    SQLITE_WAL: bool = True
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_CACHE_SIZE_KB: int = 64 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # Funnel order writes through one task that group-commits them
+    SQLITE_WRITE_QUEUE: bool = True
+    WRITE_BATCH_SIZE: int = 64
+
+    # Cart syncs are held this long and then written together, one transaction per window
+    CART_FLUSH_MS: float = 100
+    CART_FLUSH_MAX_USERS: int = 256
+    # Bulk /accept and /reject notify this many customers at a time (still under the flood limits)
+    BULK_NOTIFY_CONCURRENCY: int = 8
+
+    # "polling" runs getUpdates inside the web process (single worker only);
+    # "webhook" lets Telegram push updates so the app can scale horizontally.
+    BOT_MODE: str = "polling"
+    WEBHOOK_URL: Optional[str] = None
+    WEBHOOK_PATH: str = "/webhook/telegram"
+    # Checked on every webhook request; derived from BOT_TOKEN when unset
+    WEBHOOK_SECRET: Optional[str] = None
+
+    # Where FSM state, catalog versions and idempotency keys live: "memory" (one
+    # process), "sql" (the app database) or "redis" (needs the redis package).
+    # Each process caches reads and polls for other processes' writes every
+    # STATE_SYNC_SECONDS.
+    STATE_BACKEND: str = "memory"
+    REDIS_URL: Optional[str] = None
+    STATE_SYNC_SECONDS: float = 1.0
+
+    # Requests and bot handlers slower than this are logged with their SQL breakdown
+    SLOW_REQUEST_MS: float = 500
+    # When set, GET /metrics requires "Authorization: Bearer <token>"
+    METRICS_TOKEN: Optional[str] = None
+    # Mini App auth: signed initData is accepted for this long after Telegram issued it,
+    # and the session tokens exchanged for it last SESSION_TTL_SECONDS
+    INIT_DATA_MAX_AGE_SECONDS: int = 24 * 3600
+    SESSION_TTL_SECONDS: int = 3600
+    # Admin HTTP endpoints (order export) require "Authorization: Bearer <token>";
+    # they are disabled while this is unset
+    ADMIN_API_TOKEN: Optional[str] = None
+
     @property
     def resolved_web_app_url(self) -> str:
         if self.RAILWAY_PUBLIC_DOMAIN:
             return f"https://{self.RAILWAY_PUBLIC_DOMAIN}"
         return self.WEB_APP_URL or f"http://localhost:{self.PORT}"
 
+    @property
+    def use_webhook(self) -> bool:
+        return self.BOT_MODE.lower() == "webhook"
+
+    @property
+    def resolved_webhook_url(self) -> str:
+        if self.WEBHOOK_URL:
+            return self.WEBHOOK_URL
+        return self.resolved_web_app_url.rstrip("/") + self.WEBHOOK_PATH
+
+    @property
+    def resolved_webhook_secret(self) -> Optional[str]:
+        if self.WEBHOOK_SECRET:
+            return self.WEBHOOK_SECRET
+        if not self.BOT_TOKEN:
+            return None
+        # Same value in every replica, and only Telegram (told via set_webhook) knows it
+        return hmac.new(b"WebhookSecret", self.BOT_TOKEN.encode(), hashlib.sha256).hexdigest()
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
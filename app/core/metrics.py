@@ -0,0 +1,199 @@
+import bisect
+import logging
+import re
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger("app.metrics")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Registry:
+    """Holds metrics and renders them in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self.metrics: List["Metric"] = []
+
+    def register(self, metric: "Metric"):
+        self.metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(f"{name} {_number(value)}" for name, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        registry.register(self)
+
+    def _key(self, labels: dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self) -> Iterator[Tuple[str, float]]:
+        return iter(())
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name + _labels(self.labelnames, key), value
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> per-bucket counts (not cumulative), then sum and count
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            state[i] += 1
+        state[-2] += value
+        state[-1] += 1
+
+    def samples(self):
+        for key, state in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, state):
+                cumulative += count
+                yield f"{self.name}_bucket" + _labels(self.labelnames, key, f'le="{_number(bound)}"'), cumulative
+            yield f"{self.name}_bucket" + _labels(self.labelnames, key, 'le="+Inf"'), state[-1]
+            yield f"{self.name}_sum" + _labels(self.labelnames, key), state[-2]
+            yield f"{self.name}_count" + _labels(self.labelnames, key), state[-1]
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status")
+)
+http_request_db_statements = Histogram(
+    "http_request_db_statements", "SQL statements issued per HTTP request", ("route",), COUNT_BUCKETS
+)
+http_request_db_seconds = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per HTTP request", ("route",)
+)
+db_statement_duration = Histogram(
+    "db_statement_duration_seconds", "SQL statement latency by operation", ("operation",)
+)
+bot_handler_duration = Histogram(
+    "bot_handler_duration_seconds", "aiogram handler latency", ("handler",)
+)
+bot_handler_errors = Counter(
+    "bot_handler_errors_total", "aiogram handlers that raised", ("handler",)
+)
+telegram_api_duration = Histogram(
+    "telegram_api_duration_seconds", "Telegram Bot API call latency", ("method",)
+)
+telegram_api_errors = Counter(
+    "telegram_api_errors_total", "Failed Telegram Bot API calls", ("method", "error")
+)
+slow_operations = Counter(
+    "slow_operations_total", "Requests and handlers slower than SLOW_REQUEST_MS", ("kind", "name")
+)
+
+_OPERATIONS = {
+    "SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK",
+    "SAVEPOINT", "RELEASE", "PRAGMA", "CREATE", "DROP", "ALTER",
+}
+_whitespace_re = re.compile(r"\s+")
+
+class QueryStats:
+    """SQL statements issued on behalf of one request or handler."""
+
+    __slots__ = ("count", "seconds", "by_statement")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.by_statement: Dict[str, list] = {}
+
+    def add(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        entry = self.by_statement.get(statement)
+        if entry is None:
+            entry = self.by_statement[statement] = [0, 0.0]
+        entry[0] += 1
+        entry[1] += seconds
+
+    def breakdown(self, top: int = 5) -> str:
+        worst = sorted(self.by_statement.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        return "\n".join(
+            f"  {count}x {seconds * 1000:.1f}ms  {_whitespace_re.sub(' ', statement).strip()[:160]}"
+            for statement, (count, seconds) in worst
+        )
+
+_query_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+def current_query_stats() -> Optional[QueryStats]:
+    return _query_stats.get()
+
+@contextmanager
+def use_query_stats(stats: Optional[QueryStats]):
+    """Attribute statements run inside the block to `stats` (e.g. a job run by another task)."""
+    token = _query_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _query_stats.reset(token)
+
+def track_queries():
+    return use_query_stats(QueryStats())
+
+def record_statement(statement: str, seconds: float):
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else ""
+    db_statement_duration.observe(seconds, operation=operation if operation in _OPERATIONS else "OTHER")
+    stats = _query_stats.get()
+    if stats is not None:
+        stats.add(statement, seconds)
+
+def report_slow(kind: str, name: str, seconds: float, stats: Optional[QueryStats]):
+    if seconds * 1000 < settings.SLOW_REQUEST_MS:
+        return
+    slow_operations.inc(kind=kind, name=name)
+    if stats is None or not stats.count:
+        logger.warning("Slow %s %s: %.0fms, no SQL", kind, name, seconds * 1000)
+        return
+    logger.warning(
+        "Slow %s %s: %.0fms, %d statements in %.0fms\n%s",
+        kind, name, seconds * 1000, stats.count, stats.seconds * 1000, stats.breakdown(),
+    )
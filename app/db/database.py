@@ -1,16 +1,98 @@
+import os
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import URL
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from app.core.config import settings
-from app.db.models import Base
+from app.core.metrics import record_statement
+from app.db.dialect import async_url
 
-engine = create_async_engine(settings.DATABASE_URL, echo=False)
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Arbitrary key for the advisory lock that serializes migrations across replicas
+MIGRATION_LOCK_ID = 727_001
+
+def engine_options(url: URL) -> dict:
+    if url.get_backend_name() == "sqlite":
+        # One file, no server round-trips: the default pool is the right one
+        return {}
+    options = {
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_timeout": settings.DB_POOL_TIMEOUT,
+        # Recycle before server or proxy idle timeouts close connections under us
+        "pool_recycle": settings.DB_POOL_RECYCLE,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+    }
+    if url.get_driver_name() == "asyncpg":
+        connect_args = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+        if not settings.DB_STATEMENT_CACHE_SIZE:
+            # PgBouncer in transaction mode can't keep asyncpg's own statement cache either
+            connect_args["statement_cache_size"] = 0
+        options["connect_args"] = connect_args
+    return options
+
+database_url = async_url(settings.DATABASE_URL)
+engine = create_async_engine(database_url, echo=False, **engine_options(database_url))
 AsyncSessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
 
+is_sqlite = engine.dialect.name == "sqlite"
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+@event.listens_for(engine.sync_engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Feeds the per-statement histogram and the current request's query breakdown
+    start = getattr(context, "_query_start", None)
+    if start is not None:
+        record_statement(statement, time.perf_counter() - start)
+
+if is_sqlite:
+    @event.listens_for(engine.sync_engine, "connect")
+    def _sqlite_on_connect(dbapi_connection, connection_record):
+        # Let SQLAlchemy emit BEGIN itself (see _sqlite_on_begin) so SAVEPOINTs work
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        if settings.SQLITE_WAL:
+            # Readers no longer block behind the writer's lock
+            cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.SQLITE_CACHE_SIZE_KB)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        cursor.close()
+
+    @event.listens_for(engine.sync_engine, "begin")
+    def _sqlite_on_begin(conn):
+        conn.exec_driver_sql("BEGIN")
+
+def alembic_config():
+    # Imported here: Alembic is only needed while migrating, not on the request path
+    from alembic.config import Config
+    config = Config(os.path.join(ROOT, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(ROOT, "migrations"))
+    return config
+
+def _upgrade(conn):
+    from alembic import command
+    config = alembic_config()
+    # migrations/env.py runs on this connection instead of opening its own
+    config.attributes["connection"] = conn
+    command.upgrade(config, "head")
+
 async def init_db():
+    """Apply pending migrations. At head this is a single read of alembic_version."""
+    if not settings.DB_MIGRATE_ON_STARTUP:
+        return
     async with engine.begin() as conn:
-        # In production with Alembic, we wouldn't do create_all here
-        await conn.run_sync(Base.metadata.create_all)
+        if conn.dialect.name == "postgresql":
+            # Replicas starting together migrate one at a time; released on commit
+            await conn.exec_driver_sql(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_ID})")
+        await conn.run_sync(_upgrade)
 
 async def get_db():
     async with AsyncSessionLocal() as session:
         yield session
-
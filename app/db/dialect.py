@@ -0,0 +1,35 @@
+from typing import Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Async driver for each backend, used when DATABASE_URL names none (or a sync one)
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+def async_url(url: str) -> URL:
+    """Normalize DATABASE_URL for the async engine.
+
+    Hosting providers hand out postgres:// or postgresql:// URLs, often with
+    libpq's ?sslmode=...; rewrite them to the asyncpg driver and its ssl= option.
+    """
+    if url.startswith("postgres://"):
+        url = "postgresql://" + url[len("postgres://"):]
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver and parsed.get_driver_name() != driver:
+        parsed = parsed.set(drivername=f"{backend}+{driver}")
+    if driver == "asyncpg" and "sslmode" in parsed.query:
+        query = dict(parsed.query)
+        query["ssl"] = query.pop("sslmode")
+        parsed = parsed.set(query=query)
+    return parsed
+
+def upsert_insert(session: AsyncSession, model) -> Optional[object]:
+    """Return a dialect-specific INSERT supporting ON CONFLICT, or None if unsupported."""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    return None
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text
+from sqlalchemy import JSON, Column, Integer, String, Float, Boolean, Date, DateTime, ForeignKey, Text, Index
 from sqlalchemy.orm import DeclarativeBase, relationship
 from sqlalchemy.sql import func
 from datetime import datetime
@@ -32,6 +32,8 @@ class Order(Base):
     promo_code = Column(String, nullable=True)
     discount_amount = Column(Float, default=0.0)
     notes = Column(Text, nullable=True)
+    # Client-generated request id; a retried submission returns the order it created
+    idempotency_key = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
@@ -39,11 +41,18 @@ class Order(Base):
     items = relationship("OrderItem", back_populates="order", cascade="all, delete-orphan")
     promo_usage = relationship("PromoUsage", back_populates="order")
 
+    __table_args__ = (
+        # Customer history and the admin list (optionally by status), newest first
+        Index("ix_orders_user_created", "user_id", "created_at"),
+        Index("ix_orders_status_created", "status", "created_at"),
+        Index("ux_orders_user_idempotency", "user_id", "idempotency_key", unique=True),
+    )
+
 class OrderItem(Base):
     __tablename__ = "order_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False)
+    order_id = Column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
     product_id = Column(Integer, nullable=False)
     product_name = Column(String, nullable=False)
     product_price = Column(Float, nullable=False)
@@ -65,6 +74,8 @@ class PromoCode(Base):
     expires_at = Column(DateTime(timezone=True), nullable=True)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Part of the promo index fingerprint, so edits to any column trigger a reload
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
     usages = relationship("PromoUsage", back_populates="promo_code")
 
@@ -81,3 +92,146 @@ class PromoUsage(Base):
     user = relationship("User", back_populates="promo_usages")
     order = relationship("Order", back_populates="promo_usage")
 
+    __table_args__ = (
+        # One use per customer per code, enforced even under concurrent checkouts
+        Index("ux_promo_usage_code_user", "promo_code_id", "user_id", unique=True),
+    )
+
+
+class Notification(Base):
+    __tablename__ = "notification_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    chat_id = Column(String, nullable=False)
+    text = Column(Text, nullable=False)
+    parse_mode = Column(String, nullable=True)
+    reply_markup = Column(Text, nullable=True)  # JSON-serialized InlineKeyboardMarkup
+    status = Column(String, default="pending", nullable=False)  # pending, sent, failed
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_notification_outbox_due", "status", "next_attempt_at"),
+    )
+
+# Materialized sales counters, maintained in the same transaction as order writes
+# (see StatsService) and rebuilt from orders with scripts/rebuild_stats.py.
+
+class StatsTotal(Base):
+    __tablename__ = "stats_totals"
+
+    status = Column(String, primary_key=True)
+    orders = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+    discount_total = Column(Float, default=0.0, nullable=False)
+
+class StatsDaily(Base):
+    __tablename__ = "stats_daily"
+
+    day = Column(Date, primary_key=True)
+    status = Column(String, primary_key=True)
+    orders = Column(Integer, default=0, nullable=False)
+    revenue = Column(Float, default=0.0, nullable=False)
+    discount_total = Column(Float, default=0.0, nullable=False)
+
+class StatsProduct(Base):
+    __tablename__ = "stats_products"
+
+    product_id = Column(Integer, primary_key=True)
+    product_name = Column(String, nullable=False)
+    units = Column(Integer, default=0, nullable=False)  # excludes cancelled orders
+    revenue = Column(Float, default=0.0, nullable=False)
+
+# Cross-process key/value state (FSM, catalog version, idempotency keys); see SharedState.
+# Expiry and change times are epoch seconds so every backend compares them the same way.
+
+class SharedStateEntry(Base):
+    __tablename__ = "shared_state"
+
+    namespace = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    value = Column(Text, nullable=False)  # JSON
+    expires_at = Column(Float, nullable=True)
+
+class SharedStateChange(Base):
+    __tablename__ = "shared_state_changes"
+    # Readers poll with `id > cursor`, so ids must never be reused after a prune
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    namespace = Column(String, nullable=False)
+    key = Column(String, nullable=False)
+    created_at = Column(Float, nullable=False)
+
+# Server-side cart and favorites, so they follow the customer across devices.
+# Clients sync them with small op batches (see CartService); `version` bumps on
+# every applied batch so a client can tell when another device changed them.
+
+class Cart(Base):
+    __tablename__ = "carts"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    version = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class CartItem(Base):
+    __tablename__ = "cart_items"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    product_id = Column(Integer, nullable=False)
+    size = Column(String, default="", nullable=False)  # "" when the product has no sizes
+    quantity = Column(Integer, nullable=False)
+
+    __table_args__ = (
+        Index("ux_cart_items_user_product_size", "user_id", "product_id", "size", unique=True),
+    )
+
+class Favorite(Base):
+    __tablename__ = "favorites"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    product_id = Column(Integer, primary_key=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# Catalog. Served from an in-memory snapshot (see ProductService) that is rebuilt
+# when the shared catalog version changes, so edits don't need a redeploy.
+
+class Product(Base):
+    __tablename__ = "products"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(String, nullable=False)
+    brand = Column(String, default="")
+    description = Column(Text, default="")
+    full_description = Column(Text, default="")
+    price = Column(Float, nullable=False)
+    emoji = Column(String, default="🛍️")
+    specs = Column(JSON, default=list)
+    date_added = Column(String, nullable=True)  # ISO timestamp, as given in the catalog file
+    position = Column(Integer, default=0, nullable=False)  # display order
+    is_active = Column(Boolean, default=True, nullable=False)  # inactive products stay for order history
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    images = relationship("ProductImage", order_by="ProductImage.position", cascade="all, delete-orphan")
+
+class ProductImage(Base):
+    __tablename__ = "product_images"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    position = Column(Integer, primary_key=True)  # 0 is the main image
+    url = Column(String, nullable=False)
+
+class Stock(Base):
+    """Units left to sell. Products without a row aren't tracked and never run out.
+
+    Kept apart from `products` because it changes with every checkout, while
+    catalog rows change only on edits (and each edit rebuilds every snapshot).
+    """
+    __tablename__ = "stock"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    quantity = Column(Integer, nullable=False)
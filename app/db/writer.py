@@ -0,0 +1,89 @@
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.core.metrics import current_query_stats, use_query_stats
+from app.db.database import AsyncSessionLocal, is_sqlite
+
+WriteJob = Callable[[AsyncSession], Awaitable[Any]]
+
+class WriteQueue:
+    """Single writer that group-commits concurrent write jobs.
+
+    SQLite allows one writer at a time, so instead of every request fighting
+    for the lock, jobs are queued and a single task runs whatever is waiting
+    in one transaction. Each job gets its own SAVEPOINT so a failing job is
+    rolled back alone, and results are delivered only after the commit.
+    Jobs must not commit themselves.
+    """
+
+    def __init__(self, batch_size: int = 64):
+        self.batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def submit(self, job: WriteJob) -> Any:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        # Carry the caller's query stats so the job's statements count towards its request
+        await self._queue.put((job, future, current_query_stats()))
+        return await future
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        # The task inherits the context of whichever request started it; detach from its stats
+        with use_query_stats(None):
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: List[Tuple[WriteJob, asyncio.Future, Any]]):
+        outcomes = []
+        try:
+            async with AsyncSessionLocal() as session:
+                for job, future, stats in batch:
+                    if future.done():  # caller went away
+                        continue
+                    try:
+                        with use_query_stats(stats):
+                            async with session.begin_nested():
+                                outcomes.append((future, await job(session), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                await session.commit()
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+write_queue = WriteQueue(batch_size=settings.WRITE_BATCH_SIZE)
+
+async def run_write(job: WriteJob) -> Any:
+    """Run `job(session)` in a committed transaction, group-committed on SQLite."""
+    if is_sqlite and settings.SQLITE_WRITE_QUEUE:
+        return await write_queue.submit(job)
+    async with AsyncSessionLocal() as session:
+        result = await job(session)
+        await session.commit()
+        return result
@@ -0,0 +1,161 @@
+import asyncio
+import importlib
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from fastapi import FastAPI
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from app.core.config import settings
+from app.api.health import Readiness, router as health_router
+from app.api.metrics import MetricsMiddleware, router as metrics_router
+from app.api.routes import router as api_router
+from app.api.static import ImmutableStaticFiles, router as shell_router, shell_assets
+from app.bot import webhook
+from app.db.database import init_db
+from app.db.writer import write_queue
+from app.services.cart_service import cart_buffer
+from app.services.product_service import product_service
+from app.services.shared_state import shared_state
+
+async def _cancel(tasks: List[asyncio.Task]):
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+class BotRuntime:
+    """The Telegram side of the process: outbox dispatcher plus polling or webhook."""
+
+    RETRY_DELAY = 1.0
+    MAX_RETRY_DELAY = 60.0
+
+    def __init__(self):
+        self.bot = None
+        self.polling_task: Optional[asyncio.Task] = None
+        self.dispatcher_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        # aiogram and the handlers take over a second to import; keep that off the event loop
+        await asyncio.to_thread(importlib.import_module, "app.bot.loader")
+        await asyncio.to_thread(importlib.import_module, "app.bot.handlers")
+        from app.bot.loader import get_bot, get_dispatcher
+        from app.services.notification_service import notification_dispatcher
+
+        self.bot, dp = get_bot(), get_dispatcher()
+
+        # Outbox worker: sends order notifications after their transaction commits
+        self.dispatcher_task = asyncio.create_task(notification_dispatcher.run(self.bot))
+
+        # Telegram may be unreachable during a deploy; keep trying instead of giving up on the bot
+        delay = self.RETRY_DELAY
+        while True:
+            try:
+                await self._connect(dp)
+                return
+            except Exception as e:
+                print(f"Error starting bot, retrying in {delay:.0f}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.MAX_RETRY_DELAY)
+
+    async def _connect(self, dp):
+        if settings.use_webhook:
+            # Every worker/replica registers the same URL; Telegram delivers each update once
+            await webhook.setup_webhook()
+        else:
+            # getUpdates is refused while a webhook is set
+            await self.bot.delete_webhook()
+            self.polling_task = asyncio.create_task(dp.start_polling(self.bot))
+
+    async def stop(self):
+        if self.polling_task:
+            await _cancel([self.polling_task])
+        await webhook.drain_pending()
+        if self.dispatcher_task:
+            await _cancel([self.dispatcher_task])
+        if self.bot:
+            await self.bot.session.close()
+
+async def load_catalog(attempts: int = 5, delay: float = 1.0):
+    """Readiness step: build the catalog snapshot, or fail so /ready never reports an empty shop as ready."""
+    for attempt in range(attempts):
+        # ensure_fresh() logs load errors and keeps serving the previous (here: empty) snapshot
+        await product_service.ensure_fresh()
+        if product_service.loaded:
+            return
+        if attempt < attempts - 1:
+            await asyncio.sleep(delay * 2 ** attempt)
+    raise RuntimeError("catalog could not be loaded from the database")
+
+def create_app(bot: Optional[bool] = None) -> FastAPI:
+    """Build the web app; the bot runs in the same process when BOT_TOKEN is set (or bot=True).
+
+    Only the schema and shared state are ready before the first request is
+    served. The catalog, the Mini App shell and the bot start in the
+    background, and GET /ready answers 503 until the catalog and the shell
+    have. The bot is reported there too, but doesn't gate readiness: the API
+    and Mini App work without it, and it keeps retrying Telegram meanwhile.
+    """
+    run_bot = bool(settings.BOT_TOKEN) if bot is None else bot
+    readiness = Readiness()
+    bot_runtime = BotRuntime() if run_bot else None
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Startup: requests need these, so they finish before the port is served
+        await init_db()
+        # Shared FSM/catalog/idempotency state: note the change log position, then poll it
+        await shared_state.start()
+        state_task = asyncio.create_task(shared_state.run())
+
+        steps = {
+            # Read the catalog tables (importing products.json into an empty database) and build the search index
+            "catalog": load_catalog(),
+            # Fingerprint and precompress the Mini App shell once per process
+            "shell": asyncio.to_thread(shell_assets.build),
+        }
+        readiness.expect(*steps)
+        background = [asyncio.create_task(readiness.track(step, awaitable)) for step, awaitable in steps.items()]
+        if bot_runtime:
+            readiness.expect("bot", gating=False)
+            background.append(asyncio.create_task(readiness.track("bot", bot_runtime.start(), gating=False)))
+
+        yield
+
+        # Shutdown
+        await _cancel(background)
+        if bot_runtime:
+            await bot_runtime.stop()
+        await _cancel([state_task])
+        await cart_buffer.close()
+        await write_queue.close()
+        await shared_state.close()
+
+    app = FastAPI(lifespan=lifespan, title="Telegram Shop API")
+    app.state.readiness = readiness
+
+    # Middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.add_middleware(MetricsMiddleware)
+
+    # API Routes
+    app.include_router(health_router)
+    app.include_router(api_router)
+    app.include_router(metrics_router)
+    if run_bot and settings.use_webhook:
+        app.include_router(webhook.router)
+    app.include_router(shell_router)
+
+    # Static Files (Frontend)
+    # Content-hashed image variants never change, so they get long-lived immutable caching
+    app.mount("/images/variants", ImmutableStaticFiles(directory="public/images/variants", check_dir=False), name="image_variants")
+    app.mount("/", StaticFiles(directory="public", html=True), name="static")
+    return app
@@ -0,0 +1,41 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
+
+MAX_QUANTITY = 99
+
+# Ops that name a product (the rest apply to the whole cart or favorites list)
+PRODUCT_OPS = {"add", "qty", "remove", "favorite", "unfavorite"}
+
+class CartOp(BaseModel):
+    # add: quantity += n; qty: quantity = n (0 removes); remove: drop the line;
+    # clear: empty the cart; favorite/unfavorite/clearFavorites: the favorites list
+    op: Literal["add", "qty", "remove", "clear", "favorite", "unfavorite", "clearFavorites"]
+    id: Optional[int] = None
+    size: Optional[str] = Field(default=None, max_length=50)
+    quantity: Optional[int] = Field(default=None, ge=-MAX_QUANTITY, le=MAX_QUANTITY)
+
+    @model_validator(mode="after")
+    def check_fields(self):
+        if self.op in PRODUCT_OPS and self.id is None:
+            raise ValueError(f"{self.op} needs a product id")
+        if self.op in ("add", "qty") and self.quantity is None:
+            raise ValueError(f"{self.op} needs a quantity")
+        if self.op == "qty" and self.quantity < 0:
+            raise ValueError("qty must not be negative")
+        return self
+
+class CartSync(BaseModel):
+    # Version the client's copy was based on; a mismatch means another device changed it
+    version: int = 0
+    ops: List[CartOp] = Field(default_factory=list, max_length=200)
+
+class CartLine(BaseModel):
+    id: int
+    size: Optional[str] = None
+    quantity: int
+
+class CartState(BaseModel):
+    version: int
+    # Omitted when the client's copy plus its ops already equals the server's
+    items: Optional[List[CartLine]] = None
+    favorites: Optional[List[int]] = None
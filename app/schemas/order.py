@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Optional
 
 class OrderItemSchema(BaseModel):
@@ -15,4 +15,6 @@ class OrderCreate(BaseModel):
     userId: Optional[int] = None
     userName: Optional[str] = None
     timestamp: Optional[str] = None
+    # Idempotency key: one per checkout attempt, reused on retries
+    requestId: Optional[str] = Field(default=None, max_length=100)
 
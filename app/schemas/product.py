@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 class Product(BaseModel):
     id: int
@@ -13,7 +13,20 @@ class Product(BaseModel):
     fullDescription: Optional[str] = ""
     specs: List[str] = []
     dateAdded: Optional[str] = None
+    # False once a stock-tracked product sells out
+    inStock: bool = True
+    # original image URL -> variant (thumb/card/full) -> format (avif/webp) -> URL
+    imageVariants: Dict[str, Dict[str, Dict[str, str]]] = {}
 
 class ProductList(BaseModel):
     products: List[Product]
 
+
+class ProductFacets(BaseModel):
+    brands: Dict[str, int] = {}
+
+class ProductSearchResult(BaseModel):
+    products: List[Product]
+    total: int
+    nextCursor: Optional[str] = None
+    facets: ProductFacets
@@ -0,0 +1,278 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, insert, select, tuple_, update
+from dataclasses import dataclass, field
+from typing import Collection, Dict, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.db.dialect import upsert_insert
+from app.db.models import Cart, CartItem, Favorite, User
+from app.db.writer import run_write
+from app.schemas.cart import MAX_QUANTITY, CartLine, CartOp, CartState
+from app.services.product_service import product_service
+import asyncio
+import datetime
+
+MAX_CART_LINES = 100
+MAX_FAVORITES = 500
+
+LineKey = Tuple[int, str]  # (product_id, size); size is "" for products without sizes
+
+@dataclass
+class CartSnapshot:
+    version: int = 0
+    items: Dict[LineKey, int] = field(default_factory=dict)  # insertion-ordered
+    favorites: Dict[int, None] = field(default_factory=dict)  # ordered set of product ids
+    item_ids: Dict[LineKey, int] = field(default_factory=dict)  # cart_items.id of stored lines
+
+    def copy(self) -> "CartSnapshot":
+        return CartSnapshot(self.version, dict(self.items), dict(self.favorites), self.item_ids)
+
+    def state(self, full: bool = True) -> CartState:
+        if not full:
+            return CartState(version=self.version)
+        return CartState(
+            version=self.version,
+            items=[CartLine(id=product_id, size=size or None, quantity=quantity) for (product_id, size), quantity in self.items.items()],
+            favorites=list(self.favorites),
+        )
+
+def apply_ops(cart: CartSnapshot, ops: List[CartOp], known: Collection[int]) -> bool:
+    """Apply ops in order. Returns False if any was dropped or clamped, i.e. the
+    result differs from what a client applying the same ops locally would see."""
+    exact = True
+    for op in ops:
+        if op.op in ("add", "qty", "favorite") and known and op.id not in known:
+            exact = False  # product no longer in the catalog
+            continue
+
+        if op.op in ("add", "qty", "remove"):
+            key = (op.id, op.size or "")
+            quantity = {"add": cart.items.get(key, 0) + (op.quantity or 0), "qty": op.quantity, "remove": 0}[op.op]
+            if quantity <= 0:
+                cart.items.pop(key, None)
+            elif key not in cart.items and len(cart.items) >= MAX_CART_LINES:
+                exact = False
+            else:
+                exact = exact and quantity <= MAX_QUANTITY
+                cart.items[key] = min(quantity, MAX_QUANTITY)
+        elif op.op == "clear":
+            cart.items.clear()
+        elif op.op == "favorite":
+            if op.id not in cart.favorites and len(cart.favorites) >= MAX_FAVORITES:
+                exact = False
+            else:
+                cart.favorites[op.id] = None
+        elif op.op == "unfavorite":
+            cart.favorites.pop(op.id, None)
+        elif op.op == "clearFavorites":
+            cart.favorites.clear()
+    return exact
+
+class CartService:
+    @staticmethod
+    async def get_cart(session: AsyncSession, telegram_id: int) -> CartState:
+        user_id = await session.scalar(select(User.id).where(User.telegram_id == telegram_id))
+        if user_id is None:
+            return CartSnapshot().state()
+        carts = await CartService._load(session, [user_id])
+        return carts[user_id].state()
+
+    @staticmethod
+    async def _user_ids(session: AsyncSession, telegram_ids: List[int]) -> Dict[int, int]:
+        """telegram_id -> users.id, creating users the shop hasn't seen yet."""
+        stmt = upsert_insert(session, User)
+        if stmt is not None:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[User.telegram_id])
+            await session.execute(stmt, [{"telegram_id": telegram_id} for telegram_id in telegram_ids])
+        rows = await session.execute(select(User.telegram_id, User.id).where(User.telegram_id.in_(telegram_ids)))
+        ids = dict(rows.all())
+
+        missing = [User(telegram_id=telegram_id) for telegram_id in telegram_ids if telegram_id not in ids]
+        if missing:
+            # No portable upsert
+            session.add_all(missing)
+            await session.flush()
+            ids.update((user.telegram_id, user.id) for user in missing)
+        return ids
+
+    @staticmethod
+    async def _load(session: AsyncSession, user_ids: List[int], lock: bool = False) -> Dict[int, CartSnapshot]:
+        stmt = select(Cart.user_id, Cart.version).where(Cart.user_id.in_(user_ids))
+        if lock:
+            # Serializes concurrent flushes of the same carts from other processes (no-op on SQLite)
+            stmt = stmt.with_for_update()
+        carts = {user_id: CartSnapshot(version=version) for user_id, version in (await session.execute(stmt)).all()}
+        for user_id in user_ids:
+            carts.setdefault(user_id, CartSnapshot())
+
+        items = await session.execute(
+            select(CartItem.id, CartItem.user_id, CartItem.product_id, CartItem.size, CartItem.quantity)
+            .where(CartItem.user_id.in_(user_ids))
+            .order_by(CartItem.id)
+        )
+        for item_id, user_id, product_id, size, quantity in items.all():
+            carts[user_id].items[(product_id, size)] = quantity
+            carts[user_id].item_ids[(product_id, size)] = item_id
+
+        favorites = await session.execute(
+            select(Favorite.user_id, Favorite.product_id)
+            .where(Favorite.user_id.in_(user_ids))
+            .order_by(Favorite.created_at, Favorite.product_id)
+        )
+        for user_id, product_id in favorites.all():
+            carts[user_id].favorites[product_id] = None
+        return carts
+
+    @staticmethod
+    async def _ensure_carts(session: AsyncSession, user_ids: List[int]):
+        stmt = upsert_insert(session, Cart)
+        if stmt is not None:
+            stmt = stmt.on_conflict_do_nothing(index_elements=[Cart.user_id])
+            await session.execute(stmt, [{"user_id": user_id, "version": 0} for user_id in user_ids])
+            return
+        existing = set(await session.scalars(select(Cart.user_id).where(Cart.user_id.in_(user_ids))))
+        session.add_all(Cart(user_id=user_id, version=0) for user_id in user_ids if user_id not in existing)
+        await session.flush()
+
+    @staticmethod
+    async def apply_batch(
+        session: AsyncSession, submissions: Dict[int, List[Tuple[int, List[CartOp]]]]
+    ) -> Dict[int, List[CartState]]:
+        """Apply every user's queued op batches and write the changes in bulk.
+
+        `submissions` maps telegram_id -> [(base_version, ops), ...] in arrival
+        order. Each submission gets the resulting state back; the full contents
+        are included only when the client's copy can't be assumed current
+        (stale base version, other writers in the same batch, dropped ops).
+        The caller owns the commit.
+        """
+        user_ids = await CartService._user_ids(session, list(submissions))
+        await CartService._ensure_carts(session, list(user_ids.values()))
+        stored = await CartService._load(session, list(user_ids.values()), lock=True)
+        known = product_service.get_catalog().index.by_id
+
+        changed: List[Tuple[int, CartSnapshot, CartSnapshot]] = []
+        results: Dict[int, List[CartState]] = {}
+        for telegram_id, batches in submissions.items():
+            user_id = user_ids[telegram_id]
+            old = stored[user_id]
+            new = old.copy()
+            exact = all([apply_ops(new, ops, known) for _, ops in batches])
+            if new.items != old.items or list(new.favorites) != list(old.favorites):
+                new.version = old.version + 1
+                changed.append((user_id, old, new))
+            full = not exact or len(batches) > 1
+            results[telegram_id] = [new.state(full or base != old.version) for base, _ in batches]
+
+        if changed:
+            await CartService._write(session, changed)
+        return results
+
+    @staticmethod
+    async def _write(session: AsyncSession, changed: List[Tuple[int, CartSnapshot, CartSnapshot]]):
+        """Persist only the lines that differ, with one statement per kind of change."""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        item_deletes: List[int] = []
+        item_inserts: List[dict] = []
+        item_updates: List[dict] = []
+        favorite_deletes: List[Tuple[int, int]] = []
+        favorite_inserts: List[dict] = []
+        versions: List[dict] = []
+
+        for user_id, old, new in changed:
+            for key, quantity in new.items.items():
+                if key not in old.items:
+                    item_inserts.append({"user_id": user_id, "product_id": key[0], "size": key[1], "quantity": quantity})
+                elif old.items[key] != quantity:
+                    item_updates.append({"id": old.item_ids[key], "quantity": quantity})
+            item_deletes += [old.item_ids[key] for key in old.items if key not in new.items]
+            favorite_inserts += [
+                {"user_id": user_id, "product_id": product_id, "created_at": now}
+                for product_id in new.favorites if product_id not in old.favorites
+            ]
+            favorite_deletes += [(user_id, product_id) for product_id in old.favorites if product_id not in new.favorites]
+            versions.append({"user_id": user_id, "version": new.version, "updated_at": now})
+
+        if item_deletes:
+            await session.execute(delete(CartItem).where(CartItem.id.in_(item_deletes)))
+        if item_updates:
+            await session.execute(update(CartItem), item_updates)
+        if item_inserts:
+            await session.execute(insert(CartItem), item_inserts)
+        if favorite_deletes:
+            await session.execute(delete(Favorite).where(tuple_(Favorite.user_id, Favorite.product_id).in_(favorite_deletes)))
+        if favorite_inserts:
+            await session.execute(insert(Favorite), favorite_inserts)
+        await session.execute(update(Cart), versions)
+
+@dataclass
+class _Submission:
+    base_version: int
+    ops: List[CartOp]
+    future: asyncio.Future
+
+class CartWriteBuffer:
+    """Coalesces cart syncs in memory and writes them in batches.
+
+    Syncs that arrive within `delay` seconds are held and then applied
+    together: several batches from one user are merged into a single pass,
+    and every user's changes go out in one transaction with one statement per
+    kind of change. A tap-heavy session therefore costs a commit per window
+    rather than per request. Callers wait for the commit that includes their
+    ops, so an acknowledged sync is durable.
+    """
+
+    def __init__(self, delay: float, max_users: int):
+        self.delay = delay
+        self.max_users = max_users
+        self._pending: Dict[int, List[_Submission]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._flushing: Set[asyncio.Task] = set()
+
+    async def submit(self, telegram_id: int, base_version: int, ops: List[CartOp]) -> CartState:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(telegram_id, []).append(_Submission(base_version, ops, future))
+        if len(self._pending) >= self.max_users:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.delay, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._write(batch))
+            self._flushing.add(task)
+            task.add_done_callback(self._flushing.discard)
+
+    async def _write(self, batch: Dict[int, List[_Submission]]):
+        submissions = {
+            telegram_id: [(sub.base_version, sub.ops) for sub in subs]
+            for telegram_id, subs in batch.items()
+        }
+        try:
+            # Outside the write job: a first load may itself need the writer
+            await product_service.ensure_fresh()
+            results = await run_write(lambda session: CartService.apply_batch(session, submissions))
+        except Exception as e:
+            print(f"Error saving carts: {e}")
+            for subs in batch.values():
+                for sub in subs:
+                    if not sub.future.done():
+                        sub.future.set_exception(e)
+            return
+
+        for telegram_id, subs in batch.items():
+            for sub, state in zip(subs, results[telegram_id]):
+                if not sub.future.done():
+                    sub.future.set_result(state)
+
+    async def close(self):
+        """Write whatever is still buffered (called on shutdown)."""
+        self._flush()
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+cart_buffer = CartWriteBuffer(delay=settings.CART_FLUSH_MS / 1000, max_users=settings.CART_FLUSH_MAX_USERS)
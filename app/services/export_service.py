@@ -0,0 +1,99 @@
+import csv
+import datetime
+import io
+import json
+import zlib
+from typing import AsyncIterator, Optional
+from app.db.database import AsyncSessionLocal
+from app.services.order_service import EXPORT_ITEM_COLUMNS, EXPORT_ORDER_COLUMNS, OrderService
+
+FORMATS = {"csv": "text/csv", "jsonl": "application/x-ndjson"}
+
+ORDER_FIELDS = tuple(column.key for column in EXPORT_ORDER_COLUMNS)
+ITEM_FIELDS = tuple(column.key for column in EXPORT_ITEM_COLUMNS)
+
+# Text buffered before a chunk is handed to the response or file
+CHUNK_SIZE = 64 * 1024
+
+class ExportService:
+    @staticmethod
+    def filename(fmt: str, compress: bool) -> str:
+        return f"orders-{datetime.date.today():%Y%m%d}.{fmt}" + (".gz" if compress else "")
+
+    @staticmethod
+    async def _csv_chunks(batches) -> AsyncIterator[str]:
+        # One line per order item; order and customer columns repeat on each line
+        buffer = io.StringIO()
+        # BOM so Excel opens the Cyrillic names as UTF-8
+        buffer.write("﻿")
+        writer = csv.writer(buffer)
+        writer.writerow(ORDER_FIELDS + ITEM_FIELDS)
+        async for batch in batches:
+            writer.writerows(batch)
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    @staticmethod
+    async def _jsonl_chunks(batches) -> AsyncIterator[str]:
+        # One object per order with its items nested. Rows arrive grouped by
+        # order, so only the current order is ever held in memory.
+        buffer = io.StringIO()
+        split = len(ORDER_FIELDS)
+        current = None
+        async for batch in batches:
+            for row in batch:
+                if current is None or current["order_id"] != row[0]:
+                    if current is not None:
+                        buffer.write(json.dumps(current, ensure_ascii=False, default=str) + "\n")
+                    current = dict(zip(ORDER_FIELDS, row[:split]))
+                    current["items"] = []
+                if row[split] is not None:
+                    current["items"].append(dict(zip(ITEM_FIELDS, row[split:])))
+            if buffer.tell() >= CHUNK_SIZE:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if current is not None:
+            buffer.write(json.dumps(current, ensure_ascii=False, default=str) + "\n")
+        yield buffer.getvalue()
+
+    @staticmethod
+    async def stream(
+        fmt: str = "csv",
+        compress: bool = False,
+        status: Optional[str] = None,
+        since: Optional[datetime.date] = None,
+        until: Optional[datetime.date] = None,
+    ) -> AsyncIterator[bytes]:
+        """Orders as CSV or JSONL bytes, produced incrementally from a server-side cursor.
+
+        Opens its own session, so it can back a StreamingResponse that outlives the request handler.
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        # wbits=31 writes a gzip header and trailer, so the output is a plain .gz file
+        gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        chunks = ExportService._csv_chunks if fmt == "csv" else ExportService._jsonl_chunks
+
+        async with AsyncSessionLocal() as session:
+            batches = OrderService.stream_export_rows(session, status=status, since=since, until=until)
+            async for text in chunks(batches):
+                data = text.encode("utf-8")
+                if gzip:
+                    data = gzip.compress(data)
+                if data:
+                    yield data
+        if gzip:
+            yield gzip.flush()
+
+    @staticmethod
+    async def write_to(file, **kwargs) -> int:
+        """Stream an export into an open binary file; returns the number of bytes written."""
+        size = 0
+        async for chunk in ExportService.stream(**kwargs):
+            file.write(chunk)
+            size += len(chunk)
+        return size
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import tempfile
+from typing import IO, Callable, Dict, Optional
+
+try:
+    from PIL import Image, ImageOps, features
+except ImportError:  # Pillow is optional at runtime; products then keep their original images
+    Image = None
+
+try:
+    import pillow_avif  # noqa: F401  registers the AVIF codec on Pillow builds without it
+except ImportError:
+    pass
+
+# Longest allowed width per variant; images are never upscaled
+VARIANT_WIDTHS = {"thumb": 160, "card": 480, "full": 1280}
+QUALITY = {"avif": 55, "webp": 80}
+
+Variants = Dict[str, Dict[str, str]]  # variant -> format -> URL
+
+def _write_atomically(target: str, write: Callable[[IO], None], mode: str = "wb"):
+    """Write through a temp file of our own and rename it over `target`.
+
+    Workers and the build script may produce the same file at once; each
+    writes its own temp file, so none can rename another's half-written one.
+    """
+    encoding = None if "b" in mode else "utf-8"
+    with tempfile.NamedTemporaryFile(
+        mode, encoding=encoding, dir=os.path.dirname(target), prefix=os.path.basename(target) + ".", suffix=".tmp", delete=False
+    ) as f:
+        tmp_path = f.name
+        try:
+            write(f)
+        except BaseException:
+            f.close()
+            os.unlink(tmp_path)
+            raise
+    # NamedTemporaryFile creates 0600; the files are served, so make them world-readable like a plain open()
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, target)
+
+def available_formats() -> list:
+    if Image is None:
+        return []
+    formats = []
+    if ".avif" in Image.registered_extensions():
+        formats.append("avif")
+    if features.check("webp"):
+        formats.append("webp")
+    return formats
+
+class ImagePipeline:
+    """Builds resized, content-hashed WebP/AVIF variants of catalog images.
+
+    Output files are named after a hash of the source bytes and the encoding
+    settings, so they never change once written and can be cached forever.
+    A manifest keyed by the source's (mtime, size) avoids re-hashing sources
+    that have not changed.
+    """
+
+    def __init__(self, public_dir: str = "public", out_subdir: str = "images/variants"):
+        self.public_dir = public_dir
+        self.out_dir = os.path.join(public_dir, out_subdir)
+        self.out_url = "/" + out_subdir.strip("/")
+        self.manifest_path = os.path.join(self.out_dir, "manifest.json")
+        self._manifest: Optional[dict] = None
+        self._dirty = False
+
+    def _load_manifest(self) -> dict:
+        if self._manifest is None:
+            try:
+                with open(self.manifest_path, "r", encoding="utf-8") as f:
+                    self._manifest = json.load(f)
+            except (OSError, ValueError):
+                self._manifest = {}
+        return self._manifest
+
+    def save_manifest(self):
+        if not self._dirty:
+            return
+        os.makedirs(self.out_dir, exist_ok=True)
+        _write_atomically(
+            self.manifest_path, lambda f: json.dump(self._manifest, f, ensure_ascii=False, indent=1), mode="w"
+        )
+        self._dirty = False
+
+    def _source_path(self, url: str) -> Optional[str]:
+        # Only local files under public/ are processed; remote URLs are passed through
+        if not url or not url.startswith("/") or url.startswith("//"):
+            return None
+        path = os.path.normpath(os.path.join(self.public_dir, url.lstrip("/")))
+        if not path.startswith(os.path.normpath(self.public_dir) + os.sep):
+            return None
+        return path
+
+    def variants_for(self, url: str, generate: bool = True) -> Variants:
+        path = self._source_path(url)
+        if path is None:
+            return {}
+        try:
+            st = os.stat(path)
+        except OSError:
+            return {}
+
+        stamp = [st.st_mtime_ns, st.st_size]
+        manifest = self._load_manifest()
+        entry = manifest.get(url)
+        if entry and entry["stamp"] == stamp and self._files_exist(entry["variants"]):
+            return entry["variants"]
+        if not generate or Image is None:
+            return {}
+
+        try:
+            variants = self._build(path)
+        except Exception as e:
+            print(f"Error building image variants for {url}: {e}")
+            return {}
+        manifest[url] = {"stamp": stamp, "variants": variants}
+        self._dirty = True
+        return variants
+
+    def _files_exist(self, variants: Variants) -> bool:
+        return all(
+            os.path.exists(os.path.join(self.out_dir, os.path.basename(url)))
+            for formats in variants.values()
+            for url in formats.values()
+        )
+
+    def _build(self, path: str) -> Variants:
+        formats = available_formats()
+        with open(path, "rb") as f:
+            source = f.read()
+        settings_key = json.dumps([VARIANT_WIDTHS, QUALITY], sort_keys=True).encode()
+        digest = hashlib.sha256(source + settings_key).hexdigest()[:12]
+        stem = os.path.splitext(os.path.basename(path))[0]
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        with Image.open(path) as opened:
+            image = ImageOps.exif_transpose(opened)
+            image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+
+            variants: Variants = {}
+            for variant, width in VARIANT_WIDTHS.items():
+                resized = image
+                if image.width > width:
+                    height = round(image.height * width / image.width)
+                    resized = image.resize((width, height), Image.LANCZOS)
+
+                for fmt in formats:
+                    name = f"{stem}-{variant}-{digest}.{fmt}"
+                    target = os.path.join(self.out_dir, name)
+                    if not os.path.exists(target):
+                        _write_atomically(target, lambda f: resized.save(f, format=fmt.upper(), quality=QUALITY[fmt]))
+                    variants.setdefault(variant, {})[fmt] = f"{self.out_url}/{name}"
+        return variants
@@ -0,0 +1,277 @@
+import asyncio
+import datetime
+import re
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import Notification
+from app.db.writer import run_write
+
+if TYPE_CHECKING:
+    # aiogram takes over a second to import; the API enqueues without it
+    from aiogram import Bot
+    from aiogram.types import InlineKeyboardMarkup
+    from app.services.pricing_service import PricedItem
+
+MAX_ATTEMPTS = 8
+MAX_BACKOFF = 600  # seconds
+LEASE = 60  # seconds a claimed row is hidden from other dispatchers; renewed while its batch is in flight
+
+def _utcnow() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+def escape_markdown(text: Optional[str]) -> str:
+    """Escape user-supplied text for the legacy Markdown parse mode."""
+    return re.sub(r"([_*`\[])", r"\\\1", text or "")
+
+def order_items_text(items: Sequence["PricedItem"]) -> str:
+    """Numbered item lines for order notifications, from the server-priced items."""
+    return "\n".join(
+        f"{i+1}. {escape_markdown(item.product_name)}\n"
+        f"   {item.quantity} × {item.product_price:,.0f}₽ = {item.subtotal:,.0f}₽"
+        for i, item in enumerate(items)
+    )
+
+class NotificationService:
+    @staticmethod
+    def enqueue(
+        session: AsyncSession,
+        chat_id: Union[int, str],
+        text: str,
+        reply_markup: Optional["InlineKeyboardMarkup"] = None,
+        parse_mode: Optional[str] = "Markdown",
+    ) -> Notification:
+        """Add a message to the outbox. It is sent once the caller's transaction commits."""
+        notification = Notification(
+            chat_id=str(chat_id),
+            text=text,
+            parse_mode=parse_mode,
+            reply_markup=reply_markup.model_dump_json(exclude_none=True) if reply_markup else None,
+            next_attempt_at=_utcnow(),
+        )
+        session.add(notification)
+        return notification
+
+@dataclass
+class FanOutResult:
+    sent: int = 0
+    failed: int = 0  # blocked the bot or unreachable: not retried
+    queued: int = 0  # transient errors, handed to the outbox for retries
+    errors: List[str] = field(default_factory=list)
+
+class RateLimiter:
+    """Spaces sends to stay under Telegram's global and per-chat flood limits."""
+
+    def __init__(self, global_per_second: float = 25, per_chat_interval: float = 1.0):
+        self._global_interval = 1 / global_per_second
+        self._per_chat_interval = per_chat_interval
+        self._next_global = 0.0
+        self._next_chat: Dict[str, float] = {}
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, chat_id: str):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            now = loop.time()
+            at = max(now, self._next_global, self._next_chat.get(chat_id, 0.0))
+            self._next_global = at + self._global_interval
+            self._next_chat[chat_id] = at + self._per_chat_interval
+            if len(self._next_chat) > 10000:
+                self._next_chat = {k: v for k, v in self._next_chat.items() if v > now}
+        if at > now:
+            await asyncio.sleep(at - now)
+
+    def pause(self, seconds: float):
+        resume = asyncio.get_running_loop().time() + seconds
+        self._next_global = max(self._next_global, resume)
+
+class NotificationDispatcher:
+    """Background worker that drains the outbox.
+
+    Rows are claimed with a conditional UPDATE that pushes `next_attempt_at`
+    forward by a lease, so several processes can run a dispatcher without
+    sending the same message twice.
+    """
+
+    def __init__(self, batch_size: int = 50, poll_interval: float = 2.0):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.limiter = RateLimiter()
+        self._wakeup = asyncio.Event()
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def run(self, bot: "Bot"):
+        while True:
+            try:
+                sent = await self.process_batch(bot)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Notification dispatcher error: {e}")
+                sent = 0
+
+            if sent < self.batch_size:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _claim(self, session: AsyncSession):
+        now = _utcnow()
+        due = (
+            select(Notification.id)
+            .where(Notification.status == "pending", Notification.next_attempt_at <= now)
+            .order_by(Notification.id)
+            .limit(self.batch_size)
+        )
+        stmt = (
+            update(Notification)
+            .where(
+                Notification.id.in_(due.scalar_subquery()),
+                Notification.status == "pending",
+                Notification.next_attempt_at <= now,
+            )
+            .values(
+                next_attempt_at=now + datetime.timedelta(seconds=LEASE),
+                attempts=Notification.attempts + 1,
+            )
+            .returning(
+                Notification.id,
+                Notification.chat_id,
+                Notification.text,
+                Notification.parse_mode,
+                Notification.reply_markup,
+                Notification.attempts,
+            )
+        )
+        return (await session.execute(stmt)).all()
+
+    async def process_batch(self, bot: "Bot") -> int:
+        # Claims and results go through the writer, so on SQLite they don't fight order writes for the lock
+        rows = await run_write(self._claim)
+        if not rows:
+            return 0
+
+        # Flood waits and per-chat spacing can outlast the lease; keep the rows claimed until written
+        done = asyncio.Event()
+        renewal = asyncio.create_task(self._renew_lease([row.id for row in rows], done))
+        try:
+            results = await asyncio.gather(*(self._send(bot, row) for row in rows))
+        finally:
+            done.set()
+            await renewal
+
+        async def write(session: AsyncSession):
+            for row, values in zip(rows, results):
+                await session.execute(update(Notification).where(Notification.id == row.id).values(**values))
+
+        await run_write(write)
+        return len(rows)
+
+    @staticmethod
+    async def _renew_lease(ids: List[int], done: asyncio.Event):
+        """Push the lease of claimed rows forward every third of LEASE until `done` is set."""
+        while True:
+            try:
+                await asyncio.wait_for(done.wait(), timeout=LEASE / 3)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await run_write(lambda session: session.execute(
+                    update(Notification)
+                    .where(Notification.id.in_(ids), Notification.status == "pending")
+                    .values(next_attempt_at=_utcnow() + datetime.timedelta(seconds=LEASE))
+                ))
+            except Exception as e:
+                print(f"Error renewing notification lease: {e}")
+
+    async def _send(self, bot: "Bot", row) -> dict:
+        from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+        from aiogram.types import InlineKeyboardMarkup
+
+        await self.limiter.acquire(row.chat_id)
+        markup = InlineKeyboardMarkup.model_validate_json(row.reply_markup) if row.reply_markup else None
+        try:
+            await bot.send_message(row.chat_id, row.text, parse_mode=row.parse_mode, reply_markup=markup)
+        except TelegramRetryAfter as e:
+            # Flood control applies to the whole bot, so hold every send, and don't count the attempt
+            self.limiter.pause(e.retry_after)
+            return {
+                "next_attempt_at": _utcnow() + datetime.timedelta(seconds=e.retry_after),
+                "attempts": row.attempts - 1,
+                "last_error": str(e),
+            }
+        except (TelegramForbiddenError, TelegramBadRequest) as e:
+            # Blocked bot, unknown chat, bad markup: retrying will not help
+            return {"status": "failed", "last_error": str(e)}
+        except Exception as e:
+            if row.attempts >= MAX_ATTEMPTS:
+                return {"status": "failed", "last_error": str(e)}
+            backoff = min(2 ** row.attempts, MAX_BACKOFF)
+            return {"next_attempt_at": _utcnow() + datetime.timedelta(seconds=backoff), "last_error": str(e)}
+        return {"status": "sent", "sent_at": _utcnow(), "last_error": None}
+
+    async def fan_out(
+        self,
+        bot: "Bot",
+        messages: Sequence[Tuple[Union[int, str], str]],
+        concurrency: int,
+        on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+        parse_mode: Optional[str] = "Markdown",
+    ) -> FanOutResult:
+        """Send (chat_id, text) messages right away, at most `concurrency` in flight.
+
+        For bulk admin actions that want a result to report: sends share the
+        dispatcher's rate limiter, flood waits are sat out, and messages that
+        fail for transient reasons go to the outbox instead of being lost.
+        `on_progress` is awaited with the number of messages handled so far.
+        """
+        from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+
+        result = FanOutResult()
+        retry: List[Tuple[Union[int, str], str]] = []
+        semaphore = asyncio.Semaphore(concurrency)
+        done = 0
+
+        async def send(chat_id, text):
+            nonlocal done
+            async with semaphore:
+                for _ in range(MAX_ATTEMPTS):
+                    await self.limiter.acquire(str(chat_id))
+                    try:
+                        await bot.send_message(chat_id, text, parse_mode=parse_mode)
+                        result.sent += 1
+                    except TelegramRetryAfter as e:
+                        self.limiter.pause(e.retry_after)
+                        continue
+                    except (TelegramForbiddenError, TelegramBadRequest) as e:
+                        result.failed += 1
+                        result.errors.append(str(e))
+                    except Exception as e:
+                        retry.append((chat_id, text))
+                        result.errors.append(str(e))
+                    break
+                else:
+                    retry.append((chat_id, text))
+                done += 1
+                if on_progress:
+                    await on_progress(done)
+
+        await asyncio.gather(*(send(chat_id, text) for chat_id, text in messages))
+
+        if retry:
+            async def enqueue(session: AsyncSession):
+                for chat_id, text in retry:
+                    NotificationService.enqueue(session, chat_id, text, parse_mode=parse_mode)
+
+            await run_write(enqueue)
+            result.queued = len(retry)
+            self.wake()
+        return result
+
+notification_dispatcher = NotificationDispatcher()
@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+from app.db.database import AsyncSessionLocal
+from app.services.order_service import OrderService
+from app.services.shared_state import ORDERS, shared_state
+
+STATUS_ICONS = {"new": "🆕", "processing": "⏳", "paid": "💳", "shipped": "🚚", "delivered": "✅", "cancelled": "❌"}
+
+# Filter buttons under /orders; None lists every status
+STATUS_FILTERS = (
+    (None, "Все"),
+    ("new", "🆕 Новые"),
+    ("processing", "⏳ В работе"),
+    ("cancelled", "❌ Отменённые"),
+)
+
+@dataclass(frozen=True)
+class OrderPage:
+    status: Optional[str]
+    text: str
+    newer: Optional[int] = None  # pass as `after` for the previous (newer) page
+    older: Optional[int] = None  # pass as `before` for the next (older) page
+    size: int = 0  # orders on the page
+
+PageKey = Tuple[Optional[str], Optional[int], Optional[int]]  # (status, before, after)
+
+class OrderPages:
+    """Rendered /orders pages, cached until an order is created or changes status.
+
+    Pages are keyset-paged on (created_at, id), filtered through the
+    (status, created_at) index, so every miss is one indexed query however
+    far back the admin pages; hits cost no query at all. Invalidation comes
+    through shared state, so a write in any process clears every process's cache.
+    """
+
+    def __init__(self, page_size: int = 20, max_entries: int = 64):
+        self.page_size = page_size
+        self.max_entries = max_entries
+        self._pages: "OrderedDict[PageKey, OrderPage]" = OrderedDict()
+        # Bumped on every invalidation so a page rendered while orders changed isn't cached
+        self._generation = 0
+        shared_state.watch(ORDERS, "version", self.invalidate)
+
+    def invalidate(self):
+        self._generation += 1
+        self._pages.clear()
+
+    async def get(self, status: Optional[str] = None, before: Optional[int] = None, after: Optional[int] = None) -> OrderPage:
+        key = (status, before, after)
+        page = self._pages.get(key)
+        if page is not None:
+            self._pages.move_to_end(key)
+            return page
+
+        generation = self._generation
+        # One row past the page tells whether there is anything beyond it
+        async with AsyncSessionLocal() as session:
+            rows = await OrderService.get_all_orders(
+                session, limit=self.page_size + 1, before=before, after=after, status=status
+            )
+
+        if after is not None:
+            if len(rows) <= self.page_size:
+                # Reached the latest orders: show the first page so its boundaries stay stable
+                return await self.get(status)
+            rows = rows[1:]
+            page = self._render(status, rows, newer=rows[0][0].id, older=rows[-1][0].id)
+        else:
+            more = len(rows) > self.page_size
+            rows = rows[:self.page_size]
+            page = self._render(
+                status,
+                rows,
+                newer=rows[0][0].id if before is not None and rows else None,
+                older=rows[-1][0].id if more else None,
+            )
+
+        if generation == self._generation:
+            self._pages[key] = page
+            while len(self._pages) > self.max_entries:
+                self._pages.popitem(last=False)
+        return page
+
+    @staticmethod
+    def _render(status: Optional[str], rows, newer: Optional[int], older: Optional[int]) -> OrderPage:
+        title = "📋 *ЗАКАЗЫ*"
+        if status:
+            title += f" • {dict(STATUS_FILTERS).get(status, status)}"
+        if not rows:
+            return OrderPage(status, f"{title}\n\n📭 Заказов нет", newer, older)
+
+        text_lines = []
+        for order, user in rows:
+            icon = STATUS_ICONS.get(order.status, "❓")
+            text_lines.append(f"{icon} `{order.order_number}`\n👤 {user.first_name} • {order.total_amount:,.0f}₽")
+        return OrderPage(status, f"{title}\n\n" + "\n\n".join(text_lines), newer, older, len(rows))
+
+order_pages = OrderPages()
@@ -1,9 +1,96 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, func, desc
+from sqlalchemy import Row, select, update, insert, func, desc, or_, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, selectinload
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Optional, Sequence, Tuple
+from app.db.database import AsyncSessionLocal
+from app.db.dialect import upsert_insert
+from app.db.writer import run_write
 from app.db.models import User, Order, OrderItem, PromoCode, PromoUsage
 from app.schemas.order import OrderCreate
+from app.services.stats_service import StatsService, order_day
+from app.services.pricing_service import PricedItem, PricingService, Quote
+from app.services.product_service import product_service
+from app.services.promo_service import PromoError, PromoService, promo_service
+from app.services.shared_state import IDEMPOTENCY, ORDERS, shared_state
+from app.services.stock_service import StockService
+import asyncio
+import dataclasses
 import datetime
-import random
+import itertools
+import secrets
+
+class OrderNumberGenerator:
+    """Order numbers that are unique across processes without a DB round-trip.
+
+    Each process draws a random 32-bit node id once and numbers its orders
+    with a counter, so a process never repeats itself and two processes only
+    clash if they draw the same node id (which the unique index still catches).
+    """
+
+    def __init__(self):
+        self.node = secrets.randbits(32)
+        self._counter = itertools.count(1)
+
+    def next(self) -> str:
+        return f"ORD-{datetime.date.today():%y%m%d}-{self.node:08X}-{next(self._counter)}"
+
+    def reseed(self):
+        """Draw a new node id, after one of ours turned out to be taken by another process."""
+        self.node = secrets.randbits(32)
+
+order_numbers = OrderNumberGenerator()
+
+class RecentOrders:
+    """Per-process LRU of (telegram_id, request id) -> order, so retries are answered from memory."""
+
+    def __init__(self, max_entries: int = 10_000):
+        self.max_entries = max_entries
+        self._orders: "OrderedDict[Tuple[int, str], Order]" = OrderedDict()
+
+    def get(self, key: Tuple[int, str]) -> Optional[Order]:
+        order = self._orders.get(key)
+        if order is not None:
+            self._orders.move_to_end(key)
+        return order
+
+    def put(self, key: Tuple[int, str], order: Order):
+        self._orders[key] = order
+        self._orders.move_to_end(key)
+        while len(self._orders) > self.max_entries:
+            self._orders.popitem(last=False)
+
+recent_orders = RecentOrders()
+
+# Seconds a checkout holds its (telegram_id, requestId) claim in shared state;
+# after that the orders' unique index is the only guard against a replay
+CLAIM_TTL = 60
+
+# Enqueues the notifications for a newly created order inside its transaction;
+# gets the server-priced items that were stored, not what the client sent
+OrderNotifier = Callable[[AsyncSession, User, Order, Sequence[PricedItem]], None]
+
+# Columns of OrderService.stream_export_rows, in row order
+EXPORT_ORDER_COLUMNS = (
+    Order.id.label("order_id"),
+    Order.order_number,
+    Order.status,
+    Order.created_at,
+    Order.total_amount,
+    Order.discount_amount,
+    Order.promo_code,
+    User.telegram_id,
+    User.username,
+    User.first_name,
+)
+EXPORT_ITEM_COLUMNS = (
+    OrderItem.product_id,
+    OrderItem.product_name,
+    OrderItem.product_price,
+    OrderItem.quantity,
+    OrderItem.subtotal,
+)
 
 class OrderService:
     @staticmethod
@@ -25,37 +112,235 @@ class OrderService:
         return user
 
     @staticmethod
-    async def create_order(session: AsyncSession, user_id: int, data: OrderCreate):
-        order_number = f"ORD-{int(datetime.datetime.now().timestamp())}-{random.randint(1000, 9999)}"
-        
-        # Calculate total to verify (optional, simplified here)
-        
+    async def create_order(session: AsyncSession, user_id: int, data: OrderCreate, commit: bool = True):
+        # With commit=False the order is only flushed, so the caller can add
+        # related rows (e.g. outbox notifications) to the same transaction.
+        order_number = OrderService._new_order_number()
+
+        telegram_id = None
+        if data.promoCode:
+            telegram_id = await session.scalar(select(User.telegram_id).where(User.id == user_id))
+        quote = await OrderService._price(session, data, telegram_id)
+
         order = Order(
             user_id=user_id,
             order_number=order_number,
-            total_amount=data.total,
-            promo_code=data.promoCode,
-            discount_amount=data.discountAmount or 0,
+            total_amount=quote.total,
+            promo_code=quote.promo.code if quote.promo else None,
+            discount_amount=quote.discount,
+            idempotency_key=data.requestId,
             status="new"
         )
         session.add(order)
         await session.flush()
+        if quote.promo:
+            PromoService.record_usage(session, quote.promo, user_id, order.id)
 
-        for item in data.items:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item.id or 0,
-                product_name=item.name,
-                product_price=item.price,
-                quantity=item.quantity,
-                subtotal=item.price * item.quantity
-            )
-            session.add(order_item)
+        items = [dict(dataclasses.asdict(item), order_id=order.id) for item in quote.items]
+        session.add_all(OrderItem(**item) for item in items)
+
+        await StatsService.record_order(session, order_day(), order.status, order.total_amount, order.discount_amount, items)
+
+        if not commit:
+            await session.flush()
+            return order
 
         await session.commit()
         await session.refresh(order)
         return order
 
+    @staticmethod
+    def _new_order_number() -> str:
+        return order_numbers.next()
+
+    @staticmethod
+    async def _price(session: AsyncSession, data: OrderCreate, telegram_id: int) -> Quote:
+        """Price the order server-side, then atomically reserve its stock and take one use of its promo code."""
+        quote = await PricingService.quote(data, telegram_id)
+        await StockService.reserve(session, quote.items)
+        if quote.promo:
+            await promo_service.redeem(session, quote.promo.code, quote.subtotal, telegram_id)
+        return quote
+
+    @staticmethod
+    async def upsert_user(session: AsyncSession, telegram_id: int, username: str, first_name: str) -> User:
+        """Insert or update a user in one INSERT ... ON CONFLICT ... RETURNING statement."""
+        stmt = upsert_insert(session, User)
+        if stmt is None:
+            # No portable upsert; fall back to select + insert/update without committing
+            user = await session.scalar(select(User).where(User.telegram_id == telegram_id))
+            if user:
+                user.username = username or user.username
+                user.first_name = first_name
+            else:
+                user = User(telegram_id=telegram_id, username=username, first_name=first_name)
+                session.add(user)
+            await session.flush()
+            return user
+
+        stmt = stmt.values(telegram_id=telegram_id, username=username, first_name=first_name)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[User.telegram_id],
+            set_={
+                # The web checkout has no username; don't wipe the one the bot saw
+                "username": func.coalesce(stmt.excluded.username, User.username),
+                "first_name": stmt.excluded.first_name,
+                "updated_at": func.now(),
+            },
+        ).returning(User)
+        result = await session.execute(stmt, execution_options={"populate_existing": True})
+        return result.scalar_one()
+
+    @staticmethod
+    async def place_order(
+        session: AsyncSession,
+        telegram_id: int,
+        username: str,
+        first_name: str,
+        data: OrderCreate,
+        commit: bool = True,
+    ):
+        """Fast checkout path: user upsert, order insert and item executemany in one transaction.
+
+        Returns (user, order, priced items). With commit=False the caller owns the commit, as in create_order.
+        """
+        user = await OrderService.upsert_user(session, telegram_id, username, first_name)
+
+        quote = await OrderService._price(session, data, telegram_id)
+
+        order = await session.scalar(
+            insert(Order).returning(Order),
+            [{
+                "user_id": user.id,
+                "order_number": OrderService._new_order_number(),
+                "total_amount": quote.total,
+                "promo_code": quote.promo.code if quote.promo else None,
+                "discount_amount": quote.discount,
+                "idempotency_key": data.requestId,
+                "status": "new",
+            }],
+        )
+        if quote.promo:
+            PromoService.record_usage(session, quote.promo, user.id, order.id)
+
+        items = [dict(dataclasses.asdict(item), order_id=order.id) for item in quote.items]
+        if items:
+            await session.execute(insert(OrderItem), items)
+
+        await StatsService.record_order(
+            session, order_day(order.created_at), order.status, order.total_amount, order.discount_amount, items
+        )
+
+        if commit:
+            await session.commit()
+        return user, order, quote.items
+
+    @staticmethod
+    async def find_by_request_id(session: AsyncSession, telegram_id: int, request_id: str) -> Optional[Order]:
+        stmt = (
+            select(Order)
+            .join(User, User.id == Order.user_id)
+            .where(User.telegram_id == telegram_id, Order.idempotency_key == request_id)
+        )
+        return await session.scalar(stmt)
+
+    @staticmethod
+    async def submit_order(
+        telegram_id: int,
+        username: Optional[str],
+        first_name: str,
+        data: OrderCreate,
+        notify: OrderNotifier,
+    ) -> Tuple[Order, bool]:
+        """Idempotent checkout used by both the web and the bot path.
+
+        Returns (order, created). A repeated requestId returns the order the
+        first submission created, without inserting or notifying again. The
+        requestId is claimed in shared state first, so a duplicate sent to
+        another process waits for the first submission instead of racing it.
+        """
+        key = (telegram_id, data.requestId) if data.requestId else None
+        if key and (order := recent_orders.get(key)) is not None:
+            return order, False
+
+        claim = f"{telegram_id}:{data.requestId}" if key else None
+        if claim and not await shared_state.add(IDEMPOTENCY, claim, True, ttl=CLAIM_TTL):
+            order = await OrderService._wait_for_request(telegram_id, data.requestId, claim)
+            if order is not None:
+                recent_orders.put(key, order)
+                return order, False
+            # The first submission failed and let go of the claim; this one takes over
+
+        async def write(session: AsyncSession):
+            if key:
+                existing = await OrderService.find_by_request_id(session, telegram_id, data.requestId)
+                if existing is not None:
+                    return existing, False
+            user, order, items = await OrderService.place_order(session, telegram_id, username, first_name, data, commit=False)
+            notify(session, user, order, items)
+            return order, True
+
+        # Outside the write job: a first catalog load may itself need the writer
+        await product_service.ensure_fresh()
+        try:
+            order, created = await OrderService._run_checkout(write, telegram_id, data.requestId)
+        except Exception:
+            if claim:
+                # Nothing was stored; let the client's retry through
+                await shared_state.delete(IDEMPOTENCY, claim)
+            raise
+
+        if key:
+            recent_orders.put(key, order)
+        if created:
+            await OrderService.publish_change()
+        return order, created
+
+    @staticmethod
+    async def _run_checkout(write, telegram_id: int, request_id: Optional[str]) -> Tuple[Order, bool]:
+        """run_write(write), resolving the unique-index races a checkout can lose to another process."""
+        for attempt in (1, 2):
+            try:
+                return await run_write(write)
+            except IntegrityError as e:
+                error = str(e.orig)
+                if "order_number" in error and attempt == 1:
+                    # Both processes drew the same node id; move off it and write once more
+                    order_numbers.reseed()
+                    continue
+                if "promo_usage" in error:
+                    # The customer redeemed the same code in a concurrent checkout
+                    raise PromoError("Вы уже использовали этот промокод")
+                if "idempotency" not in error or request_id is None:
+                    raise
+                # A duplicate that outlived the claim (or took over an expired one) won the race to the unique index
+                async with AsyncSessionLocal() as session:
+                    order = await OrderService.find_by_request_id(session, telegram_id, request_id)
+                if order is None:
+                    raise
+                return order, False
+
+    @staticmethod
+    async def _wait_for_request(telegram_id: int, request_id: str, claim: str) -> Optional[Order]:
+        """The order of a submission that holds `claim`, once it commits; None if it let go or timed out."""
+        deadline = asyncio.get_running_loop().time() + CLAIM_TTL
+        while True:
+            async with AsyncSessionLocal() as session:
+                order = await OrderService.find_by_request_id(session, telegram_id, request_id)
+            if order is not None or asyncio.get_running_loop().time() > deadline:
+                return order
+            if await shared_state.get(IDEMPOTENCY, claim) is None:
+                return None
+            await asyncio.sleep(0.05)
+
+    @staticmethod
+    async def publish_change():
+        """Tell every process that orders were created or changed (admin views drop cached pages).
+
+        Call after the commit, so a page rendered in between can't be cached as current.
+        """
+        await shared_state.incr(ORDERS, "version")
+
     @staticmethod
     async def get_order(session: AsyncSession, order_id: int):
         stmt = select(Order).where(Order.id == order_id)
@@ -64,54 +349,179 @@ class OrderService:
     
     @staticmethod
     async def get_order_with_items(session: AsyncSession, order_id: int):
-        # Eager loading would be better but for simplicity
-        order = await OrderService.get_order(session, order_id)
+        """Load an order with its user (joined) and items (selectin): two statements total."""
+        stmt = (
+            select(Order)
+            .options(joinedload(Order.user), selectinload(Order.items))
+            .where(Order.id == order_id)
+        )
+        order = (await session.execute(stmt)).scalar_one_or_none()
         if order:
-            stmt = select(OrderItem).where(OrderItem.order_id == order.id)
-            res = await session.execute(stmt)
-            items = res.scalars().all()
-            return order, items
+            return order, order.items
         return None, []
 
     @staticmethod
-    async def update_status(session: AsyncSession, order_id: int, status: str):
+    async def update_status(session: AsyncSession, order_id: int, status: str, commit: bool = True):
+        # Callers follow the commit with publish_change()
+        # Lock the row so concurrent status changes can't double-count in the stats
+        current = (await session.execute(
+            select(Order.status, Order.created_at, Order.total_amount, Order.discount_amount)
+            .where(Order.id == order_id)
+            .with_for_update()
+        )).first()
+        if current is None:
+            return
+
         stmt = update(Order).where(Order.id == order_id).values(status=status)
         await session.execute(stmt)
-        await session.commit()
+        await StatsService.record_status_change(
+            session, order_id, order_day(current.created_at), current.status, status,
+            current.total_amount, current.discount_amount,
+        )
+        # Cancelling puts the units back on sale; reopening takes them again
+        if (current.status == "cancelled") != (status == "cancelled"):
+            await StockService.restock_orders(session, [order_id], 1 if status == "cancelled" else -1)
+        if commit:
+            await session.commit()
 
     @staticmethod
-    async def get_user_orders(session: AsyncSession, telegram_id: int, limit: int = 50):
-        stmt = select(User).where(User.telegram_id == telegram_id)
-        result = await session.execute(stmt)
-        user = result.scalar_one_or_none()
-        
-        if not user:
-            return []
-            
-        stmt = select(Order).where(Order.user_id == user.id).order_by(desc(Order.created_at)).limit(limit)
+    async def count_new_orders(session: AsyncSession, created_before: Optional[datetime.datetime] = None) -> Tuple[int, Optional[int]]:
+        """How many orders are still new (optionally created before a cutoff), and the newest one's id."""
+        stmt = select(func.count(Order.id), func.max(Order.id)).where(Order.status == "new")
+        if created_before is not None:
+            stmt = stmt.where(Order.created_at < created_before)
+        count, max_id = (await session.execute(stmt)).one()
+        return count, max_id
+
+    @staticmethod
+    async def bulk_update_status(
+        session: AsyncSession,
+        status: str,
+        order_numbers: Optional[Sequence[str]] = None,
+        created_before: Optional[datetime.datetime] = None,
+        max_id: Optional[int] = None,
+    ) -> Sequence[Row]:
+        """Move every still-new order matching the filters to `status` with one UPDATE ... RETURNING.
+
+        Returns (id, order_number, telegram_id, ...) of the orders that changed;
+        orders someone already handled no longer match and are left alone.
+        `max_id` keeps orders placed after the admin confirmed out of the batch.
+        The caller owns the commit and follows it with publish_change().
+        """
+        conditions = [Order.status == "new"]
+        if order_numbers is not None:
+            conditions.append(Order.order_number.in_(order_numbers))
+        if created_before is not None:
+            conditions.append(Order.created_at < created_before)
+        if max_id is not None:
+            conditions.append(Order.id <= max_id)
+
+        telegram_id = select(User.telegram_id).where(User.id == Order.user_id).scalar_subquery()
+        stmt = (
+            update(Order)
+            .where(*conditions)
+            .values(status=status)
+            .returning(
+                Order.id,
+                Order.order_number,
+                telegram_id.label("telegram_id"),
+                Order.created_at,
+                Order.total_amount,
+                Order.discount_amount,
+            )
+        )
+        rows = (await session.execute(stmt)).all()
+        await StatsService.record_bulk_status_change(session, "new", status, rows)
+        if status == "cancelled" and rows:
+            await StockService.restock_orders(session, [row.id for row in rows])
+        return rows
+
+    @staticmethod
+    def _before(before_id: Optional[int]):
+        """Keyset condition for (created_at, id) DESC paging, anchored on the previous page's last order.
+
+        The anchor's created_at is read in SQL rather than round-tripped through
+        Python so the comparison is stored value vs stored value.
+        """
+        anchor = select(Order.created_at).where(Order.id == before_id).scalar_subquery()
+        return or_(Order.created_at < anchor, and_(Order.created_at == anchor, Order.id < before_id))
+
+    @staticmethod
+    def _after(after_id: int):
+        """Mirror of _before: orders newer than the anchor, for paging back towards the latest."""
+        anchor = select(Order.created_at).where(Order.id == after_id).scalar_subquery()
+        return or_(Order.created_at > anchor, and_(Order.created_at == anchor, Order.id > after_id))
+
+    @staticmethod
+    async def get_user_orders(session: AsyncSession, telegram_id: int, limit: int = 50, before: Optional[int] = None):
+        stmt = (
+            select(Order)
+            .join(User, User.id == Order.user_id)
+            .where(User.telegram_id == telegram_id)
+            .order_by(desc(Order.created_at), desc(Order.id))
+            .limit(limit)
+        )
+        if before is not None:
+            stmt = stmt.where(OrderService._before(before))
         result = await session.execute(stmt)
         return result.scalars().all()
 
     @staticmethod
-    async def get_all_orders(session: AsyncSession, limit: int = 20):
-        stmt = select(Order).order_by(desc(Order.created_at)).limit(limit)
-        result = await session.execute(stmt)
-        orders = result.scalars().all()
-        # To get user info, we might need a join or eager load. 
-        # For now, we'll fetch user separately or use join in query if needed.
-        # A simple join:
-        stmt = select(Order, User).join(User).order_by(desc(Order.created_at)).limit(limit)
+    async def get_all_orders(
+        session: AsyncSession,
+        limit: int = 20,
+        before: Optional[int] = None,
+        status: Optional[str] = None,
+        after: Optional[int] = None,
+    ):
+        stmt = select(Order, User).join(User, User.id == Order.user_id)
+        if status:
+            stmt = stmt.where(Order.status == status)
+        if before is not None:
+            stmt = stmt.where(OrderService._before(before))
+        if after is not None:
+            # The `limit` orders closest to the anchor, still returned newest first
+            stmt = stmt.where(OrderService._after(after)).order_by(Order.created_at, Order.id).limit(limit)
+            return list(reversed((await session.execute(stmt)).all()))
+        stmt = stmt.order_by(desc(Order.created_at), desc(Order.id)).limit(limit)
         result = await session.execute(stmt)
         return result.all() # returns list of (Order, User) tuples
 
     @staticmethod
-    async def get_stats(session: AsyncSession):
-        # Simplified stats
-        total_orders = await session.scalar(select(func.count(Order.id)))
-        total_revenue = await session.scalar(select(func.sum(Order.total_amount)).where(Order.status != 'cancelled'))
-        
-        return {
-            "total_orders": total_orders,
-            "total_revenue": total_revenue or 0
-        }
+    async def stream_export_rows(
+        session: AsyncSession,
+        status: Optional[str] = None,
+        since: Optional[datetime.date] = None,
+        until: Optional[datetime.date] = None,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[Sequence[Row]]:
+        """Every order line with its order and customer, oldest order first, in batches.
+
+        Rows are plain EXPORT_ORDER_COLUMNS + EXPORT_ITEM_COLUMNS tuples rather than
+        entities, read `batch_size` at a time from a server-side cursor, so memory
+        stays flat however many orders there are. Orders without items still yield
+        one row with empty item columns.
+        """
+        stmt = (
+            select(*EXPORT_ORDER_COLUMNS, *EXPORT_ITEM_COLUMNS)
+            .join(User, User.id == Order.user_id)
+            .outerjoin(OrderItem, OrderItem.order_id == Order.id)
+            .order_by(Order.id, OrderItem.id)
+            .execution_options(yield_per=batch_size)
+        )
+        if status:
+            stmt = stmt.where(Order.status == status)
+        if since is not None:
+            stmt = stmt.where(Order.created_at >= datetime.datetime.combine(since, datetime.time()))
+        if until is not None:
+            # `until` is inclusive: everything before the following midnight
+            stmt = stmt.where(Order.created_at < datetime.datetime.combine(until + datetime.timedelta(days=1), datetime.time()))
+        result = await session.stream(stmt)
+        # Whole partitions, so the async hop happens once per batch rather than per row
+        async for batch in result.partitions():
+            yield batch
 
+    @staticmethod
+    async def get_stats(session: AsyncSession):
+        # Served from the materialized counters maintained by StatsService
+        return await StatsService.get_stats(session)
@@ -0,0 +1,75 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from app.schemas.order import OrderCreate
+from app.schemas.product import Product
+from app.services.product_service import product_service
+from app.services.promo_service import PromoRule, promo_service
+
+# Client and server both round to kopecks; anything beyond that is a real mismatch
+TOLERANCE = 0.01
+
+class PricingError(ValueError):
+    """Order doesn't match the current catalog; the message is shown to the customer."""
+
+@dataclass(frozen=True)
+class PricedItem:
+    # Field names match OrderItem columns
+    product_id: int
+    product_name: str
+    product_price: float
+    quantity: int
+    subtotal: float
+
+@dataclass(frozen=True)
+class Quote:
+    items: List[PricedItem]
+    subtotal: float
+    discount: float
+    total: float
+    promo: Optional[PromoRule] = None
+
+class PricingService:
+    @staticmethod
+    def price_items(data: OrderCreate, by_id: Dict[int, Product]) -> List[PricedItem]:
+        if not data.items:
+            raise PricingError("Корзина пуста")
+
+        items = []
+        for item in data.items:
+            product = by_id.get(item.id)
+            if product is None:
+                raise PricingError(f"Товар «{item.name}» больше не продаётся, обновите корзину")
+            if item.quantity < 1:
+                raise PricingError(f"Неверное количество товара «{product.name}»")
+            if abs(item.price - product.price) > TOLERANCE:
+                raise PricingError(f"Цена товара «{product.name}» изменилась, обновите корзину")
+            items.append(PricedItem(
+                product_id=product.id,
+                product_name=product.name,
+                product_price=product.price,
+                quantity=item.quantity,
+                subtotal=product.price * item.quantity,
+            ))
+        return items
+
+    @staticmethod
+    async def quote(data: OrderCreate, telegram_id: Optional[int] = None) -> Quote:
+        """Price an order from the catalog snapshot and the in-memory promo index.
+
+        Item prices, the promo discount and the total are all recomputed here;
+        the client's figures are only compared against them. No DB reads once
+        the catalog snapshot is loaded.
+        """
+        catalog = await product_service.ensure_fresh()
+        items = PricingService.price_items(data, catalog.index.by_id)
+        subtotal = sum(item.subtotal for item in items)
+
+        promo, discount = None, 0.0
+        if data.promoCode:
+            await promo_service.ensure_fresh()
+            promo, discount = promo_service.validate(data.promoCode, subtotal, telegram_id)
+
+        total = subtotal - discount
+        if abs(total - data.total) > TOLERANCE:
+            raise PricingError("Сумма заказа изменилась, обновите корзину")
+        return Quote(items=items, subtotal=subtotal, discount=discount, total=total, promo=promo)
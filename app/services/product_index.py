@@ -0,0 +1,129 @@
+import bisect
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+from app.schemas.product import Product
+
+_token_re = re.compile(r"\w+")
+
+def tokenize(text: Optional[str]) -> List[str]:
+    return _token_re.findall(text.lower()) if text else []
+
+class ProductIndex:
+    """Lookup structures over one catalog snapshot.
+
+    Built once per catalog load; queries only touch the candidate set and
+    never scan the full product list.
+    """
+
+    def __init__(self, products: List[Product]):
+        self.products = products
+        self.by_id: Dict[int, Product] = {p.id: p for p in products}
+        n = len(products)
+
+        # sort key -> positions in ascending order, and position -> rank in that order
+        self.sorted: Dict[str, List[int]] = {}
+        self.sorted_desc: Dict[str, List[int]] = {}
+        self.rank: Dict[str, List[int]] = {}
+        sort_values = {
+            "price": lambda p: (p.price, p.id),
+            "date": lambda p: (p.dateAdded or "", p.id),
+            "name": lambda p: (p.name.lower(), p.id),
+        }
+        for key, value in sort_values.items():
+            order = sorted(range(n), key=lambda i: value(products[i]))
+            ranks = [0] * n
+            for r, i in enumerate(order):
+                ranks[i] = r
+            self.sorted[key] = order
+            self.sorted_desc[key] = order[::-1]
+            self.rank[key] = ranks
+        self._prices = [products[i].price for i in self.sorted["price"]]
+
+        self.by_brand: Dict[str, Set[int]] = {}
+        postings: Dict[str, Set[int]] = {}
+        for i, p in enumerate(products):
+            self.by_brand.setdefault(p.brand or "", set()).add(i)
+            text = " ".join([p.name, p.brand or "", p.description or ""] + list(p.specs))
+            for token in tokenize(text):
+                postings.setdefault(token, set()).add(i)
+        self.postings = postings
+        self._tokens = sorted(postings)
+
+    def _match_token(self, prefix: str) -> Set[int]:
+        # Prefix match so that search-as-you-type behaves like the old substring filter
+        matched: Set[int] = set()
+        pos = bisect.bisect_left(self._tokens, prefix)
+        while pos < len(self._tokens) and self._tokens[pos].startswith(prefix):
+            matched |= self.postings[self._tokens[pos]]
+            pos += 1
+        return matched
+
+    def _match_text(self, query: str) -> Optional[Set[int]]:
+        tokens = tokenize(query)
+        if not tokens:
+            return None
+        result: Optional[Set[int]] = None
+        for token in sorted(set(tokens), key=len, reverse=True):
+            matched = self._match_token(token)
+            result = matched if result is None else result & matched
+            if not result:
+                return set()
+        return result
+
+    def _price_range(self, min_price: Optional[float], max_price: Optional[float]) -> Set[int]:
+        lo = bisect.bisect_left(self._prices, min_price) if min_price is not None else 0
+        hi = bisect.bisect_right(self._prices, max_price) if max_price is not None else len(self._prices)
+        return set(self.sorted["price"][lo:hi])
+
+    def search(
+        self,
+        q: Optional[str] = None,
+        brands: Iterable[str] = (),
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+        sort: str = "price",
+        direction: str = "asc",
+        cursor: Optional[int] = None,
+        limit: int = 20,
+    ) -> dict:
+        candidates = self._match_text(q) if q else None
+        if min_price is not None or max_price is not None:
+            in_range = self._price_range(min_price, max_price)
+            candidates = in_range if candidates is None else candidates & in_range
+
+        # Brand facets are counted before the brand filter so every chip keeps its count
+        if candidates is None:
+            facets = {brand: len(ids) for brand, ids in self.by_brand.items()}
+        else:
+            facets = dict(Counter(self.products[i].brand or "" for i in candidates))
+
+        brands = [b for b in brands if b and b != "all"]
+        if brands:
+            selected: Set[int] = set().union(*(self.by_brand.get(b, set()) for b in brands))
+            candidates = selected if candidates is None else candidates & selected
+
+        ranks = self.rank[sort]
+        desc = direction == "desc"
+        if candidates is None:
+            ordered = self.sorted_desc[sort] if desc else self.sorted[sort]
+        else:
+            ordered = sorted(candidates, key=ranks.__getitem__, reverse=desc)
+        total = len(ordered)
+
+        # Cursor is the rank of the last item of the previous page in this sort order
+        start = 0
+        if cursor is not None:
+            if desc:
+                start = bisect.bisect_right(ordered, -cursor, key=lambda i: -ranks[i])
+            else:
+                start = bisect.bisect_right(ordered, cursor, key=ranks.__getitem__)
+
+        page = ordered[start:start + limit]
+        has_more = start + limit < total
+        return {
+            "products": [self.products[i] for i in page],
+            "total": total,
+            "nextCursor": str(ranks[page[-1]]) if page and has_more else None,
+            "facets": {"brands": facets},
+        }
@@ -1,52 +1,272 @@
+import asyncio
+import hashlib
 import json
 import os
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Set
+from pydantic import TypeAdapter
+from sqlalchemy import delete, event, func, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import AsyncSessionLocal
+from app.db.models import Product as ProductRow, ProductImage, Stock
+from app.db.writer import run_write
 from app.schemas.product import Product
+from app.services.product_index import ProductIndex
+from app.services.image_service import ImagePipeline
+from app.services.shared_state import CATALOG, shared_state
+
+_products_adapter = TypeAdapter(List[Product])
+
+@dataclass(frozen=True)
+class Catalog:
+    """Immutable snapshot of the catalog, swapped in as a whole on reload."""
+    products: List[Product] = field(default_factory=list)
+    body: bytes = b"[]"
+    etag: str = '"empty"'
+    index: ProductIndex = field(default_factory=lambda: ProductIndex([]))
+    tracked: FrozenSet[int] = frozenset()  # product ids with a stock row
+
+def normalize_items(data: List[dict]) -> List[dict]:
+    """Entries of the products.json format, with ids and image lists filled in."""
+    items = []
+    for idx, item in enumerate(data):
+        item = dict(item)
+        # Ensure ID exists
+        if "id" not in item:
+            item["id"] = idx + 1
+
+        # Handle images array logic from original JS
+        images = [item.get("image")] + item.get("images", [])
+        images = [img for img in images if img]
+        # Order-preserving dedupe keeps the payload (and its ETag) stable across processes
+        item["images"] = list(dict.fromkeys(images))[:10]
+        items.append(item)
+    return items
 
 class ProductService:
-    def __init__(self, json_path: str = "public/products.json"):
+    """Catalog served from memory, read through from the products tables.
+
+    The snapshot (pre-serialized body, ETag, search index) is built on first
+    use and rebuilt only after publish_change() bumps the shared catalog
+    version, which every process watches. Until then reads cost no query.
+    On an empty database the catalog is imported from products.json once.
+    """
+
+    def __init__(self, json_path: str = "public/products.json", generate_images: bool = True):
         self.json_path = json_path
-        self._cache: List[Product] = []
-        self._last_loaded = 0
+        self.generate_images = generate_images
+        self.images = ImagePipeline(public_dir=os.path.dirname(json_path) or ".")
+        self._catalog = Catalog()
+        self._loaded = False
+        # Set when any process publishes a new catalog version
+        self._stale = False
+        self._load_lock = asyncio.Lock()
+        self._publishing: Set[asyncio.Task] = set()
+        shared_state.watch(CATALOG, "version", self._mark_stale)
+
+    def _mark_stale(self):
+        self._stale = True
+
+    @property
+    def loaded(self) -> bool:
+        """Whether a snapshot has been built from the database (ensure_fresh() keeps the old one on errors)."""
+        return self._loaded
 
-    def load_products(self) -> List[Product]:
+    async def ensure_fresh(self) -> Catalog:
+        """Load on first use and after a version change; otherwise the current snapshot."""
+        if self._loaded and not self._stale:
+            return self._catalog
+        return await self.load()
+
+    async def load(self, session: Optional[AsyncSession] = None) -> Catalog:
+        """(Re)build the snapshot; `session` reads another database, e.g. a benchmark's own."""
+        async with self._load_lock:
+            if session is None and self._loaded and not self._stale:
+                return self._catalog  # loaded while waiting for the lock
+            # Cleared before reading, so a change that lands mid-load triggers another one
+            self._stale = False
+            try:
+                if session is not None:
+                    rows = await self._read(session)
+                else:
+                    async with AsyncSessionLocal() as session:
+                        rows = await self._read(session)
+                        empty = not rows[0] and not await session.scalar(select(func.count()).select_from(ProductRow))
+                    if empty and await self._bootstrap():
+                        async with AsyncSessionLocal() as session:
+                            rows = await self._read(session)
+                # Image variants may need encoding; keep that off the event loop
+                catalog = await asyncio.to_thread(self._build_catalog, *rows)
+            except Exception as e:
+                # Keep serving the previous snapshot; retry on next call
+                print(f"Error loading products: {e}")
+                self._stale = True
+                return self._catalog
+
+            self._catalog = catalog
+            self._loaded = True
+            return catalog
+
+    def read_json(self) -> List[dict]:
+        with open(self.json_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    async def _bootstrap(self) -> bool:
+        """Import products.json into an empty database (first start after the upgrade)."""
         if not os.path.exists(self.json_path):
-            return []
-        
-        try:
-            with open(self.json_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                
-            products = []
-            for idx, item in enumerate(data):
-                # Ensure ID exists
-                if "id" not in item:
-                    item["id"] = idx + 1
-                
-                # Handle images array logic from original JS
-                images = [item.get("image")] + item.get("images", [])
-                images = [img for img in images if img]
-                item["images"] = list(set(images))[:10]
-                if not item.get("image") and images:
-                    item["image"] = images[0]
-                
-                products.append(Product(**item))
-            
-            self._cache = products
-            return products
-        except Exception as e:
-            print(f"Error loading products: {e}")
-            return []
+            return False
+        data = self.read_json()
+        counts = await run_write(lambda session: ProductService.import_items(session, data))
+        print(f"Imported {counts['added']} products from {self.json_path}")
+        return True
+
+    @staticmethod
+    async def _read(session: AsyncSession):
+        products = (await session.execute(
+            select(
+                ProductRow.id, ProductRow.name, ProductRow.brand, ProductRow.description, ProductRow.full_description,
+                ProductRow.price, ProductRow.emoji, ProductRow.specs, ProductRow.date_added,
+            )
+            .where(ProductRow.is_active.is_(True))
+            .order_by(ProductRow.position, ProductRow.id)
+        )).all()
+        images: Dict[int, List[str]] = {}
+        result = await session.execute(
+            select(ProductImage.product_id, ProductImage.url)
+            .join(ProductRow, ProductRow.id == ProductImage.product_id)
+            .where(ProductRow.is_active.is_(True))
+            .order_by(ProductImage.product_id, ProductImage.position)
+        )
+        for product_id, url in result:
+            images.setdefault(product_id, []).append(url)
+        stock = dict((await session.execute(select(Stock.product_id, Stock.quantity))).all())
+        return products, images, stock
+
+    def _build_catalog(self, rows, images: Dict[int, List[str]], stock: Dict[int, int]) -> Catalog:
+        products = []
+        for row in rows:
+            urls = images.get(row.id, [])
+            products.append(Product(
+                id=row.id,
+                name=row.name,
+                brand=row.brand,
+                description=row.description,
+                price=row.price,
+                emoji=row.emoji,
+                image=urls[0] if urls else "",
+                images=urls,
+                fullDescription=row.full_description,
+                specs=row.specs or [],
+                dateAdded=row.date_added,
+                inStock=stock.get(row.id, 1) > 0,
+                # Resized WebP/AVIF URLs; only missing or changed sources are (re)encoded
+                imageVariants={
+                    img: variants
+                    for img in urls
+                    if (variants := self.images.variants_for(img, generate=self.generate_images))
+                },
+            ))
+
+        self.images.save_manifest()
+
+        body = _products_adapter.dump_json(products)
+        etag = f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+        return Catalog(products=products, body=body, etag=etag, index=ProductIndex(products), tracked=frozenset(stock))
+
+    def get_catalog(self) -> Catalog:
+        """The current snapshot; async callers run ensure_fresh() first."""
+        return self._catalog
 
     def get_products(self) -> List[Product]:
-        # Simple caching strategy: reload if empty, otherwise serve cached
-        # In production, might want a TTL or explicit reload method
-        if not self._cache:
-            return self.load_products()
-        return self._cache
+        return self.get_catalog().products
 
-    def refresh(self):
-        return self.load_products()
+    def search(self, **query) -> dict:
+        return self.get_catalog().index.search(**query)
 
-product_service = ProductService()
+    @staticmethod
+    async def import_items(session: AsyncSession, data: List[dict], deactivate_missing: bool = True) -> Dict[str, int]:
+        """Upsert entries in the products.json format, with one statement per kind of change.
+
+        Products missing from `data` are deactivated rather than deleted, so
+        old orders and carts still resolve. An entry's optional "stock" sets
+        its stock level, and "stock": null stops tracking it. The caller owns
+        the commit and follows it with publish_change().
+        """
+        items = normalize_items(data)
+        rows = [{
+            "id": item["id"],
+            "name": item["name"],
+            "brand": item.get("brand") or "",
+            "description": item.get("description") or "",
+            "full_description": item.get("fullDescription") or "",
+            "price": item["price"],
+            "emoji": item.get("emoji") or "🛍️",
+            "specs": item.get("specs") or [],
+            "date_added": item.get("dateAdded"),
+            "position": position,
+            "is_active": True,
+        } for position, item in enumerate(items)]
+        ids = [row["id"] for row in rows]
+
+        existing = set(await session.scalars(select(ProductRow.id)))
+        added = [row for row in rows if row["id"] not in existing]
+        updated = [row for row in rows if row["id"] in existing]
+        if added:
+            await session.execute(insert(ProductRow), added)
+        if updated:
+            await session.execute(update(ProductRow), updated)
+
+        await session.execute(delete(ProductImage).where(ProductImage.product_id.in_(ids)))
+        images = [
+            {"product_id": item["id"], "position": position, "url": url}
+            for item in items
+            for position, url in enumerate(item["images"])
+        ]
+        if images:
+            await session.execute(insert(ProductImage), images)
+
+        deactivated = 0
+        if deactivate_missing:
+            result = await session.execute(
+                update(ProductRow)
+                .where(ProductRow.id.not_in(ids), ProductRow.is_active.is_(True))
+                .values(is_active=False)
+            )
+            deactivated = result.rowcount
 
+        untracked = [item["id"] for item in items if "stock" in item and item["stock"] is None]
+        levels = [{"product_id": item["id"], "quantity": int(item["stock"])} for item in items if item.get("stock") is not None]
+        if untracked:
+            await session.execute(delete(Stock).where(Stock.product_id.in_(untracked)))
+        if levels:
+            tracked = set(await session.scalars(select(Stock.product_id)))
+            new_levels = [level for level in levels if level["product_id"] not in tracked]
+            if new_levels:
+                await session.execute(insert(Stock), new_levels)
+            if len(new_levels) < len(levels):
+                await session.execute(update(Stock), [level for level in levels if level["product_id"] in tracked])
+
+        return {"added": len(added), "updated": len(updated), "deactivated": deactivated}
+
+    async def publish_change(self):
+        """Make every process (this one included) rebuild its catalog snapshot."""
+        self._stale = True
+        await shared_state.incr(CATALOG, "version")
+
+    def publish_after_commit(self, session: AsyncSession):
+        """publish_change() once `session` commits, e.g. when a checkout sold a product out."""
+        fired = False
+
+        def after_commit(sync_session):
+            nonlocal fired
+            # Also called when a SAVEPOINT is released (the write queue runs each job in one)
+            if fired or sync_session.in_nested_transaction():
+                return
+            fired = True
+            task = asyncio.get_running_loop().create_task(self.publish_change())
+            self._publishing.add(task)
+            task.add_done_callback(self._publishing.discard)
+
+        event.listen(session.sync_session, "after_commit", after_commit)
+
+product_service = ProductService()
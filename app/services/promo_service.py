@@ -0,0 +1,203 @@
+import asyncio
+import dataclasses
+import datetime
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Set, Tuple
+from sqlalchemy import event, select, update, func, or_, case
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.models import PromoCode, PromoUsage, User
+
+class PromoError(ValueError):
+    """Promo code cannot be applied; the message is shown to the customer."""
+
+@dataclass(frozen=True)
+class PromoRule:
+    id: int
+    code: str
+    discount_type: str  # percent, fixed
+    discount_value: float
+    min_order_amount: float
+    max_uses: Optional[int]
+    used_count: int
+    expires_at: Optional[datetime.datetime]
+
+    def is_expired(self) -> bool:
+        if self.expires_at is None:
+            return False
+        # create_promo.py stores naive local time; timezone-aware values come from other tools
+        now = datetime.datetime.now(self.expires_at.tzinfo) if self.expires_at.tzinfo else datetime.datetime.now()
+        return self.expires_at <= now
+
+    def discount_for(self, amount: float) -> float:
+        if self.discount_type == "percent":
+            return round(amount * self.discount_value / 100, 2)
+        return min(self.discount_value, amount)
+
+def normalize_code(code: str) -> str:
+    return (code or "").strip().upper()
+
+class PromoService:
+    """Promo validation from an in-memory index, with atomic redemption in the DB.
+
+    The index (code -> rule, promo id -> telegram ids that used it) is loaded
+    once and reloaded only when a cheap fingerprint of promo_codes changes.
+    Validation never touches the database; redemption guards max_uses with a
+    conditional UPDATE so concurrent checkouts can't oversell a code.
+    """
+
+    def __init__(self, refresh_seconds: float = 30):
+        self.refresh_seconds = refresh_seconds
+        self._rules: Optional[Dict[str, PromoRule]] = None
+        self._used_by: Dict[int, Set[int]] = {}
+        self._fingerprint: Optional[tuple] = None
+        self._checked_at = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._load_lock = asyncio.Lock()
+
+    @staticmethod
+    async def _fingerprint_of(session: AsyncSession) -> tuple:
+        row = (await session.execute(select(
+            func.count(PromoCode.id),
+            func.max(PromoCode.id),
+            func.sum(PromoCode.used_count),
+            func.sum(case((PromoCode.is_active, 1), else_=0)),
+            func.sum(PromoCode.discount_value),
+            func.max(PromoCode.updated_at),
+        ))).one()
+        return tuple(row)
+
+    async def load(self):
+        async with self._load_lock:
+            async with AsyncSessionLocal() as session:
+                fingerprint = await self._fingerprint_of(session)
+                rules = {}
+                result = await session.execute(select(
+                    PromoCode.id, PromoCode.code, PromoCode.discount_type, PromoCode.discount_value,
+                    PromoCode.min_order_amount, PromoCode.max_uses, PromoCode.used_count, PromoCode.expires_at,
+                ).where(PromoCode.is_active.is_(True)))
+                for row in result:
+                    rules[normalize_code(row.code)] = PromoRule(
+                        id=row.id,
+                        code=row.code,
+                        discount_type=row.discount_type,
+                        discount_value=row.discount_value,
+                        min_order_amount=row.min_order_amount or 0.0,
+                        max_uses=row.max_uses,
+                        used_count=row.used_count or 0,
+                        expires_at=row.expires_at,
+                    )
+
+                used_by: Dict[int, Set[int]] = {}
+                result = await session.execute(
+                    select(PromoUsage.promo_code_id, User.telegram_id).join(User, User.id == PromoUsage.user_id)
+                )
+                for promo_id, telegram_id in result:
+                    used_by.setdefault(promo_id, set()).add(telegram_id)
+
+            self._rules, self._used_by, self._fingerprint = rules, used_by, fingerprint
+            self._checked_at = time.monotonic()
+
+    async def _refresh_if_changed(self):
+        try:
+            async with AsyncSessionLocal() as session:
+                fingerprint = await self._fingerprint_of(session)
+            self._checked_at = time.monotonic()
+            if fingerprint != self._fingerprint:
+                await self.load()
+        except Exception as e:
+            print(f"Error refreshing promo codes: {e}")
+
+    async def ensure_fresh(self):
+        """Load on first use; afterwards re-check the fingerprint in the background."""
+        if self._rules is None:
+            await self.load()
+            return
+        stale = time.monotonic() - self._checked_at > self.refresh_seconds
+        if stale and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._refresh_if_changed())
+
+    def invalidate(self):
+        self._checked_at = 0.0
+
+    def validate(self, code: str, amount: float, telegram_id: Optional[int] = None) -> Tuple[PromoRule, float]:
+        rule = (self._rules or {}).get(normalize_code(code))
+        if rule is None:
+            raise PromoError("Промокод не найден")
+        if rule.is_expired():
+            raise PromoError("Срок действия промокода истёк")
+        if rule.max_uses is not None and rule.used_count >= rule.max_uses:
+            raise PromoError("Промокод больше недействителен")
+        if amount < rule.min_order_amount:
+            raise PromoError(f"Минимальная сумма заказа {rule.min_order_amount:,.0f}₽")
+        if telegram_id is not None and telegram_id in self._used_by.get(rule.id, ()):
+            raise PromoError("Вы уже использовали этот промокод")
+        return rule, rule.discount_for(amount)
+
+    async def redeem(self, session: AsyncSession, code: str, amount: float, telegram_id: int) -> Tuple[PromoRule, float]:
+        """Reserve one use of `code` in the caller's transaction.
+
+        Call record_usage() once the order row exists. Raises PromoError when
+        the code is invalid or its last use was taken by a concurrent checkout.
+        """
+        await self.ensure_fresh()
+        rule, discount = self.validate(code, amount, telegram_id)
+
+        result = await session.execute(
+            update(PromoCode)
+            .where(
+                PromoCode.id == rule.id,
+                PromoCode.is_active.is_(True),
+                or_(PromoCode.max_uses.is_(None), PromoCode.used_count < PromoCode.max_uses),
+            )
+            .values(used_count=PromoCode.used_count + 1)
+        )
+        if result.rowcount == 0:
+            self.invalidate()
+            raise PromoError("Промокод больше недействителен")
+
+        self._note_use_after_commit(session, rule, telegram_id)
+        return rule, discount
+
+    def _note_use_after_commit(self, session: AsyncSession, rule: PromoRule, telegram_id: int):
+        """Mirror a redemption in the index once `session` commits; a rollback leaves the index as it was.
+
+        This keeps the index close to the DB until the next fingerprint reload.
+        """
+        sync_session = session.sync_session
+        # The redemption is undone if its own SAVEPOINT or any enclosing transaction rolls back
+        enclosing = set()
+        transaction = sync_session.get_nested_transaction() or sync_session.get_transaction()
+        while transaction is not None:
+            enclosing.add(transaction)
+            transaction = transaction.parent
+        done = False
+
+        def after_soft_rollback(sync_session, previous_transaction):
+            nonlocal done
+            if previous_transaction in enclosing:
+                done = True
+
+        def after_commit(sync_session):
+            nonlocal done
+            # Also called when a SAVEPOINT is released (the write queue runs each job in one)
+            if done or sync_session.in_nested_transaction():
+                return
+            done = True
+            key = normalize_code(rule.code)
+            current = (self._rules or {}).get(key)
+            if current is not None and current.id == rule.id:
+                self._rules[key] = dataclasses.replace(current, used_count=current.used_count + 1)
+            self._used_by.setdefault(rule.id, set()).add(telegram_id)
+
+        event.listen(sync_session, "after_soft_rollback", after_soft_rollback)
+        event.listen(sync_session, "after_commit", after_commit)
+
+    @staticmethod
+    def record_usage(session: AsyncSession, rule: PromoRule, user_id: int, order_id: int):
+        # The unique (promo_code_id, user_id) index rejects a concurrent second use by the same customer
+        session.add(PromoUsage(promo_code_id=rule.id, user_id=user_id, order_id=order_id))
+
+promo_service = PromoService(refresh_seconds=settings.PROMO_REFRESH_SECONDS)
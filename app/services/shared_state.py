@@ -0,0 +1,406 @@
+import asyncio
+import json
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import Integer, String, and_, cast, delete, func, select
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal
+from app.db.dialect import upsert_insert
+from app.db.models import SharedStateChange, SharedStateEntry
+from app.db.writer import run_write
+
+try:
+    import redis.asyncio as redis
+except ImportError:  # only needed for STATE_BACKEND=redis
+    redis = None
+
+FSM_STATE = "fsm_state"
+FSM_DATA = "fsm_data"
+CATALOG = "catalog"
+IDEMPOTENCY = "idempotency"
+ORDERS = "orders"
+
+Key = Tuple[str, str]
+Stored = Tuple[Optional[str], Optional[float]]  # (JSON text or None, expires_at epoch seconds)
+
+def _expires_at(ttl: Optional[float]) -> Optional[float]:
+    return time.time() + ttl if ttl else None
+
+def _expired(expires_at: Optional[float]) -> bool:
+    return expires_at is not None and expires_at <= time.time()
+
+class StateBackend(ABC):
+    """JSON values under (namespace, key), plus a log of which keys changed."""
+
+    @abstractmethod
+    async def get(self, namespace: str, key: str) -> Stored: ...
+
+    @abstractmethod
+    async def set(self, namespace: str, key: str, value: str, ttl: Optional[float] = None): ...
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str): ...
+
+    @abstractmethod
+    async def add(self, namespace: str, key: str, value: str, ttl: Optional[float] = None) -> bool:
+        """Store only if the key is absent or expired; True when stored."""
+
+    @abstractmethod
+    async def incr(self, namespace: str, key: str) -> int: ...
+
+    @abstractmethod
+    async def changes_since(self, cursor: Any) -> Tuple[Any, List[Key]]:
+        """Keys written by any process after `cursor`; a None cursor returns the current position."""
+
+    async def prune(self):
+        pass
+
+    async def close(self):
+        pass
+
+class MemoryBackend(StateBackend):
+    """Single-process backend; nothing to synchronise."""
+
+    def __init__(self):
+        self._data: Dict[Key, Tuple[str, Optional[float]]] = {}
+
+    async def get(self, namespace, key):
+        value, expires_at = self._data.get((namespace, key), (None, None))
+        return (None, None) if _expired(expires_at) else (value, expires_at)
+
+    async def set(self, namespace, key, value, ttl=None):
+        self._data[(namespace, key)] = (value, _expires_at(ttl))
+
+    async def delete(self, namespace, key):
+        self._data.pop((namespace, key), None)
+
+    async def add(self, namespace, key, value, ttl=None):
+        if (await self.get(namespace, key))[0] is not None:
+            return False
+        await self.set(namespace, key, value, ttl)
+        return True
+
+    async def incr(self, namespace, key):
+        value = int(json.loads((await self.get(namespace, key))[0] or "0")) + 1
+        await self.set(namespace, key, json.dumps(value))
+        return value
+
+    async def changes_since(self, cursor):
+        return cursor or 0, []
+
+    async def prune(self):
+        for k in [k for k, (_, expires_at) in self._data.items() if _expired(expires_at)]:
+            del self._data[k]
+
+class SQLBackend(StateBackend):
+    """shared_state table plus the shared_state_changes log other processes poll.
+
+    Writes go through run_write, so on SQLite they are group-committed with
+    order writes instead of competing for the lock.
+    """
+
+    # A change id handed out to a transaction that hasn't committed yet shows up
+    # later as a lower id; wait this long before assuming it was rolled back.
+    GAP_TIMEOUT = 10
+    RETENTION = 600
+
+    def __init__(self):
+        self._gap_since: Optional[float] = None
+
+    @staticmethod
+    def _log(session, namespace: str, key: str):
+        session.add(SharedStateChange(namespace=namespace, key=key, created_at=time.time()))
+
+    @staticmethod
+    def _where(namespace: str, key: str):
+        return and_(SharedStateEntry.namespace == namespace, SharedStateEntry.key == key)
+
+    async def get(self, namespace, key):
+        async with AsyncSessionLocal() as session:
+            row = (await session.execute(
+                select(SharedStateEntry.value, SharedStateEntry.expires_at).where(self._where(namespace, key))
+            )).first()
+        if row is None or _expired(row.expires_at):
+            return None, None
+        return row.value, row.expires_at
+
+    async def set(self, namespace, key, value, ttl=None):
+        row = {"namespace": namespace, "key": key, "value": value, "expires_at": _expires_at(ttl)}
+
+        async def write(session):
+            stmt = upsert_insert(session, SharedStateEntry)
+            if stmt is None:
+                await session.merge(SharedStateEntry(**row))
+            else:
+                stmt = stmt.values(**row)
+                await session.execute(stmt.on_conflict_do_update(
+                    index_elements=[SharedStateEntry.namespace, SharedStateEntry.key],
+                    set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+                ))
+            self._log(session, namespace, key)
+
+        await run_write(write)
+
+    async def delete(self, namespace, key):
+        async def write(session):
+            await session.execute(delete(SharedStateEntry).where(self._where(namespace, key)))
+            self._log(session, namespace, key)
+
+        await run_write(write)
+
+    async def add(self, namespace, key, value, ttl=None):
+        row = {"namespace": namespace, "key": key, "value": value, "expires_at": _expires_at(ttl)}
+
+        async def write(session):
+            stmt = upsert_insert(session, SharedStateEntry)
+            if stmt is None:
+                existing = await session.get(SharedStateEntry, (namespace, key))
+                if existing is not None and not _expired(existing.expires_at):
+                    return False
+                await session.merge(SharedStateEntry(**row))
+            else:
+                stmt = stmt.values(**row)
+                # Only an expired entry may be taken over
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[SharedStateEntry.namespace, SharedStateEntry.key],
+                    set_={"value": stmt.excluded.value, "expires_at": stmt.excluded.expires_at},
+                    where=SharedStateEntry.expires_at <= time.time(),
+                ).returning(SharedStateEntry.key)
+                if (await session.execute(stmt)).first() is None:
+                    return False
+            self._log(session, namespace, key)
+            return True
+
+        return await run_write(write)
+
+    async def incr(self, namespace, key):
+        async def write(session):
+            stmt = upsert_insert(session, SharedStateEntry)
+            if stmt is None:
+                existing = await session.get(SharedStateEntry, (namespace, key))
+                value = int(json.loads(existing.value)) + 1 if existing else 1
+                await session.merge(SharedStateEntry(namespace=namespace, key=key, value=json.dumps(value)))
+            else:
+                stmt = stmt.values(namespace=namespace, key=key, value="1", expires_at=None)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[SharedStateEntry.namespace, SharedStateEntry.key],
+                    set_={"value": cast(cast(SharedStateEntry.value, Integer) + 1, String)},
+                ).returning(SharedStateEntry.value)
+                value = int((await session.execute(stmt)).scalar_one())
+            self._log(session, namespace, key)
+            return value
+
+        return await run_write(write)
+
+    async def changes_since(self, cursor):
+        async with AsyncSessionLocal() as session:
+            if cursor is None:
+                return (await session.scalar(select(func.max(SharedStateChange.id)))) or 0, []
+            rows = (await session.execute(
+                select(SharedStateChange.id, SharedStateChange.namespace, SharedStateChange.key)
+                .where(SharedStateChange.id > cursor)
+                .order_by(SharedStateChange.id)
+            )).all()
+
+        # Only advance through contiguous ids; rows past a gap are re-read (and re-evicted) next time
+        position = cursor
+        for row in rows:
+            if row.id != position + 1:
+                if self._gap_since is None:
+                    self._gap_since = time.monotonic()
+                if time.monotonic() - self._gap_since < self.GAP_TIMEOUT:
+                    break
+            position = row.id
+        if not rows or position == rows[-1].id:
+            self._gap_since = None
+        return position, [(row.namespace, row.key) for row in rows]
+
+    async def prune(self):
+        async def write(session):
+            now = time.time()
+            # The newest change is kept: tables created without AUTOINCREMENT would hand
+            # its id out again, and every cursor already past it would miss the change
+            newest = select(func.max(SharedStateChange.id)).scalar_subquery()
+            await session.execute(
+                delete(SharedStateChange)
+                .where(SharedStateChange.created_at < now - self.RETENTION, SharedStateChange.id < newest)
+            )
+            await session.execute(delete(SharedStateEntry).where(SharedStateEntry.expires_at <= now))
+
+        await run_write(write)
+
+class RedisBackend(StateBackend):
+    """Keys as Redis strings; changes are appended to a capped stream."""
+
+    STREAM = "shared_state:changes"
+    STREAM_MAXLEN = 10_000
+
+    def __init__(self, url: str):
+        if redis is None:
+            raise RuntimeError("STATE_BACKEND=redis requires the redis package")
+        self.redis = redis.from_url(url, decode_responses=True)
+
+    @staticmethod
+    def _name(namespace: str, key: str) -> str:
+        return f"state:{namespace}:{key}"
+
+    def _log(self, pipe, namespace: str, key: str):
+        pipe.xadd(self.STREAM, {"ns": namespace, "key": key}, maxlen=self.STREAM_MAXLEN, approximate=True)
+
+    async def get(self, namespace, key):
+        name = self._name(namespace, key)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            value, pttl = await pipe.get(name).pttl(name).execute()
+        return value, (time.time() + pttl / 1000 if value is not None and pttl > 0 else None)
+
+    async def set(self, namespace, key, value, ttl=None):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._name(namespace, key), value, px=int(ttl * 1000) if ttl else None)
+            self._log(pipe, namespace, key)
+            await pipe.execute()
+
+    async def delete(self, namespace, key):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(self._name(namespace, key))
+            self._log(pipe, namespace, key)
+            await pipe.execute()
+
+    async def add(self, namespace, key, value, ttl=None):
+        stored = await self.redis.set(self._name(namespace, key), value, nx=True, px=int(ttl * 1000) if ttl else None)
+        if stored:
+            await self.redis.xadd(self.STREAM, {"ns": namespace, "key": key}, maxlen=self.STREAM_MAXLEN, approximate=True)
+        return bool(stored)
+
+    async def incr(self, namespace, key):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.incr(self._name(namespace, key))
+            self._log(pipe, namespace, key)
+            value, _ = await pipe.execute()
+        return int(value)
+
+    async def changes_since(self, cursor):
+        if cursor is None:
+            last = await self.redis.xrevrange(self.STREAM, count=1)
+            return (last[0][0] if last else "0-0"), []
+        entries = await self.redis.xrange(self.STREAM, min=f"({cursor}")
+        if not entries:
+            return cursor, []
+        return entries[-1][0], [(fields["ns"], fields["key"]) for _, fields in entries]
+
+    async def close(self):
+        await self.redis.close()
+
+class SharedState:
+    """Per-process read-through cache in front of a StateBackend.
+
+    Reads are answered from memory once a key has been fetched, so hot paths
+    (e.g. the FSM state lookup aiogram does for every update) cost the same
+    as MemoryStorage. Every write is recorded in the backend's change log;
+    run() polls it every `sync_seconds` and evicts changed keys, so a write
+    made by another worker is visible here within one poll interval.
+    """
+
+    PRUNE_SECONDS = 60
+
+    def __init__(self, backend: StateBackend, sync_seconds: float = 1.0, max_entries: int = 100_000):
+        self.backend = backend
+        self.sync_seconds = sync_seconds
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[Key, Stored]" = OrderedDict()
+        self._cursor: Any = None
+        # Bumped on every eviction so a fetch that raced with one isn't cached
+        self._generation = 0
+        self._watchers: Dict[Key, List[Callable[[], None]]] = {}
+
+    async def start(self):
+        # Until the change log position is known, nothing can be invalidated, so nothing is cached
+        self._cursor, _ = await self.backend.changes_since(None)
+
+    def watch(self, namespace: str, key: str, callback: Callable[[], None]):
+        """Call `callback` whenever any process (this one included) writes (namespace, key)."""
+        self._watchers.setdefault((namespace, key), []).append(callback)
+
+    def _notify(self, k: Key):
+        for callback in self._watchers.get(k, ()):
+            callback()
+
+    def _remember(self, k: Key, stored: Stored):
+        self._cache[k] = stored
+        self._cache.move_to_end(k)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    async def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        k = (namespace, key)
+        stored = self._cache.get(k)
+        if stored is None or _expired(stored[1]):
+            generation = self._generation
+            stored = await self.backend.get(namespace, key)
+            if self._cursor is not None and generation == self._generation:
+                self._remember(k, stored)
+        # Decoded per read so callers can't mutate the cached value
+        return json.loads(stored[0]) if stored[0] is not None else default
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        text = json.dumps(value, ensure_ascii=False)
+        await self.backend.set(namespace, key, text, ttl)
+        self._remember((namespace, key), (text, _expires_at(ttl)))
+        self._notify((namespace, key))
+
+    async def delete(self, namespace: str, key: str):
+        await self.backend.delete(namespace, key)
+        self._remember((namespace, key), (None, None))
+        self._notify((namespace, key))
+
+    async def add(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        text = json.dumps(value, ensure_ascii=False)
+        added = await self.backend.add(namespace, key, text, ttl)
+        if added:
+            self._remember((namespace, key), (text, _expires_at(ttl)))
+            self._notify((namespace, key))
+        return added
+
+    async def incr(self, namespace: str, key: str) -> int:
+        value = await self.backend.incr(namespace, key)
+        self._remember((namespace, key), (json.dumps(value), None))
+        self._notify((namespace, key))
+        return value
+
+    async def sync(self):
+        self._cursor, changed = await self.backend.changes_since(self._cursor)
+        if not changed:
+            return
+        self._generation += 1
+        for k in changed:
+            self._cache.pop(k, None)
+        for k in set(changed):
+            self._notify(k)
+
+    async def run(self):
+        if self._cursor is None:
+            await self.start()
+        last_prune = time.monotonic()
+        while True:
+            await asyncio.sleep(self.sync_seconds)
+            try:
+                await self.sync()
+                if time.monotonic() - last_prune > self.PRUNE_SECONDS:
+                    last_prune = time.monotonic()
+                    await self.backend.prune()
+            except Exception as e:
+                print(f"Error syncing shared state: {e}")
+
+    async def close(self):
+        await self.backend.close()
+
+def _backend_from_settings() -> StateBackend:
+    backend = settings.STATE_BACKEND.lower()
+    if backend == "sql":
+        return SQLBackend()
+    if backend == "redis":
+        return RedisBackend(settings.REDIS_URL or "redis://localhost:6379/0")
+    return MemoryBackend()
+
+shared_state = SharedState(_backend_from_settings(), sync_seconds=settings.STATE_SYNC_SECONDS)
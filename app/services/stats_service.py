@@ -0,0 +1,228 @@
+import datetime
+from typing import Dict, Iterable, Optional, Sequence
+from sqlalchemy import select, update, delete, desc, func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.dialect import upsert_insert
+from app.db.models import Order, OrderItem, StatsTotal, StatsDaily, StatsProduct
+
+def order_day(created_at: Optional[datetime.datetime] = None) -> datetime.date:
+    """UTC calendar day an order is bucketed under."""
+    if created_at is None:
+        return datetime.datetime.now(datetime.timezone.utc).date()
+    if created_at.tzinfo is not None:
+        created_at = created_at.astimezone(datetime.timezone.utc)
+    return created_at.date()
+
+class StatsService:
+    @staticmethod
+    async def _increment(session: AsyncSession, model, keys: dict, deltas: dict, extra: Optional[dict] = None):
+        """Atomically add `deltas` to the counter row identified by `keys`, creating it if needed."""
+        extra = extra or {}
+        stmt = upsert_insert(session, model)
+        if stmt is not None:
+            stmt = stmt.values(**keys, **deltas, **extra)
+            set_ = {k: getattr(model, k) + getattr(stmt.excluded, k) for k in deltas}
+            set_.update({k: getattr(stmt.excluded, k) for k in extra})
+            await session.execute(stmt.on_conflict_do_update(index_elements=list(keys), set_=set_))
+            return
+
+        result = await session.execute(
+            update(model)
+            .where(*(getattr(model, k) == v for k, v in keys.items()))
+            .values({**{k: getattr(model, k) + v for k, v in deltas.items()}, **extra})
+        )
+        if result.rowcount == 0:
+            session.add(model(**keys, **deltas, **extra))
+            await session.flush()
+
+    @staticmethod
+    async def _bump_status(session: AsyncSession, day: datetime.date, status: str, sign: int, total: float, discount: float):
+        deltas = {"orders": sign, "revenue": sign * total, "discount_total": sign * discount}
+        await StatsService._increment(session, StatsTotal, {"status": status}, deltas)
+        await StatsService._increment(session, StatsDaily, {"day": day, "status": status}, deltas)
+
+    @staticmethod
+    async def _bump_products(session: AsyncSession, items: Iterable[dict], sign: int):
+        for item in items:
+            await StatsService._increment(
+                session,
+                StatsProduct,
+                {"product_id": item["product_id"]},
+                {"units": sign * item["quantity"], "revenue": sign * item["subtotal"]},
+                extra={"product_name": item["product_name"]},
+            )
+
+    @staticmethod
+    async def record_order(session: AsyncSession, day: datetime.date, status: str, total: float, discount: float, items: Iterable[dict]):
+        """Count a newly created order. Must run in the order's transaction."""
+        await StatsService._bump_status(session, day, status, 1, total, discount or 0)
+        if status != "cancelled":
+            await StatsService._bump_products(session, items, 1)
+
+    @staticmethod
+    async def record_status_change(session: AsyncSession, order_id: int, day: datetime.date, old_status: str, new_status: str, total: float, discount: float):
+        """Move an order between status buckets. Must run in the status update's transaction."""
+        if old_status == new_status:
+            return
+        await StatsService._bump_status(session, day, old_status, -1, total, discount or 0)
+        await StatsService._bump_status(session, day, new_status, 1, total, discount or 0)
+
+        # Product units only count live orders, so crossing the cancelled boundary moves them
+        if (old_status == "cancelled") != (new_status == "cancelled"):
+            result = await session.execute(
+                select(OrderItem.product_id, OrderItem.product_name, OrderItem.quantity, OrderItem.subtotal)
+                .where(OrderItem.order_id == order_id)
+            )
+            items = [row._asdict() for row in result]
+            await StatsService._bump_products(session, items, -1 if new_status == "cancelled" else 1)
+
+    @staticmethod
+    async def record_bulk_status_change(session: AsyncSession, old_status: str, new_status: str, orders: Sequence):
+        """record_status_change for many orders leaving the same status, with one upsert per touched
+        counter row instead of per order. `orders` have id, created_at, total_amount and discount_amount."""
+        if old_status == new_status or not orders:
+            return
+        per_day: Dict[datetime.date, list] = {}
+        for order in orders:
+            bucket = per_day.setdefault(order_day(order.created_at), [0, 0.0, 0.0])
+            bucket[0] += 1
+            bucket[1] += order.total_amount or 0
+            bucket[2] += order.discount_amount or 0
+
+        totals = [sum(bucket[i] for bucket in per_day.values()) for i in range(3)]
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            await StatsService._increment(
+                session, StatsTotal, {"status": status},
+                {"orders": sign * totals[0], "revenue": sign * totals[1], "discount_total": sign * totals[2]},
+            )
+            for day, (count, total, discount) in per_day.items():
+                await StatsService._increment(
+                    session, StatsDaily, {"day": day, "status": status},
+                    {"orders": sign * count, "revenue": sign * total, "discount_total": sign * discount},
+                )
+
+        if (old_status == "cancelled") != (new_status == "cancelled"):
+            products: Dict[int, dict] = {}
+            order_ids = [order.id for order in orders]
+            # Chunked to stay under the drivers' bind parameter limits
+            for start in range(0, len(order_ids), 1000):
+                result = await session.execute(
+                    select(
+                        OrderItem.product_id,
+                        func.max(OrderItem.product_name),
+                        func.sum(OrderItem.quantity),
+                        func.sum(OrderItem.subtotal),
+                    )
+                    .where(OrderItem.order_id.in_(order_ids[start:start + 1000]))
+                    .group_by(OrderItem.product_id)
+                )
+                for product_id, name, quantity, subtotal in result:
+                    item = products.setdefault(product_id, {"product_id": product_id, "product_name": name, "quantity": 0, "subtotal": 0.0})
+                    item["quantity"] += quantity
+                    item["subtotal"] += subtotal
+            await StatsService._bump_products(session, products.values(), -1 if new_status == "cancelled" else 1)
+
+    @staticmethod
+    async def rebuild(session: AsyncSession, batch_size: int = 5000) -> int:
+        """Recompute every counter from the orders table. Returns the number of orders scanned."""
+        await session.execute(delete(StatsTotal))
+        await session.execute(delete(StatsDaily))
+        await session.execute(delete(StatsProduct))
+
+        totals: Dict[str, list] = {}
+        daily: Dict[tuple, list] = {}
+        scanned = 0
+        result = await session.stream(
+            select(Order.status, Order.created_at, Order.total_amount, Order.discount_amount)
+            .execution_options(yield_per=batch_size)
+        )
+        async for status, created_at, total, discount in result:
+            scanned += 1
+            for bucket in (totals.setdefault(status, [0, 0.0, 0.0]), daily.setdefault((order_day(created_at), status), [0, 0.0, 0.0])):
+                bucket[0] += 1
+                bucket[1] += total or 0
+                bucket[2] += discount or 0
+
+        if totals:
+            await session.execute(insert(StatsTotal), [
+                {"status": status, "orders": c, "revenue": r, "discount_total": d}
+                for status, (c, r, d) in totals.items()
+            ])
+            await session.execute(insert(StatsDaily), [
+                {"day": day, "status": status, "orders": c, "revenue": r, "discount_total": d}
+                for (day, status), (c, r, d) in daily.items()
+            ])
+
+        products: Dict[int, list] = {}
+        result = await session.stream(
+            select(OrderItem.product_id, OrderItem.product_name, OrderItem.quantity, OrderItem.subtotal)
+            .join(Order, Order.id == OrderItem.order_id)
+            .where(Order.status != "cancelled")
+            .execution_options(yield_per=batch_size)
+        )
+        async for product_id, name, quantity, subtotal in result:
+            bucket = products.setdefault(product_id, [name, 0, 0.0])
+            bucket[0] = name
+            bucket[1] += quantity
+            bucket[2] += subtotal
+        if products:
+            await session.execute(insert(StatsProduct), [
+                {"product_id": pid, "product_name": name, "units": units, "revenue": revenue}
+                for pid, (name, units, revenue) in products.items()
+            ])
+
+        await session.commit()
+        return scanned
+
+    @staticmethod
+    async def get_stats(session: AsyncSession, days: int = 7, weeks: int = 4, top: int = 5) -> dict:
+        by_status = {
+            row.status: row
+            for row in (await session.execute(select(StatsTotal))).scalars()
+        }
+
+        today = order_day()
+        since = today - datetime.timedelta(days=max(days, weeks * 7) - 1)
+        result = await session.execute(
+            select(StatsDaily.day, StatsDaily.orders, StatsDaily.revenue)
+            .where(StatsDaily.day >= since, StatsDaily.status != "cancelled")
+        )
+        per_day: Dict[datetime.date, list] = {}
+        for day, orders, revenue in result:
+            bucket = per_day.setdefault(day, [0, 0.0])
+            bucket[0] += orders
+            bucket[1] += revenue
+
+        daily = []
+        for offset in range(days):
+            day = today - datetime.timedelta(days=offset)
+            orders, revenue = per_day.get(day, (0, 0.0))
+            daily.append({"day": day, "orders": orders, "revenue": revenue})
+
+        weekly = []
+        for week in range(weeks):
+            orders, revenue = 0, 0.0
+            for offset in range(week * 7, week * 7 + 7):
+                o, r = per_day.get(today - datetime.timedelta(days=offset), (0, 0.0))
+                orders += o
+                revenue += r
+            weekly.append({"start": today - datetime.timedelta(days=week * 7 + 6), "orders": orders, "revenue": revenue})
+
+        result = await session.execute(
+            select(StatsProduct.product_name, StatsProduct.units, StatsProduct.revenue)
+            .where(StatsProduct.units > 0)
+            .order_by(desc(StatsProduct.units))
+            .limit(top)
+        )
+        top_products = [row._asdict() for row in result]
+
+        live = [row for status, row in by_status.items() if status != "cancelled"]
+        return {
+            "total_orders": sum(row.orders for row in by_status.values()),
+            "total_revenue": sum(row.revenue for row in live),
+            "total_discount": sum(row.discount_total for row in live),
+            "by_status": {status: row.orders for status, row in by_status.items() if row.orders},
+            "daily": daily,
+            "weekly": weekly,
+            "top_products": top_products,
+        }
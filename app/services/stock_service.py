@@ -0,0 +1,77 @@
+from typing import Dict, Iterable, Sequence
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.models import OrderItem, Stock
+from app.services.pricing_service import PricedItem, PricingError
+from app.services.product_service import product_service
+
+class StockError(PricingError):
+    """Not enough stock left for an order; the message is shown to the customer."""
+
+class StockService:
+    """Stock reservations in the order's own transaction.
+
+    Every decrement is conditional on enough units being left, so concurrent
+    checkouts can't oversell: the row lock makes the second one re-check the
+    first one's result. Products without a stock row are skipped without a query.
+    """
+
+    @staticmethod
+    async def reserve(session: AsyncSession, items: Iterable[PricedItem]):
+        """Take the ordered units, or raise StockError and leave the caller to roll back."""
+        catalog = product_service.get_catalog()
+        wanted: Dict[int, int] = {}
+        names: Dict[int, str] = {}
+        for item in items:
+            if item.product_id in catalog.tracked:
+                wanted[item.product_id] = wanted.get(item.product_id, 0) + item.quantity
+                names[item.product_id] = item.product_name
+
+        sold_out = False
+        # Same lock order in every checkout, so two multi-item orders can't deadlock
+        for product_id in sorted(wanted):
+            left = await session.scalar(
+                update(Stock)
+                .where(Stock.product_id == product_id, Stock.quantity >= wanted[product_id])
+                .values(quantity=Stock.quantity - wanted[product_id])
+                .returning(Stock.quantity)
+            )
+            if left is None:
+                raise StockError(f"Товара «{names[product_id]}» не хватает на складе, обновите корзину")
+            sold_out |= left <= 0
+
+        if sold_out:
+            # Snapshots show the product as out of stock once the order commits
+            product_service.publish_after_commit(session)
+
+    @staticmethod
+    async def restock_orders(session: AsyncSession, order_ids: Sequence[int], sign: int = 1):
+        """Put the orders' units back (sign=1, on cancellation) or take them again (sign=-1).
+
+        One UPDATE per chunk of orders, none while no product is tracked.
+        Taking units again is unconditional, as the admin has already decided;
+        the level can go negative (oversold).
+        """
+        catalog = product_service.get_catalog()
+        if not catalog.tracked:
+            return
+        in_stock = {product.id: product.inStock for product in catalog.products}
+        flipped = False
+        # Chunked to stay under the drivers' bind parameter limits
+        for start in range(0, len(order_ids), 1000):
+            chunk = order_ids[start:start + 1000]
+            units = (
+                select(func.sum(OrderItem.quantity))
+                .where(OrderItem.order_id.in_(chunk), OrderItem.product_id == Stock.product_id)
+                .scalar_subquery()
+            )
+            result = await session.execute(
+                update(Stock)
+                .where(Stock.product_id.in_(select(OrderItem.product_id).where(OrderItem.order_id.in_(chunk))))
+                .values(quantity=Stock.quantity + sign * units)
+                .returning(Stock.product_id, Stock.quantity)
+            )
+            flipped |= any(in_stock.get(product_id, True) != (quantity > 0) for product_id, quantity in result)
+
+        if flipped:
+            product_service.publish_after_commit(session)
@@ -0,0 +1,160 @@
+"""Baseline schema
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+
+Databases created before migrations existed (by create_all at startup) have
+no alembic_version table, so this revision also adopts them: it creates only
+the tables, columns and indexes they are missing.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Frozen copy of the models as of this revision; later revisions change the schema with op.*
+metadata = sa.MetaData()
+
+sa.Table(
+    "users", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("telegram_id", sa.Integer, unique=True, nullable=False, index=True),
+    sa.Column("username", sa.String, nullable=True),
+    sa.Column("first_name", sa.String, nullable=True),
+    sa.Column("last_name", sa.String, nullable=True),
+    sa.Column("phone_number", sa.String, nullable=True),
+    sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+)
+
+sa.Table(
+    "orders", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+    sa.Column("order_number", sa.String, unique=True, nullable=False),
+    sa.Column("status", sa.String, index=True),
+    sa.Column("total_amount", sa.Float, nullable=False),
+    sa.Column("promo_code", sa.String, nullable=True),
+    sa.Column("discount_amount", sa.Float),
+    sa.Column("notes", sa.Text, nullable=True),
+    sa.Column("idempotency_key", sa.String, nullable=True),
+    sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    sa.Index("ix_orders_user_created", "user_id", "created_at"),
+    sa.Index("ix_orders_status_created", "status", "created_at"),
+    sa.Index("ux_orders_user_idempotency", "user_id", "idempotency_key", unique=True),
+)
+
+sa.Table(
+    "order_items", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("order_id", sa.Integer, sa.ForeignKey("orders.id"), nullable=False, index=True),
+    sa.Column("product_id", sa.Integer, nullable=False),
+    sa.Column("product_name", sa.String, nullable=False),
+    sa.Column("product_price", sa.Float, nullable=False),
+    sa.Column("quantity", sa.Integer, nullable=False),
+    sa.Column("subtotal", sa.Float, nullable=False),
+)
+
+sa.Table(
+    "promo_codes", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("code", sa.String, unique=True, nullable=False),
+    sa.Column("discount_type", sa.String, nullable=False),
+    sa.Column("discount_value", sa.Float, nullable=False),
+    sa.Column("min_order_amount", sa.Float),
+    sa.Column("max_uses", sa.Integer, nullable=True),
+    sa.Column("used_count", sa.Integer),
+    sa.Column("expires_at", sa.DateTime(timezone=True), nullable=True),
+    sa.Column("is_active", sa.Boolean),
+    sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+)
+
+sa.Table(
+    "promo_usage", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("promo_code_id", sa.Integer, sa.ForeignKey("promo_codes.id"), nullable=False),
+    sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+    sa.Column("order_id", sa.Integer, sa.ForeignKey("orders.id"), nullable=False),
+    sa.Column("used_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    sa.Index("ux_promo_usage_code_user", "promo_code_id", "user_id", unique=True),
+)
+
+sa.Table(
+    "notification_outbox", metadata,
+    sa.Column("id", sa.Integer, primary_key=True, index=True),
+    sa.Column("chat_id", sa.String, nullable=False),
+    sa.Column("text", sa.Text, nullable=False),
+    sa.Column("parse_mode", sa.String, nullable=True),
+    sa.Column("reply_markup", sa.Text, nullable=True),
+    sa.Column("status", sa.String, nullable=False),
+    sa.Column("attempts", sa.Integer, nullable=False),
+    sa.Column("next_attempt_at", sa.DateTime(timezone=True), nullable=False),
+    sa.Column("last_error", sa.Text, nullable=True),
+    sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    sa.Column("sent_at", sa.DateTime(timezone=True), nullable=True),
+    sa.Index("ix_notification_outbox_due", "status", "next_attempt_at"),
+)
+
+sa.Table(
+    "stats_totals", metadata,
+    sa.Column("status", sa.String, primary_key=True),
+    sa.Column("orders", sa.Integer, nullable=False),
+    sa.Column("revenue", sa.Float, nullable=False),
+    sa.Column("discount_total", sa.Float, nullable=False),
+)
+
+sa.Table(
+    "stats_daily", metadata,
+    sa.Column("day", sa.Date, primary_key=True),
+    sa.Column("status", sa.String, primary_key=True),
+    sa.Column("orders", sa.Integer, nullable=False),
+    sa.Column("revenue", sa.Float, nullable=False),
+    sa.Column("discount_total", sa.Float, nullable=False),
+)
+
+sa.Table(
+    "stats_products", metadata,
+    sa.Column("product_id", sa.Integer, primary_key=True),
+    sa.Column("product_name", sa.String, nullable=False),
+    sa.Column("units", sa.Integer, nullable=False),
+    sa.Column("revenue", sa.Float, nullable=False),
+)
+
+sa.Table(
+    "shared_state", metadata,
+    sa.Column("namespace", sa.String, primary_key=True),
+    sa.Column("key", sa.String, primary_key=True),
+    sa.Column("value", sa.Text, nullable=False),
+    sa.Column("expires_at", sa.Float, nullable=True),
+)
+
+sa.Table(
+    "shared_state_changes", metadata,
+    sa.Column("id", sa.Integer, primary_key=True),
+    sa.Column("namespace", sa.String, nullable=False),
+    sa.Column("key", sa.String, nullable=False),
+    sa.Column("created_at", sa.Float, nullable=False),
+)
+
+def upgrade():
+    bind = op.get_bind()
+    metadata.create_all(bind, checkfirst=True)
+
+    # Tables that already existed may predate some columns and indexes
+    inspector = sa.inspect(bind)
+    for table in metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            # Only nullable columns can be added to a populated table without a default
+            if column.name not in existing and column.nullable:
+                op.add_column(table.name, sa.Column(column.name, column.type, nullable=True))
+        for index in table.indexes:
+            index.create(bind, checkfirst=True)
+
+def downgrade():
+    metadata.drop_all(op.get_bind())
@@ -0,0 +1,42 @@
+"""Server-side carts and favorites
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "carts",
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("version", sa.Integer, nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_table(
+        "cart_items",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), nullable=False),
+        sa.Column("product_id", sa.Integer, nullable=False),
+        sa.Column("size", sa.String, nullable=False),
+        sa.Column("quantity", sa.Integer, nullable=False),
+    )
+    op.create_index("ux_cart_items_user_product_size", "cart_items", ["user_id", "product_id", "size"], unique=True)
+    op.create_table(
+        "favorites",
+        sa.Column("user_id", sa.Integer, sa.ForeignKey("users.id"), primary_key=True),
+        sa.Column("product_id", sa.Integer, primary_key=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+
+def downgrade():
+    op.drop_table("favorites")
+    op.drop_index("ux_cart_items_user_product_size", table_name="cart_items")
+    op.drop_table("cart_items")
+    op.drop_table("carts")
@@ -0,0 +1,46 @@
+"""Catalog and stock in the database
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.create_table(
+        "products",
+        sa.Column("id", sa.Integer, primary_key=True),
+        sa.Column("name", sa.String, nullable=False),
+        sa.Column("brand", sa.String),
+        sa.Column("description", sa.Text),
+        sa.Column("full_description", sa.Text),
+        sa.Column("price", sa.Float, nullable=False),
+        sa.Column("emoji", sa.String),
+        sa.Column("specs", sa.JSON),
+        sa.Column("date_added", sa.String),
+        sa.Column("position", sa.Integer, nullable=False),
+        sa.Column("is_active", sa.Boolean, nullable=False),
+        sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+    )
+    op.create_table(
+        "product_images",
+        sa.Column("product_id", sa.Integer, sa.ForeignKey("products.id"), primary_key=True),
+        sa.Column("position", sa.Integer, primary_key=True),
+        sa.Column("url", sa.String, nullable=False),
+    )
+    op.create_table(
+        "stock",
+        sa.Column("product_id", sa.Integer, sa.ForeignKey("products.id"), primary_key=True),
+        sa.Column("quantity", sa.Integer, nullable=False),
+    )
+
+def downgrade():
+    op.drop_table("stock")
+    op.drop_table("product_images")
+    op.drop_table("products")
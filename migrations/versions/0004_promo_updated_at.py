@@ -0,0 +1,23 @@
+"""Track promo code edits
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # SQLite can't ADD COLUMN with a CURRENT_TIMESTAMP default, so rebuild the table there
+    recreate = "always" if op.get_bind().dialect.name == "sqlite" else "auto"
+    with op.batch_alter_table("promo_codes", recreate=recreate) as batch_op:
+        batch_op.add_column(sa.Column("updated_at", sa.DateTime(timezone=True), server_default=sa.func.now()))
+
+def downgrade():
+    with op.batch_alter_table("promo_codes") as batch_op:
+        batch_op.drop_column("updated_at")
@@ -0,0 +1,28 @@
+"""Never reuse shared-state change ids on SQLite
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    # Readers poll with `id > cursor`; without AUTOINCREMENT SQLite hands out
+    # ids again once the newest rows are pruned. Other databases never reuse them.
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table(
+        "shared_state_changes", recreate="always", table_kwargs={"sqlite_autoincrement": True}
+    ):
+        pass
+
+def downgrade():
+    if op.get_bind().dialect.name != "sqlite":
+        return
+    with op.batch_alter_table("shared_state_changes", recreate="always"):
+        pass
@@ -20,7 +20,8 @@ const state = {
     currentBrand: 'all',
     currentSort: 'price',
     sortDirection: 'asc',
-    searchQuery: ''
+    searchQuery: '',
+    promo: null
 };
 
 const modalState = {
@@ -37,14 +38,61 @@ const $ = (sel) => document.querySelector(sel);
 const $$ = (sel) => document.querySelectorAll(sel);
 const formatPrice = (p) => new Intl.NumberFormat('ru-RU', { style: 'currency', currency: 'RUB', minimumFractionDigits: 0 }).format(p);
 const haptic = (type = 'light') => tg.HapticFeedback?.impactOccurred(type);
-const saveCart = () => localStorage.setItem('cart', JSON.stringify(state.cart));
+// Идентификатор попытки оформления: повтор того же запроса не создаст второй заказ
+let checkoutId = null;
+const newRequestId = () => crypto.randomUUID?.() || `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+const saveCart = () => {
+    checkoutId = null;
+    localStorage.setItem('cart', JSON.stringify(state.cart));
+};
 const saveFavorites = () => localStorage.setItem('favorites', JSON.stringify(state.favorites));
 
+// Запросы от имени пользователя: initData проверяется сервером один раз и
+// обменивается на короткий токен сессии, который уходит с остальными запросами
+const session = { token: null, expiresAt: 0, pending: null };
+
+function sessionToken(refresh = false) {
+    if (!tg.initData) return Promise.resolve(null);
+    if (!refresh && session.token && Date.now() < session.expiresAt) return Promise.resolve(session.token);
+    session.pending ||= fetch('/api/auth/session', { method: 'POST', headers: { Authorization: `tma ${tg.initData}` } })
+        .then(res => res.ok ? res.json() : null)
+        .then(data => {
+            session.token = data?.token || null;
+            // Обновляем за минуту до истечения
+            session.expiresAt = Date.now() + ((data?.expiresIn || 0) - 60) * 1000;
+            return session.token;
+        })
+        .catch(() => null)
+        .finally(() => { session.pending = null; });
+    return session.pending;
+}
+
+async function apiFetch(url, options = {}) {
+    const send = async (refresh) => {
+        const token = await sessionToken(refresh);
+        const headers = token ? { ...options.headers, Authorization: `Bearer ${token}` } : options.headers;
+        return fetch(url, { ...options, headers });
+    };
+    const res = await send(false);
+    // Токен истёк или сервер сменил ключ: получить новый и повторить один раз
+    return res.status === 401 && tg.initData ? send(true) : res;
+}
+
+// Уникальные изображения товара (image обычно повторяется в images)
+const productImages = (p) => [...new Set([p.image, ...(p.images || [])].filter(Boolean))];
+
+// <picture> с AVIF/WebP нужного размера (thumb/card/full), исходник — запасной вариант
+function pictureHtml(p, img, variant, attrs = '') {
+    const v = p.imageVariants?.[img]?.[variant] || {};
+    const sources = ['avif', 'webp'].filter(f => v[f]).map(f => `<source type="image/${f}" srcset="${v[f]}">`).join('');
+    return `<picture>${sources}<img src="${img}" alt="${p.name}" decoding="async" ${attrs}></picture>`;
+}
+
 // === ЗАГРУЗКА ДАННЫХ ===
 
 async function loadProducts() {
     try {
-        const res = await fetch('/api/products?refresh=true');
+        const res = await fetch('/api/products');
         if (!res.ok) throw new Error();
         state.products = await res.json();
     } catch {
@@ -128,7 +176,7 @@ function renderProducts() {
     
     empty.classList.remove('active');
     grid.innerHTML = filtered.map(p => {
-        const images = [p.image, ...(p.images || [])].filter(Boolean);
+        const images = productImages(p);
         const hasMultiple = images.length > 1;
         
         return `
@@ -141,7 +189,7 @@ function renderProducts() {
                             <div class="product-image-slides">
                                 ${images.map((img, i) => `
                                     <div class="product-image-slide ${i === 0 ? 'active' : ''}" style="transform: translateX(${i * 100}%)">
-                                        <img src="${img}" alt="${p.name}" onerror="this.parentElement.innerHTML='<div class=product-emoji>${p.emoji || '🛍️'}</div>'">
+                                        ${pictureHtml(p, img, 'card', `loading="lazy" onerror="this.closest('.product-image-slide').innerHTML='<div class=product-emoji>${p.emoji || '🛍️'}</div>'"`)}
                                     </div>
                                 `).join('')}
                             </div>
@@ -151,7 +199,7 @@ function renderProducts() {
                     </div>
                 <div class="product-info">
                     <div class="product-name">${p.name}</div>
-                    <div class="product-price">${formatPrice(p.price)}</div>
+                    <div class="product-price">${formatPrice(p.price)}${p.inStock === false ? ' • нет в наличии' : ''}</div>
                 </div>
             </div>
         `;
@@ -176,7 +224,7 @@ function renderFavorites() {
         <div class="product-card" onclick="showProduct(${p.id})">
                 <div class="product-image">
                 <button class="favorite-btn active" onclick="event.stopPropagation(); toggleFavorite(${p.id})">♡</button>
-                ${p.image ? `<img src="${p.image}" alt="${p.name}">` : `<div class="product-emoji">${p.emoji || '🛍️'}</div>`}
+                ${p.image ? pictureHtml(p, p.image, 'card', 'loading="lazy"') : `<div class="product-emoji">${p.emoji || '🛍️'}</div>`}
                 </div>
                 <div class="product-info">
                 <div class="product-name">${p.name}</div>
@@ -208,7 +256,7 @@ function renderCart() {
         const p = state.products.find(x => x.id === item.id) || item;
         return `
             <div class="cart-item">
-                <div class="cart-item-image">${p.image ? `<img src="${p.image}">` : p.emoji || '🛍️'}</div>
+                <div class="cart-item-image">${p.image ? pictureHtml(p, p.image, 'thumb', 'loading="lazy"') : p.emoji || '🛍️'}</div>
                 <div class="cart-item-info">
                     <div class="cart-item-name">${p.name}${item.size ? ` • ${item.size}` : ''}</div>
                     <div class="cart-item-desc">${p.description || ''}</div>
@@ -226,19 +274,51 @@ function renderCart() {
     }).join('');
     
     const count = state.cart.reduce((s, i) => s + i.quantity, 0);
-    const total = state.cart.reduce((s, i) => s + (state.products.find(p => p.id === i.id)?.price || i.price) * i.quantity, 0);
+    const subtotal = cartSubtotal();
+    const discount = state.promo?.discountAmount || 0;
+    const total = subtotal - discount;
     
     $('#cartItemCount').textContent = count;
-    $('#cartSubtotal').textContent = formatPrice(total);
+    $('#cartSubtotal').textContent = formatPrice(subtotal);
+    $('#cartDiscountRow').style.display = discount ? '' : 'none';
+    $('#cartDiscount').textContent = `−${formatPrice(discount)}`;
     $('#cartTotal').textContent = formatPrice(total);
     $('#checkoutPrice').textContent = formatPrice(total);
 }
 
+const unitPrice = item => state.products.find(p => p.id === item.id)?.price || item.price;
+const cartSubtotal = () => state.cart.reduce((s, i) => s + unitPrice(i) * i.quantity, 0);
+
+// === ПРОМОКОД ===
+
+async function applyPromo(code) {
+    state.promo = null;
+    if (code) {
+        try {
+            const res = await apiFetch('/api/promo/validate', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ code, orderAmount: cartSubtotal() })
+            });
+            const result = await res.json();
+            if (result.valid) {
+                state.promo = result;
+                tg.HapticFeedback?.notificationOccurred('success');
+            } else {
+                tg.showAlert(`❌ ${result.error}`);
+            }
+        } catch {
+            tg.showAlert('❌ Не удалось проверить промокод');
+        }
+    }
+    renderCart();
+}
+
 // === КОРЗИНА И ИЗБРАННОЕ ===
 
 function addToCart(id, size = null) {
     const p = state.products.find(x => x.id === id);
-    if (!p) return;
+    if (!p || p.inStock === false) return;
     
     const key = size ? `${id}_${size}` : id;
     const existing = state.cart.find(i => (i.size ? `${i.id}_${i.size}` : i.id) === key);
@@ -249,16 +329,21 @@ function addToCart(id, size = null) {
         state.cart.push({ id, quantity: 1, size, ...p });
     }
     
+    queueCartOp({ op: 'qty', id, size, quantity: (existing?.quantity || 1) });
     saveCart();
+    if (state.promo) applyPromo(state.promo.code);
     updateUI();
     haptic();
 }
 
 function changeQty(index, delta) {
     if (index < 0 || index >= state.cart.length) return;
-    state.cart[index].quantity += delta;
-    if (state.cart[index].quantity <= 0) state.cart.splice(index, 1);
+    const item = state.cart[index];
+    item.quantity += delta;
+    if (item.quantity <= 0) state.cart.splice(index, 1);
+    queueCartOp({ op: 'qty', id: item.id, size: item.size, quantity: Math.max(item.quantity, 0) });
     saveCart();
+    if (state.promo) applyPromo(state.promo.code);
         renderCart();
     updateUI();
 }
@@ -266,6 +351,7 @@ function changeQty(index, delta) {
 function toggleFavorite(id) {
     const idx = state.favorites.indexOf(id);
     idx > -1 ? state.favorites.splice(idx, 1) : state.favorites.push(id);
+    queueCartOp({ op: idx > -1 ? 'unfavorite' : 'favorite', id });
     saveFavorites();
     renderProducts();
     renderFavorites();
@@ -273,6 +359,128 @@ function toggleFavorite(id) {
     haptic();
 }
 
+// === СИНХРОНИЗАЦИЯ КОРЗИНЫ ===
+// Корзина и избранное хранятся на сервере. Изменения копятся в очереди операций
+// и уходят пачкой; version показывает, меняли ли их с другого устройства.
+
+const userId = tg.initDataUnsafe?.user?.id;
+const cartSync = {
+    version: +localStorage.getItem('cartVersion') || 0,
+    ops: JSON.parse(localStorage.getItem('cartOps') || '[]'),
+    sending: [],
+    timer: null,
+    retryDelay: 1000
+};
+const lineKey = (id, size) => size ? `${id}_${size}` : `${id}`;
+const saveCartOps = () => localStorage.setItem('cartOps', JSON.stringify([...cartSync.sending, ...cartSync.ops]));
+
+function queueCartOp(op) {
+    if (!userId) return;
+    // Более поздняя операция над той же позицией заменяет предыдущую (qty абсолютное)
+    const key = {
+        clear: 'cart:',
+        clearFavorites: 'fav:',
+        favorite: `fav:${op.id}`,
+        unfavorite: `fav:${op.id}`
+    }[op.op] || `cart:${lineKey(op.id, op.size)}`;
+    const clears = key === 'cart:' || key === 'fav:';
+    cartSync.ops = cartSync.ops.filter(o => clears ? !o.key.startsWith(key) : o.key !== key);
+    cartSync.ops.push({ ...op, key });
+    saveCartOps();
+    scheduleCartSync(400);
+}
+
+function scheduleCartSync(delay) {
+    clearTimeout(cartSync.timer);
+    cartSync.timer = setTimeout(syncCart, delay);
+}
+
+async function syncCart(keepalive = false) {
+    if (!userId || cartSync.sending.length || !cartSync.ops.length) return;
+    cartSync.sending = cartSync.ops;
+    cartSync.ops = [];
+    try {
+        const res = await apiFetch(`/api/cart/${userId}`, {
+            method: 'POST',
+            keepalive,
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ version: cartSync.version, ops: cartSync.sending.map(({ key, ...op }) => op) })
+        });
+        if (!res.ok) throw new Error();
+        cartSync.sending = [];
+        applyServerCart(await res.json());
+        cartSync.retryDelay = 1000;
+        if (cartSync.ops.length) scheduleCartSync(400);
+    } catch {
+        // Вернуть неотправленное в начало очереди и повторить позже
+        cartSync.ops = [...cartSync.sending, ...cartSync.ops];
+        cartSync.sending = [];
+        scheduleCartSync(cartSync.retryDelay);
+        cartSync.retryDelay = Math.min(cartSync.retryDelay * 2, 30000);
+    }
+    saveCartOps();
+}
+
+function applyLocalOp(op) {
+    const index = state.cart.findIndex(i => lineKey(i.id, i.size) === lineKey(op.id, op.size));
+    if (op.op === 'clear') state.cart = [];
+    else if (op.op === 'clearFavorites') state.favorites = [];
+    else if (op.op === 'favorite' && !state.favorites.includes(op.id)) state.favorites.push(op.id);
+    else if (op.op === 'unfavorite') state.favorites = state.favorites.filter(id => id !== op.id);
+    else if (op.op === 'qty' && op.quantity <= 0 && index > -1) state.cart.splice(index, 1);
+    else if (op.op === 'qty' && index > -1) state.cart[index].quantity = op.quantity;
+    else if (op.op === 'qty' && op.quantity > 0) {
+        const p = state.products.find(x => x.id === op.id);
+        if (p) state.cart.push({ id: op.id, quantity: op.quantity, size: op.size || null, ...p });
+    }
+}
+
+function applyServerCart(data) {
+    cartSync.version = data.version;
+    localStorage.setItem('cartVersion', data.version);
+    // Без items наша копия уже совпадает с серверной
+    if (!data.items) return;
+    state.cart = data.items.map(i => {
+        const p = state.products.find(x => x.id === i.id);
+        return p && { id: i.id, quantity: i.quantity, size: i.size || null, ...p };
+    }).filter(Boolean);
+    state.favorites = data.favorites;
+    // Изменения, ещё не дошедшие до сервера, остаются поверх его версии
+    [...cartSync.sending, ...cartSync.ops].forEach(applyLocalOp);
+    saveCart();
+    saveFavorites();
+    // Сумма могла измениться: промокод проверяется заново
+    if (state.promo) applyPromo(state.promo.code);
+    if (state.currentPage === 'cart') renderCart();
+    if (state.currentPage === 'favorites') renderFavorites();
+    renderProducts();
+    updateUI();
+}
+
+async function loadCart() {
+    if (!userId) return;
+    try {
+        const res = await apiFetch(`/api/cart/${userId}`);
+        if (!res.ok) throw new Error();
+        const data = await res.json();
+        if (!data.version && (state.cart.length || state.favorites.length)) {
+            // На сервере пусто: переносим корзину и избранное из localStorage
+            state.cart.forEach(i => queueCartOp({ op: 'qty', id: i.id, size: i.size, quantity: i.quantity }));
+            state.favorites.forEach(id => queueCartOp({ op: 'favorite', id }));
+        } else if (data.version !== cartSync.version) {
+            applyServerCart(data);
+        }
+    } catch {
+        console.warn('Не удалось загрузить корзину');
+    }
+    if (cartSync.ops.length) scheduleCartSync(0);
+}
+
+// Отправить очередь, пока Mini App сворачивают или закрывают
+document.addEventListener('visibilitychange', () => {
+    if (document.hidden && cartSync.ops.length) syncCart(true);
+});
+
 // === МОДАЛЬНОЕ ОКНО ===
 
 function showProduct(id) {
@@ -280,7 +488,7 @@ function showProduct(id) {
     if (!p) return;
     
     Object.assign(modalState, { productId: id, selectedSize: null, quantity: 1, currentImageIndex: 0 });
-    modalState.images = [p.image, ...(p.images || [])].filter(Boolean);
+    modalState.images = productImages(p);
     
     const container = $('#modalImageContainer');
     const imageEl = $('#modalImage');
@@ -293,7 +501,7 @@ function showProduct(id) {
             imageEl.style.transform = 'translateX(0)';
             imageEl.innerHTML = modalState.images.map((img, i) => `
                 <div class="modal-image-slide" style="width:${w}px;min-width:${w}px">
-                    <img src="${img}" alt="${p.name}" onerror="this.parentElement.innerHTML='<div style=font-size:8rem>${p.emoji || '🛍️'}</div>'">
+                    ${pictureHtml(p, img, 'full', `onerror="this.closest('.modal-image-slide').innerHTML='<div style=font-size:8rem>${p.emoji || '🛍️'}</div>'"`)}
                 </div>
             `).join('');
     } else {
@@ -334,6 +542,11 @@ function showProduct(id) {
         sizeSection.style.display = 'none';
     }
     
+    // Распроданные товары нельзя добавить в корзину
+    const addBtn = $('#modalAddBtn');
+    addBtn.disabled = p.inStock === false;
+    addBtn.textContent = p.inStock === false ? 'Нет в наличии' : 'Перейти в корзину';
+    
     // Информация
     $('#modalName').textContent = p.name;
     $('#modalPrice').textContent = formatPrice(p.price);
@@ -565,7 +778,7 @@ function loadProfile() {
 
 async function loadOrders(userId) {
     try {
-        const res = await fetch(`/api/orders/${userId}`);
+        const res = await apiFetch(`/api/orders/${userId}`);
         const { orders = [] } = await res.json();
         
         const list = $('#ordersList');
@@ -655,7 +868,7 @@ function initProductSwipes() {
         const p = state.products.find(x => x.id === id);
         if (!p) return;
         
-        const images = [p.image, ...(p.images || [])].filter(Boolean);
+        const images = productImages(p);
         if (images.length <= 1) return;
         
         const slides = gallery.querySelectorAll('.product-image-slide');
@@ -761,9 +974,13 @@ document.addEventListener('DOMContentLoaded', () => {
     
     initSortHandlers();
     
+    // Промокод
+    $('#promoInput').onchange = e => applyPromo(e.target.value.trim());
+    
     // Очистка
     $('#clearFavorites').onclick = () => {
         state.favorites = [];
+        queueCartOp({ op: 'clearFavorites' });
         saveFavorites();
         renderFavorites();
         updateUI();
@@ -773,10 +990,11 @@ document.addEventListener('DOMContentLoaded', () => {
         if (!state.cart.length) return;
         if (tg.showConfirm) {
             tg.showConfirm('Очистить корзину?', ok => {
-                if (ok) { state.cart = []; saveCart(); renderCart(); updateUI(); }
+                if (ok) { state.cart = []; queueCartOp({ op: 'clear' }); saveCart(); renderCart(); updateUI(); }
             });
         } else {
         state.cart = [];
+        queueCartOp({ op: 'clear' });
         saveCart();
         renderCart();
         updateUI();
@@ -813,26 +1031,44 @@ document.addEventListener('DOMContentLoaded', () => {
     
     // Оформление заказа
     $('#checkoutBtn').onclick = async () => {
-        if (!state.cart.length) return;
+        const btn = $('#checkoutBtn');
+        if (!state.cart.length || btn.disabled) return;
         
+        checkoutId ||= newRequestId();
+        const discount = state.promo?.discountAmount || 0;
         const data = {
-            items: state.cart.map(i => ({ name: i.name, price: i.price, quantity: i.quantity })),
-            total: state.cart.reduce((s, i) => s + i.price * i.quantity, 0),
-            userId: tg.initDataUnsafe?.user?.id || 'unknown',
-            userName: tg.initDataUnsafe?.user?.first_name || 'Гость',
+            items: state.cart.map(i => ({ id: i.id, name: i.name, price: unitPrice(i), quantity: i.quantity })),
+            total: cartSubtotal() - discount,
+            promoCode: state.promo?.code || null,
+            discountAmount: discount,
+            requestId: checkoutId,
             timestamp: new Date().toISOString()
         };
         
+        btn.disabled = true;
         try {
-            await fetch('/api/data', { method: 'POST', headers: { 'Content-Type': 'application/json' }, body: JSON.stringify(data) });
+            const res = await apiFetch('/api/data', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json', 'Idempotency-Key': checkoutId },
+                body: JSON.stringify(data)
+            });
+            if (!res.ok) {
+                const { detail } = await res.json().catch(() => ({}));
+                throw new Error(typeof detail === 'string' ? detail : '');
+            }
             tg.showAlert('✅ Заказ оформлен!');
             state.cart = [];
+            queueCartOp({ op: 'clear' });
+            state.promo = null;
+            $('#promoInput').value = '';
             saveCart();
             renderCart();
             updateUI();
             tg.HapticFeedback?.notificationOccurred('success');
-        } catch {
-            tg.showAlert('❌ Ошибка оформления');
+        } catch (e) {
+            tg.showAlert(`❌ ${e.message || 'Ошибка оформления'}`);
+        } finally {
+            btn.disabled = false;
         }
     };
     
@@ -864,6 +1100,6 @@ document.addEventListener('DOMContentLoaded', () => {
     };
     
     // Инициализация
-    loadProducts();
+    loadProducts().then(loadCart);
     loadProfile();
 });
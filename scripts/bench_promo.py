@@ -0,0 +1,128 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Load test for promo validation and redemption against a throwaway SQLite file:
+#
+#   python scripts/bench_promo.py --codes 100000 --lookups 200000
+#
+# Reports index load time, validation latency percentiles, and checks that
+# concurrent checkouts never redeem a limited code more than max_uses times.
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp.name, 'promo.db')}"
+
+from sqlalchemy import insert, select
+
+from app.db.database import AsyncSessionLocal, engine, init_db
+from app.db.models import PromoCode
+from app.db.writer import run_write
+from app.schemas.order import OrderCreate
+from app.services.order_service import OrderService
+from app.services.product_service import product_service
+from app.services.promo_service import PromoError, promo_service
+
+async def seed(codes: int, batch: int = 10_000):
+    async with AsyncSessionLocal() as session:
+        for start in range(0, codes, batch):
+            await session.execute(insert(PromoCode), [
+                {
+                    "code": f"BENCH{i:07d}",
+                    "discount_type": "percent" if i % 2 else "fixed",
+                    "discount_value": 10 if i % 2 else 500,
+                    "min_order_amount": (i % 5) * 1000,
+                    "max_uses": None if i % 3 else 100,
+                    "used_count": 0,
+                    "is_active": True,
+                }
+                for i in range(start, min(start + batch, codes))
+            ])
+        session.add(PromoCode(code="LIMITED", discount_type="percent", discount_value=5, min_order_amount=0, max_uses=10, used_count=0))
+        await session.commit()
+
+def bench_validate(codes: int, lookups: int):
+    samples = []
+    hits = misses = 0
+    for _ in range(lookups):
+        code = f"BENCH{random.randrange(codes):07d}" if random.random() < 0.9 else "NOPE"
+        start = time.perf_counter_ns()
+        try:
+            promo_service.validate(code, random.choice((500, 2500, 9000)), random.randrange(1, 10_000))
+            hits += 1
+        except PromoError:
+            misses += 1
+        samples.append(time.perf_counter_ns() - start)
+    samples.sort()
+    pct = lambda p: samples[min(len(samples) - 1, int(len(samples) * p))] / 1000
+    return {
+        "p50_us": pct(0.50),
+        "p99_us": pct(0.99),
+        "max_us": samples[-1] / 1000,
+        "mean_us": statistics.fmean(samples) / 1000,
+        "accepted": hits,
+        "rejected": misses,
+    }
+
+async def oversell_check(checkouts: int) -> int:
+    product = (await product_service.ensure_fresh()).products[0]
+    order = OrderCreate(
+        items=[{"id": product.id, "name": product.name, "price": product.price, "quantity": 1}],
+        total=product.price * 0.95,
+        promoCode="LIMITED",
+    )
+
+    async def checkout(i):
+        async def write(session):
+            await OrderService.place_order(session, 500_000 + i, None, "Bench", order, commit=False)
+        try:
+            await run_write(write)
+            return True
+        except PromoError:
+            return False
+
+    results = await asyncio.gather(*(checkout(i) for i in range(checkouts)))
+    async with AsyncSessionLocal() as session:
+        used = await session.scalar(select(PromoCode.used_count).where(PromoCode.code == "LIMITED"))
+    print(f"LIMITED (max_uses=10): {sum(results)} of {checkouts} concurrent checkouts accepted, used_count={used}")
+    return used
+
+async def main():
+    parser = argparse.ArgumentParser(description="Promo validation load test")
+    parser.add_argument("--codes", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=200_000)
+    parser.add_argument("--checkouts", type=int, default=50)
+    args = parser.parse_args()
+
+    await init_db()
+    start = time.perf_counter()
+    await seed(args.codes)
+    print(f"seeded {args.codes:,} codes in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    await promo_service.load()
+    print(f"index loaded in {time.perf_counter() - start:.2f}s")
+
+    r = bench_validate(args.codes, args.lookups)
+    print(
+        f"validate x{args.lookups:,}: p50 {r['p50_us']:.1f}µs  p99 {r['p99_us']:.1f}µs  "
+        f"max {r['max_us']:.1f}µs  mean {r['mean_us']:.1f}µs  ({r['accepted']:,} accepted, {r['rejected']:,} rejected)"
+    )
+
+    used = await oversell_check(args.checkouts)
+
+    await engine.dispose()
+    _tmp.cleanup()
+    ok = r["p99_us"] < 1000 and used <= 10
+    print("✅ OK" if ok else "❌ FAILED")
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    asyncio.run(main())
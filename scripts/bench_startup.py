@@ -0,0 +1,170 @@
+import argparse
+import json
+import os
+import platform
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cold-start benchmark. Each run starts a fresh interpreter, so nothing is
+# cached between runs:
+#
+#   python scripts/bench_startup.py --runs 5 --out startup.json
+#   python scripts/bench_startup.py --baseline startup.json      # exit 1 on regression
+#
+# import_main      time to `import main` (what every worker pays before serving)
+# first_byte       process spawn -> first response from GET /health
+# ready            process spawn -> GET /ready returns 200 (catalog and shell warmed)
+#
+# The bot is disabled (empty BOT_TOKEN) so runs don't depend on Telegram, and
+# the app uses a throwaway SQLite database that is migrated before the first run.
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Startup time benchmark")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for a server to become ready")
+    parser.add_argument("--top", type=int, default=10, help="slowest imports to list")
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="compare with a previous --out file")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed regression vs baseline (0.25 = 25%%)")
+    return parser.parse_args()
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def get_status(url: str) -> int:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return 0
+
+def import_time(env: dict) -> float:
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+def slowest_imports(env: dict, top: int) -> list:
+    """Packages by cumulative import time (outermost import of each), from python -X importtime."""
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    )
+    totals = {}
+    for line in out.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+ \|\s+(\d+) \|\s*(\S+)", line)
+        if match:
+            name = match.group(2).split(".")[0]
+            totals[name] = max(totals.get(name, 0), int(match.group(1)))
+    # Our own modules include everything they import; list the dependencies instead
+    for own in ("main", "app"):
+        totals.pop(own, None)
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top]
+
+def serve_once(env: dict, timeout: float) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        first_byte = ready = None
+        while time.perf_counter() - start < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode}: {server.stderr.read().decode()[-2000:]}")
+            if first_byte is None and get_status(f"{base}/health") == 200:
+                first_byte = time.perf_counter() - start
+            if first_byte is not None and get_status(f"{base}/ready") == 200:
+                ready = time.perf_counter() - start
+                break
+            time.sleep(0.005)
+        if ready is None:
+            raise RuntimeError(f"not ready after {timeout:.0f}s")
+        return {"first_byte": first_byte, "ready": ready}
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+def summarize(samples: list) -> dict:
+    ms = lambda seconds: round(seconds * 1000, 1)
+    return {"median_ms": ms(statistics.median(samples)), "min_ms": ms(min(samples)), "max_ms": ms(max(samples))}
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get("results", {}).get(name)
+        if before and current["median_ms"] > before["median_ms"] * (1 + threshold):
+            regressions.append(f"{name}: median {before['median_ms']}ms -> {current['median_ms']}ms")
+    return regressions
+
+def main():
+    args = parse_args()
+    tmp = tempfile.TemporaryDirectory()
+    env = dict(
+        os.environ,
+        BOT_TOKEN="",
+        DATABASE_URL=f"sqlite+aiosqlite:///{os.path.join(tmp.name, 'startup.db')}",
+        PYTHONDONTWRITEBYTECODE="",
+    )
+    # Migrate once up front so every run measures a warm-schema boot
+    subprocess.run(
+        [sys.executable, "-c", "import asyncio; from app.db.database import init_db; asyncio.run(init_db())"],
+        cwd=ROOT, env=env, check=True, capture_output=True,
+    )
+
+    samples = {"import_main": [], "first_byte": [], "ready": []}
+    for run in range(args.runs):
+        samples["import_main"].append(import_time(env))
+        for name, seconds in serve_once(env, args.timeout).items():
+            samples[name].append(seconds)
+        print(f"  run {run + 1}/{args.runs}: " + "  ".join(f"{name} {values[-1] * 1000:.0f}ms" for name, values in samples.items()))
+
+    results = {name: summarize(values) for name, values in samples.items()}
+    for name, r in results.items():
+        print(f"✅ {name:<12} median {r['median_ms']:>8.1f}ms  min {r['min_ms']:>8.1f}ms  max {r['max_ms']:>8.1f}ms")
+    print("slowest imports:")
+    for name, micros in slowest_imports(env, args.top):
+        print(f"  {name:<24} {micros / 1000:>8.1f}ms")
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "runs": args.runs,
+            "python": platform.python_version(),
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"💾 results saved to {args.out}")
+
+    failed = False
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"❌ regression {line}")
+        if not regressions:
+            print(f"✅ no regressions beyond {args.threshold:.0%} of {args.baseline}")
+        failed = bool(regressions)
+
+    tmp.cleanup()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
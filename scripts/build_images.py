@@ -0,0 +1,37 @@
+import sys
+import os
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.image_service import available_formats
+from app.services.product_service import ProductService, normalize_items
+
+def build_images():
+    """Pre-generate resized image variants for every image in products.json (run at deploy time).
+
+    Reads the file only and never touches the database, so it is safe in an
+    image build. Images added later through the database are encoded when
+    the catalog loads.
+    """
+    formats = available_formats()
+    if not formats:
+        print("❌ Pillow не установлен или не поддерживает WebP/AVIF")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    service = ProductService(generate_images=True)
+    items = normalize_items(service.read_json())
+    images = sum(
+        1 for item in items for url in item["images"]
+        if service.images.variants_for(url, generate=True)
+    )
+    service.images.save_manifest()
+    print(
+        f"✅ {images} изображений для {len(items)} товаров "
+        f"({', '.join(formats)}) за {time.perf_counter() - start:.2f} с → {service.images.out_dir}"
+    )
+
+if __name__ == "__main__":
+    build_images()
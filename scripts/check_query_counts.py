@@ -0,0 +1,179 @@
+import asyncio
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Pins the number of SQL statements each order read path issues, so an N+1 or a
+# dropped eager load shows up as a failure. Runs against a throwaway SQLite file:
+#
+#   python scripts/check_query_counts.py
+#
+# Exits non-zero when any path issues more statements than pinned below.
+
+_tmp = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp.name, 'queries.db')}"
+os.environ["SQLITE_WRITE_QUEUE"] = "false"
+
+from sqlalchemy import event, select, update
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal, engine, init_db
+from app.db.models import Order
+from app.schemas.order import OrderCreate
+from app.services.notification_service import RateLimiter, notification_dispatcher
+from app.services.order_service import OrderService
+from app.services.product_service import product_service
+
+PINNED = {
+    "get_user_orders_endpoint": 1,
+    "get_user_orders_endpoint(before)": 1,
+    "get_all_orders": 1,
+    "get_all_orders(status, before)": 1,
+    "get_order_with_items": 2,
+    "cmd_orders": 1,
+    # Rendered pages are cached until an order changes
+    "cmd_orders(cached)": 0,
+    "orders_page(status, older)": 1,
+    "orders_page(newer)": 1,
+    # order + items, row lock, status update, 2 x (stats_totals, stats_daily) upserts
+    "order_callback(accept)": 8,
+    # However many orders: count for the confirmation, then one UPDATE ... RETURNING
+    # and 2 x (stats_totals, stats_daily) upserts
+    "bulk(accept all, preview)": 1,
+    "bulk(accept all)": 5,
+    # + one grouped order_items select and a stats_products upsert per product
+    "bulk(reject listed)": 7,
+}
+
+statements = []
+
+@event.listens_for(engine.sync_engine, "before_cursor_execute")
+def _count(conn, cursor, statement, parameters, context, executemany):
+    if statement.strip().upper() not in ("BEGIN", "COMMIT", "ROLLBACK"):
+        statements.append(statement)
+
+class StubBot:
+    async def send_message(self, *args, **kwargs):
+        pass
+
+def stub_message():
+    async def noop(*args, **kwargs):
+        pass
+    async def answer(*args, **kwargs):
+        return message
+    message = SimpleNamespace(
+        from_user=SimpleNamespace(id=int(settings.ADMIN_ID or 1), first_name="Admin", username="admin"),
+        answer=answer,
+        edit_reply_markup=noop,
+        edit_text=noop,
+    )
+    return message
+
+async def measure(name, coro_factory):
+    statements.clear()
+    await coro_factory()
+    return name, len(statements)
+
+async def seed(customers: int = 5, orders_each: int = 30):
+    product = (await product_service.ensure_fresh()).products[0]
+    order = OrderCreate(items=[{"id": product.id, "name": product.name, "price": product.price, "quantity": 2}] * 3, total=product.price * 6)
+    async with AsyncSessionLocal() as session:
+        for i in range(orders_each):
+            for customer in range(customers):
+                await OrderService.place_order(session, 1000 + customer, None, "Customer", order, commit=False)
+        await session.commit()
+
+async def main():
+    from app.api.auth import WebAppUser
+    from app.api.routes import get_user_orders_endpoint
+    from app.bot import handlers
+
+    if not settings.ADMIN_ID:
+        settings.ADMIN_ID = "1"
+    await init_db()
+    await seed()
+
+    async with AsyncSessionLocal() as session:
+        page = await OrderService.get_user_orders(session, 1000, limit=10)
+    cursor = page[-1].id
+
+    async def user_orders(before=None):
+        async with AsyncSessionLocal() as session:
+            await get_user_orders_endpoint(1000, before=before, limit=10, db=session, user=WebAppUser(id=1000))
+
+    async def all_orders(**kwargs):
+        async with AsyncSessionLocal() as session:
+            await OrderService.get_all_orders(session, limit=20, **kwargs)
+
+    async def order_with_items():
+        async with AsyncSessionLocal() as session:
+            await OrderService.get_order_with_items(session, cursor)
+
+    async def orders_page(data):
+        message = stub_message()
+        query = SimpleNamespace(from_user=message.from_user, data=data, message=message, answer=message.answer)
+        await handlers.orders_page_callback(query)
+
+    async def callback():
+        message = stub_message()
+        query = SimpleNamespace(from_user=message.from_user, data=f"accept_{cursor}", message=message, answer=message.answer)
+        await handlers.order_callback(query, StubBot())
+
+    # Bulk actions message every customer; sends aren't what's measured, so drop the flood spacing
+    notification_dispatcher.limiter = RateLimiter(global_per_second=1e6, per_chat_interval=0)
+    previews = []
+
+    async def bulk_preview():
+        message = stub_message()
+        async def answer(text, reply_markup=None, **kwargs):
+            previews.append(reply_markup.inline_keyboard[0][0].callback_data)
+        message.answer = answer
+        await handlers.cmd_bulk(message, SimpleNamespace(command="accept", args="all"), StubBot())
+
+    async def bulk_confirm():
+        message = stub_message()
+        query = SimpleNamespace(from_user=message.from_user, data=previews[-1], message=message, answer=message.answer)
+        await handlers.bulk_callback(query, StubBot())
+
+    async def bulk_reject():
+        await handlers.cmd_bulk(stub_message(), SimpleNamespace(command="reject", args=" ".join(numbers)), StubBot())
+
+    # Set back to new after the bulk accept, so the listed reject has work to do
+    async with AsyncSessionLocal() as session:
+        numbers = list(await session.scalars(select(Order.order_number).order_by(Order.id).limit(10)))
+
+    results = [
+        await measure("get_user_orders_endpoint", user_orders),
+        await measure("get_user_orders_endpoint(before)", lambda: user_orders(cursor)),
+        await measure("get_all_orders", all_orders),
+        await measure("get_all_orders(status, before)", lambda: all_orders(status="new", before=cursor)),
+        await measure("get_order_with_items", order_with_items),
+        await measure("cmd_orders", lambda: handlers.cmd_orders(stub_message())),
+        await measure("cmd_orders(cached)", lambda: handlers.cmd_orders(stub_message())),
+        await measure("orders_page(status, older)", lambda: orders_page(f"orders:new:b{cursor}")),
+        await measure("orders_page(newer)", lambda: orders_page(f"orders:all:a{cursor}")),
+        await measure("order_callback(accept)", callback),
+        await measure("bulk(accept all, preview)", bulk_preview),
+    ]
+    results.append(await measure("bulk(accept all)", bulk_confirm))
+    async with AsyncSessionLocal() as session:
+        await session.execute(update(Order).where(Order.order_number.in_(numbers)).values(status="new"))
+        await session.commit()
+    results.append(await measure("bulk(reject listed)", bulk_reject))
+
+    failed = False
+    for name, count in results:
+        ok = count <= PINNED[name]
+        failed |= not ok
+        print(f"{'✅' if ok else '❌'} {name:<36} {count} statements (pinned {PINNED[name]})")
+
+    await engine.dispose()
+    _tmp.cleanup()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,18 +1,33 @@
+import argparse
 import asyncio
+import csv
+import secrets
 import sys
 import os
+import time
 from datetime import datetime, timedelta
 
 # Add project root to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from app.db.database import AsyncSessionLocal
+from app.db.dialect import upsert_insert
 from app.db.models import PromoCode
+from app.services.promo_service import normalize_code
+
+# Unambiguous characters for generated codes (no 0/O, 1/I/L)
+ALPHABET = "23456789ABCDEFGHJKMNPQRSTUVWXYZ"
+PLACEHOLDER = "X"
 
 async def create_promo():
+    if len(sys.argv) > 1 and sys.argv[1] == "bulk":
+        await create_bulk(sys.argv[2:])
+        return
+
     if len(sys.argv) < 5:
         print("Использование: python scripts/create_promo.py <CODE> <type> <value> <min_amount> [max_uses] [expires_days]")
         print("Пример: python scripts/create_promo.py SUMMER2024 percent 10 1000")
+        print("Массовое создание: python scripts/create_promo.py bulk --help")
         return
 
     code = sys.argv[1].upper()
@@ -48,6 +63,126 @@ async def create_promo():
         except Exception as e:
             print(f"❌ Ошибка создания: {e}")
 
+def parse_bulk_args(argv):
+    parser = argparse.ArgumentParser(
+        prog="python scripts/create_promo.py bulk",
+        description="Массовое создание промокодов",
+        epilog="Пример: python scripts/create_promo.py bulk percent 10 1000 --count 50000 --pattern SUMMER-XXXXXXXX",
+    )
+    parser.add_argument("type", choices=["percent", "fixed"])
+    parser.add_argument("value", type=float)
+    parser.add_argument("min_amount", type=float)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--count", type=int, help="сколько кодов сгенерировать по шаблону")
+    source.add_argument("--csv", help="CSV с кодами: первая колонка или колонка 'code'")
+    parser.add_argument("--pattern", default="PROMO-XXXXXXXX", help=f"шаблон, каждый '{PLACEHOLDER}' заменяется случайным символом")
+    parser.add_argument("--max-uses", type=int, default=1, help="лимит использований каждого кода (0 — без лимита)")
+    parser.add_argument("--expires-days", type=int, default=None)
+    parser.add_argument("--batch", type=int, default=5000, help="строк на транзакцию")
+    parser.add_argument("--out", help="записать созданные коды в файл")
+    return parser.parse_args(argv)
+
+def check_pattern(pattern: str, count: int):
+    # Keep the space sparse so random draws rarely collide with each other or existing codes
+    if len(ALPHABET) ** pattern.count(PLACEHOLDER) < count * 4:
+        raise ValueError(f"Шаблон {pattern} слишком короткий для {count} кодов, добавьте символов '{PLACEHOLDER}'")
+
+def generate_codes(pattern: str, count: int, exclude=()) -> list:
+    """Generate `count` distinct codes from `pattern`, none of them in `exclude`."""
+    prefix, parts = pattern.split(PLACEHOLDER)[0], pattern.split(PLACEHOLDER)[1:]
+    codes = set()
+    while len(codes) < count:
+        code = prefix + "".join(secrets.choice(ALPHABET) + part for part in parts)
+        if code not in exclude:
+            codes.add(code)
+    return list(codes)
+
+def read_csv_codes(path: str) -> list:
+    with open(path, "r", encoding="utf-8-sig", newline="") as f:
+        rows = list(csv.reader(f))
+    if not rows:
+        return []
+    header = [cell.strip().lower() for cell in rows[0]]
+    column = header.index("code") if "code" in header else 0
+    if "code" in header:
+        rows = rows[1:]
+
+    codes, seen = [], set()
+    for row in rows:
+        code = normalize_code(row[column]) if len(row) > column else ""
+        if code and code not in seen:
+            seen.add(code)
+            codes.append(code)
+    return codes
+
+async def insert_codes(codes: list, template: dict, batch: int, progress_total: int) -> list:
+    """Insert codes in batched transactions; return the codes that were actually created."""
+    created = []
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        insert = upsert_insert(session, PromoCode)
+        if insert is None:
+            raise RuntimeError("Массовая загрузка поддерживается только для SQLite и PostgreSQL")
+        stmt = insert.on_conflict_do_nothing(index_elements=[PromoCode.code]).returning(PromoCode.code)
+
+        for start in range(0, len(codes), batch):
+            rows = [dict(template, code=code) for code in codes[start:start + batch]]
+            result = await session.execute(stmt, rows)
+            created.extend(result.scalars().all())
+            await session.commit()
+
+            elapsed = time.perf_counter() - started
+            print(
+                f"\r  {len(created):>8,}/{progress_total:,} создано, "
+                f"{start + len(rows) - len(created):,} пропущено, {len(created) / elapsed:,.0f} кодов/с",
+                end="", flush=True,
+            )
+    print()
+    return created
+
+async def create_bulk(argv):
+    args = parse_bulk_args(argv)
+    expires_at = datetime.now() + timedelta(days=args.expires_days) if args.expires_days else None
+    template = {
+        "discount_type": args.type,
+        "discount_value": args.value,
+        "min_order_amount": args.min_amount,
+        "max_uses": args.max_uses or None,
+        "used_count": 0,
+        "expires_at": expires_at,
+        "is_active": True,
+    }
+
+    started = time.perf_counter()
+    try:
+        if args.csv:
+            codes = read_csv_codes(args.csv)
+            print(f"📄 {len(codes):,} уникальных кодов в {args.csv}")
+            created = await insert_codes(codes, template, args.batch, len(codes))
+        else:
+            pattern = args.pattern.upper()
+            check_pattern(pattern, args.count)
+            created, attempted = [], set()
+            # Codes already in the DB are skipped by ON CONFLICT; generate replacements until we have --count
+            while len(created) < args.count:
+                codes = generate_codes(pattern, args.count - len(created), exclude=attempted)
+                attempted.update(codes)
+                fresh = await insert_codes(codes, template, args.batch, args.count - len(created))
+                if not fresh:
+                    print(f"⚠️ Шаблон {pattern} почти исчерпан, создано {len(created):,} из {args.count:,}")
+                    break
+                created += fresh
+    except (OSError, ValueError, RuntimeError) as e:
+        print(f"❌ Ошибка: {e}")
+        return
+
+    elapsed = time.perf_counter() - started
+    print(f"✅ Создано {len(created):,} промокодов за {elapsed:.2f}с ({len(created) / max(elapsed, 1e-9):,.0f} кодов/с)")
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.writelines(code + "\n" for code in created)
+        print(f"💾 Коды сохранены в {args.out}")
+
 if __name__ == "__main__":
     asyncio.run(create_promo())
-
@@ -0,0 +1,48 @@
+import argparse
+import asyncio
+import json
+import sys
+import os
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.db.database import AsyncSessionLocal, engine, init_db
+from app.services.product_service import ProductService, product_service
+
+# Loads a catalog in the products.json format into the products tables:
+#
+#   python scripts/import_products.py                  # public/products.json
+#   python scripts/import_products.py new_catalog.json --keep-missing
+#
+# Products are matched by id. An optional "stock" per entry sets the stock
+# level ("stock": null stops tracking it). Running processes pick the change
+# up through shared state; with STATE_BACKEND=memory send /reload to the bot.
+
+async def import_products():
+    parser = argparse.ArgumentParser(description="Import products.json into the database")
+    parser.add_argument("path", nargs="?", default=product_service.json_path)
+    parser.add_argument("--keep-missing", action="store_true", help="don't deactivate products absent from the file")
+    args = parser.parse_args()
+
+    with open(args.path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+
+    await init_db()
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        counts = await ProductService.import_items(session, data, deactivate_missing=not args.keep_missing)
+        await session.commit()
+    await product_service.publish_change()
+    print(
+        f"✅ Каталог загружен за {time.perf_counter() - start:.2f} с: "
+        f"новых {counts['added']}, обновлено {counts['updated']}, снято с продажи {counts['deactivated']}"
+    )
+    if settings.STATE_BACKEND == "memory":
+        print("ℹ️ STATE_BACKEND=memory: отправьте боту /reload, чтобы сервер перечитал каталог")
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(import_products())
@@ -0,0 +1,21 @@
+import asyncio
+import sys
+import os
+import time
+
+# Add project root to path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.db.database import AsyncSessionLocal, init_db
+from app.services.stats_service import StatsService
+
+async def rebuild_stats():
+    """Backfill the materialized /stats counters from the orders table."""
+    await init_db()
+    start = time.perf_counter()
+    async with AsyncSessionLocal() as session:
+        scanned = await StatsService.rebuild(session)
+    print(f"✅ Статистика пересчитана: {scanned} заказов за {time.perf_counter() - start:.2f} с")
+
+if __name__ == "__main__":
+    asyncio.run(rebuild_stats())